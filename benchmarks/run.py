@@ -0,0 +1,280 @@
+"""Encode and publish throughput benchmarks.
+
+Generates synthetic breakdowns (CSV plus a matching ffmpeg ``testsrc`` video) for
+a grid of shot counts, shot lengths and resolutions, then times each stage:
+CSV processing, frame indexing, encoding in every video mode, and publishing to
+a local Kitsu stand-in with simulated latency and throttling.
+
+Every result is appended to a JSON-lines history file. A result slower than the
+median of the previous runs of the same scenario on the same host by more than
+the stage threshold (benchmarks/thresholds.json) is reported as a regression
+and makes the script exit with status 1.
+
+    python benchmarks/run.py --quick
+    python benchmarks/run.py --shots 10,100,500 --resolutions 1920x1080 --modes parallel,smart-cut
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+from kitsu_ingest.options import MODES  # noqa: E402
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_HISTORY = os.path.join(BENCH_DIR, 'history.jsonl')
+DEFAULT_THRESHOLDS = os.path.join(BENCH_DIR, 'thresholds.json')
+
+SEQUENCE = 'SQ01'
+FIRST_FRAME = 1001
+GOP_SECONDS = 2
+
+
+def _ints(value):
+    return [int(item) for item in value.split(',')]
+
+
+def _resolutions(value):
+    return [tuple(int(side) for side in item.split('x')) for item in value.split(',')]
+
+
+def _commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def generate_breakdown(work_dir, shots, frames, fps):
+    csv_path = os.path.join(work_dir, 'breakdown.csv')
+    with open(csv_path, 'w') as f:
+        f.write('SHOT,FRAME IN,FRAME OUT,FRAME DURATION,Clip Name,FPS\n')
+        for idx in range(shots):
+            f.write(f"SHOT_{(idx + 1) * 10:04d}_BENCH,{FIRST_FRAME},{FIRST_FRAME + frames - 1},{frames},"
+                    f"clip_{idx:04d},{fps}\n")
+    return csv_path
+
+
+def generate_video(work_dir, total_frames, width, height, fps):
+    video_path = os.path.join(work_dir, 'breakdown.mp4')
+    subprocess.run([
+        'ffmpeg', '-v', 'error', '-y', '-f', 'lavfi', '-i', f'testsrc=size={width}x{height}:rate={fps}',
+        '-frames:v', str(total_frames), '-c:v', 'libx264', '-preset', 'veryfast', '-pix_fmt', 'yuv420p',
+        '-g', str(fps * GOP_SECONDS), video_path
+    ], check=True)
+    return video_path
+
+
+def timed(func, *args, **kwargs):
+    started = time.perf_counter()
+    result = func(*args, **kwargs)
+    return time.perf_counter() - started, result
+
+
+def bench_scenario(args, scenario, standin_server):
+    from kitsu_ingest.processors.csv_processor import CsvProcessor
+    from kitsu_ingest.processors.frame_index import FrameIndex
+    from kitsu_ingest.processors.video_processor import VideoProcessor
+    from kitsu_ingest.utils.validation import extract_shots
+
+    shots, frames, (width, height), fps = (scenario['shots'], scenario['frames_per_shot'],
+                                           scenario['resolution'], scenario['fps'])
+    total_frames = shots * frames
+    work_dir = tempfile.mkdtemp(prefix='kitsu_bench_', dir=args.work_dir)
+    results = []
+
+    def record(stage, seconds, **throughput):
+        results.append({'stage': stage, 'seconds': seconds, **throughput})
+        extra = ', '.join(f"{key} {value:.1f}" for key, value in throughput.items())
+        print(f"  {stage:<22} {seconds:8.3f}s  {extra}")
+
+    try:
+        csv_path = generate_breakdown(work_dir, shots, frames, fps)
+        video_path = generate_video(work_dir, total_frames, width, height, fps)
+
+        csv_processor = CsvProcessor(csv_path, SEQUENCE, output_dir=work_dir)
+        seconds, _ = timed(csv_processor.process)
+        record('csv', seconds, shots_per_s=shots / seconds)
+        shot_data = extract_shots(csv_processor.df)
+
+        seconds, index = timed(FrameIndex.build, video_path)
+        record('index', seconds, frames_per_s=total_frames / seconds)
+
+        output_dir = os.path.join(work_dir, 'out')
+        for mode in args.modes:
+            shutil.rmtree(output_dir, ignore_errors=True)
+            os.makedirs(output_dir)
+            processor = VideoProcessor(video_path, shot_data, output_dir, mode=mode, jobs=args.jobs,
+                                       cache=None, index=index)
+            seconds, exported = timed(processor.process)
+            record(f'encode:{mode}', seconds, fps=total_frames / seconds, shots_per_s=len(exported) / seconds)
+
+        if standin_server:
+            for workers in args.publish_workers:
+                seconds, stats = timed(bench_publish, standin_server, csv_processor.shot_table, output_dir,
+                                       workers, scenario)
+                upload_mb = sum(os.path.getsize(os.path.join(output_dir, f)) for f in os.listdir(output_dir)
+                                if f.endswith('.mp4')) / 1024 ** 2
+                record(f'publish:{workers}w', seconds, shots_per_s=stats['matched'] / seconds,
+                       mb_per_s=upload_mb / seconds)
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+
+def bench_publish(standin_server, shot_table, output_dir, workers, scenario):
+    from kitsu_ingest.kitsu.publisher import KitsuPublisher
+    from kitsu_ingest.utils.validation import MISMATCH_ABORT
+
+    # A fresh project per run, so earlier runs never make shots look already published
+    project_name = f"bench-{len(standin_server.standin.projects)}"
+    standin_server.standin.seed(project_name, SEQUENCE, [
+        (name, nb_frames, frame_in, frame_out, float(fps), description)
+        for name, frame_in, frame_out, nb_frames, description, fps in zip(
+            shot_table['Name'], shot_table['Frame In'], shot_table['Frame Out'], shot_table['Nb Frames'],
+            shot_table['Description'], shot_table['FPS']
+        )
+    ])
+    publisher = KitsuPublisher(project_name, SEQUENCE, workers=workers, use_cache=False,
+                               on_mismatch=MISMATCH_ABORT)
+    if not publisher.connect():
+        raise RuntimeError(f"Stand-in project {project_name} not found")
+    return publisher.publish_previews(output_dir, shot_table)
+
+
+def load_thresholds(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def threshold_for(thresholds, stage):
+    return thresholds.get(stage, thresholds.get(stage.split(':')[0], thresholds['default']))
+
+
+def scenario_key(scenario):
+    return json.dumps(scenario, sort_keys=True)
+
+
+def load_history(path):
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def check_regressions(history, records, thresholds, baseline_runs):
+    regressions = []
+    for record in records:
+        previous = [
+            entry['seconds'] for entry in history
+            if entry['host'] == record['host'] and entry['stage'] == record['stage']
+            and scenario_key(entry['scenario']) == scenario_key(record['scenario'])
+        ][-baseline_runs:]
+        if not previous:
+            continue
+        baseline = statistics.median(previous)
+        limit = threshold_for(thresholds, record['stage'])
+        ratio = record['seconds'] / baseline if baseline else 1.0
+        record['baseline_seconds'] = baseline
+        if ratio > limit:
+            regressions.append(f"{record['stage']} {scenario_key(record['scenario'])}: "
+                               f"{record['seconds']:.3f}s vs {baseline:.3f}s baseline ({ratio:.2f}x > {limit:.2f}x)")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark kitsu-ingest encode and publish throughput')
+    parser.add_argument('--shots', type=_ints, default=[10, 50], help='Shot counts, comma separated')
+    parser.add_argument('--frames', type=_ints, default=[24, 96], help='Frames per shot, comma separated')
+    parser.add_argument('--resolutions', type=_resolutions, default=[(640, 360), (1920, 1080)],
+                        help='WIDTHxHEIGHT list, comma separated')
+    parser.add_argument('--fps', type=int, default=24)
+    parser.add_argument('--modes', type=lambda value: value.split(','), default=list(MODES),
+                        help=f"Video modes to time, comma separated ({', '.join(MODES)})")
+    parser.add_argument('-j', '--jobs', type=int, help='Concurrent encodes for parallel and smart-cut modes')
+    parser.add_argument('--publish-workers', type=_ints, default=[1, 4], help='Publish worker counts to time')
+    parser.add_argument('--no-publish', action='store_true', help='Skip the publish stage')
+    parser.add_argument('--latency', type=float, default=0.02, help='Stand-in latency per request, seconds')
+    parser.add_argument('--jitter', type=float, default=0.01, help='Extra random latency per request, seconds')
+    parser.add_argument('--rate-limit', type=float, default=50, help='Stand-in requests per second (0: unlimited)')
+    parser.add_argument('--max-concurrency', type=int, default=8, help='Requests the stand-in serves at once')
+    parser.add_argument('--quick', action='store_true', help='One small scenario, for a smoke test')
+    parser.add_argument('--history', default=DEFAULT_HISTORY, help='JSON-lines results history')
+    parser.add_argument('--thresholds', default=DEFAULT_THRESHOLDS, help='Allowed slowdown per stage')
+    parser.add_argument('--baseline-runs', type=int, default=5,
+                        help='Previous runs whose median is the regression baseline')
+    parser.add_argument('--no-record', action='store_true', help='Compare against the history without appending')
+    parser.add_argument('--work-dir', help='Where inputs and outputs are generated (default: system temp)')
+    parser.add_argument('--keep', action='store_true', help='Keep generated inputs and outputs')
+    args = parser.parse_args()
+
+    unknown = [mode for mode in args.modes if mode not in MODES]
+    if unknown:
+        parser.error(f"Unknown video modes: {', '.join(unknown)}")
+    if shutil.which('ffmpeg') is None or shutil.which('ffprobe') is None:
+        parser.error("ffmpeg and ffprobe must be on PATH")
+    if args.quick:
+        args.shots, args.frames, args.resolutions, args.publish_workers = [5], [24], [(320, 240)], [2]
+
+    # Keep the benchmark's session, ledger and caches away from the user's
+    cache_root = tempfile.mkdtemp(prefix='kitsu_bench_cache_', dir=args.work_dir)
+    os.environ['KITSU_INGEST_CACHE_DIR'] = cache_root
+
+    standin_server = None
+    if not args.no_publish:
+        from kitsu_ingest.kitsu.standin import KitsuStandin, StandinServer
+        standin = KitsuStandin(latency=args.latency, jitter=args.jitter,
+                               max_concurrency=args.max_concurrency, rate_limit=args.rate_limit or None)
+        standin_server = StandinServer(standin).start()
+        os.environ.update(KITSU_SERVER=standin_server.url, KITSU_EMAIL='bench@localhost',
+                          KITSU_PASSWORD='bench')
+
+    run = {
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'commit': _commit(),
+        'host': platform.node(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version()
+    }
+    records = []
+    try:
+        for width, height in args.resolutions:
+            for shots in args.shots:
+                for frames in args.frames:
+                    scenario = {'shots': shots, 'frames_per_shot': frames, 'resolution': [width, height],
+                                'fps': args.fps}
+                    print(f"{shots} shots x {frames} frames @ {width}x{height}")
+                    for result in bench_scenario(args, {**scenario, 'resolution': (width, height)}, standin_server):
+                        records.append({**run, 'scenario': scenario, **result})
+    finally:
+        if standin_server:
+            standin_server.stop()
+        shutil.rmtree(cache_root, ignore_errors=True)
+
+    history = load_history(args.history)
+    regressions = check_regressions(history, records, load_thresholds(args.thresholds), args.baseline_runs)
+
+    if not args.no_record:
+        with open(args.history, 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+        print(f"Recorded {len(records)} results in {args.history}")
+
+    for regression in regressions:
+        print(f"REGRESSION: {regression}")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
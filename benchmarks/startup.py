@@ -0,0 +1,84 @@
+"""Startup budget check for the kitsu-ingest CLI.
+
+Imports kitsu_ingest.core under ``python -X importtime`` and fails when the
+cumulative import time exceeds the budget, or when a heavy dependency (pandas,
+ffmpeg, gazu, ...) is loaded before a stage actually needs it. Also reports the
+wall time of ``kitsu-ingest --help``.
+
+    python benchmarks/startup.py --budget-ms 150
+"""
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+ENTRY_MODULE = 'kitsu_ingest.core'
+DEFAULT_BUDGET_MS = 150
+DEFAULT_RUNS = 5
+
+# Must not be imported just to parse arguments
+HEAVY_MODULES = ('pandas', 'numpy', 'pyarrow', 'ffmpeg', 'gazu', 'requests', 'dotenv')
+
+
+def import_times(module):
+    # {module: (self_us, cumulative_us)} as reported by -X importtime
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=REPO_ROOT, capture_output=True, text=True, check=True
+    )
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        times[name.strip()] = (int(self_us), int(cumulative_us))
+    return times
+
+
+def help_wall_time(runs):
+    samples = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, '-m', 'kitsu_ingest', '--help'], cwd=REPO_ROOT,
+                       stdout=subprocess.DEVNULL, check=True)
+        samples.append(time.perf_counter() - started)
+    return statistics.median(samples)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Check the kitsu-ingest startup budget')
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS,
+                        help=f'Maximum cumulative import time of {ENTRY_MODULE}')
+    parser.add_argument('--runs', type=int, default=DEFAULT_RUNS, help='Samples for the --help wall time')
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list')
+    args = parser.parse_args()
+
+    # Best of several runs: the first one also pays for cold .pyc and disk caches
+    samples = [import_times(ENTRY_MODULE) for _ in range(args.runs)]
+    times = min(samples, key=lambda t: t[ENTRY_MODULE][1])
+    total_ms = times[ENTRY_MODULE][1] / 1000
+
+    print(f"{ENTRY_MODULE} import: {total_ms:.1f} ms (budget {args.budget_ms:.0f} ms)")
+    print(f"kitsu-ingest --help: {help_wall_time(args.runs) * 1000:.1f} ms wall (median of {args.runs})")
+    print("Slowest imports (self time):")
+    for name, (self_us, _) in sorted(times.items(), key=lambda item: -item[1][0])[:args.top]:
+        print(f"  {self_us / 1000:8.2f} ms  {name}")
+
+    failures = []
+    heavy = sorted(name for name in times if name.split('.')[0] in HEAVY_MODULES)
+    if heavy:
+        failures.append(f"heavy modules imported at startup: {', '.join(heavy)}")
+    if total_ms > args.budget_ms:
+        failures.append(f"import time {total_ms:.1f} ms exceeds the {args.budget_ms:.0f} ms budget")
+
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
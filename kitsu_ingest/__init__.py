@@ -0,0 +1,2 @@
+from .core import main
+from .api import Ingest, ShotResult, ingest, ingest_async
@@ -0,0 +1,269 @@
+import os
+import time
+import queue
+import tempfile
+import threading
+from datetime import datetime
+from .options import MODE_SEQUENTIAL, DEFAULT_MAX_OUTPUTS, DEFAULT_RETRIES, SYNC_IMPORT, \
+    SHOT_PUBLISHED, SHOT_SKIPPED, SHOT_FAILED, DEFAULT_VERIFY_RETRIES
+from .processors.csv_processor import CsvProcessor, PROCESSED_DIR
+from .processors.render_cache import RenderCache
+from .processors.review import proxy_path, poster_path
+from .kitsu.ledger import PublishLedger
+from .utils.history import ThroughputHistory
+from .kitsu.pipeline import PublishPipeline, DEFAULT_QUEUE_SIZE
+from .utils.validation import extract_shots, load_shot_table, MISMATCH_ABORT, MISMATCH_CONTINUE
+
+# Programmatic entry point for schedulers that run many ingests in one process.
+# Like the CLI, it keeps pandas, ffmpeg and gazu out of the import: they load when
+# an ingest runs, and the Kitsu session and metadata caches are shared by every
+# ingest of the process.
+
+STAGE_VIDEO = 'video'
+STAGE_PUBLISH = 'publish'
+
+# What KitsuPublisher.publish_shot counted the shot as → the status callers see
+_PUBLISH_STATUSES = {
+    'matched': SHOT_PUBLISHED,
+    'skipped': SHOT_SKIPPED,
+    'excluded': SHOT_SKIPPED,
+    'unmatched': SHOT_FAILED,
+    'failed': SHOT_FAILED
+}
+
+_DONE = object()
+
+
+class ShotResult:
+    # One shot finishing one stage. An ingest with a project yields two results per
+    # shot: the video one (encoded, cached or failed), then the publish one
+    # (published, skipped or failed). detail is the publisher's own outcome:
+    # matched, skipped (already in the publish ledger), excluded (metadata
+    # mismatch under skip-shot), unmatched or failed.
+    def __init__(self, shot, stage, status, path=None, error=None, seconds=None, elapsed=None, detail=None,
+                 proxy=None, poster=None):
+        self.shot = shot
+        self.stage = stage
+        self.status = status
+        self.path = path
+        # Review proxy and poster frame, when the ingest writes them
+        self.proxy = proxy
+        self.poster = poster
+        self.error = error
+        # Time spent on this shot in this stage, and time since the ingest started
+        self.seconds = seconds
+        self.elapsed = elapsed
+        self.detail = detail
+
+    @property
+    def ok(self):
+        return self.status != SHOT_FAILED
+
+    def as_dict(self):
+        return {
+            'shot': self.shot,
+            'stage': self.stage,
+            'status': self.status,
+            'path': self.path,
+            'proxy': self.proxy,
+            'poster': self.poster,
+            'error': self.error,
+            'seconds': self.seconds,
+            'elapsed': self.elapsed,
+            'detail': self.detail
+        }
+
+    def __repr__(self):
+        return f"ShotResult({self.shot!r}, {self.stage!r}, {self.status!r})"
+
+
+class Ingest:
+    # One breakdown: cut the video into shots and, with a project, publish each shot
+    # while the next ones are still encoding (the CLI's --pipeline). shot_table is a
+    # breakdown table (SHOT, FRAME IN, FRAME OUT, FRAME DURATION, Clip Name, FPS) as a
+    # DataFrame or a CSV path. Iterate it, or iterate it with async for, to receive a
+    # ShotResult as each shot finishes a stage; errors that stop the whole ingest
+    # (MismatchError, a failed login) are raised once the results produced so far
+    # have been delivered.
+    def __init__(self, shot_table, video_path, project=None, sequence='SQ01', output_dir=None,
+                 video_mode=MODE_SEQUENTIAL, max_outputs=DEFAULT_MAX_OUTPUTS, jobs=None, threads_per_job=None,
+                 cache=True, review_proxy=False, publish_workers=1, publish_retries=DEFAULT_RETRIES, force=False,
+                 sync_mode=SYNC_IMPORT, on_mismatch=None, refresh_cache=False, pool_size=None,
+                 queue_size=DEFAULT_QUEUE_SIZE, ledger=True, verify=True, verify_retries=DEFAULT_VERIFY_RETRIES,
+                 check_cuts=True, shared_dir=None):
+        self.shot_table = shot_table
+        self.video_path = video_path
+        self.project = project
+        self.sequence = sequence
+        self.output_dir = output_dir
+        self.video_mode = video_mode
+        self.max_outputs = max_outputs
+        self.jobs = jobs
+        self.threads_per_job = threads_per_job
+        # True for the default render cache, False for none, or a RenderCache
+        self.cache = cache
+        self.review_proxy = review_proxy
+        # Shots whose output does not match the table are re-encoded, then reported failed
+        self.verify = verify
+        self.verify_retries = verify_retries
+        self.check_cuts = check_cuts
+        # Job folder shared with `kitsu-ingest worker` processes, for video_mode='distributed'
+        self.shared_dir = shared_dir
+        self.publish_workers = publish_workers
+        self.publish_retries = publish_retries
+        self.force = force
+        self.sync_mode = sync_mode
+        # None: CSV/Kitsu mismatches abort, video cut mismatches only warn (the detector is a heuristic)
+        self.on_mismatch = on_mismatch
+        self.refresh_cache = refresh_cache
+        self.pool_size = pool_size
+        self.queue_size = queue_size
+        # True for the default publish ledger, False for none, or a PublishLedger
+        self.ledger = ledger
+        self.processed_csv_path = None
+        self.stats = None
+        self.error = None
+        self.history = ThroughputHistory()
+        self._thread = None
+
+    def __iter__(self):
+        return self.results()
+
+    def __aiter__(self):
+        return self.results_async()
+
+    def results(self):
+        events = queue.Queue()
+        self._start(events.put)
+        while True:
+            item = events.get()
+            if item is _DONE:
+                break
+            yield item
+        self._thread.join()
+        if self.error:
+            raise self.error
+
+    async def results_async(self):
+        import asyncio
+
+        loop = asyncio.get_running_loop()
+        events = asyncio.Queue()
+        self._start(lambda item: loop.call_soon_threadsafe(events.put_nowait, item))
+        while True:
+            item = await events.get()
+            if item is _DONE:
+                break
+            yield item
+        if self.error:
+            raise self.error
+
+    def _start(self, emit):
+        # Encoding and uploads run on a worker thread and hand results over as they
+        # come. Leaving the loop early does not cancel shots already in flight.
+        if self._thread is not None:
+            raise RuntimeError("An Ingest can only be run once")
+        if self.output_dir is None:
+            os.makedirs(PROCESSED_DIR, exist_ok=True)
+            # Unique per ingest: several may start within the same second
+            self.output_dir = tempfile.mkdtemp(prefix=f"{datetime.now():%Y%m%d_%H%M%S}_", dir=PROCESSED_DIR)
+        self._thread = threading.Thread(target=self._run, args=(emit,), name='kitsu-ingest', daemon=False)
+        self._thread.start()
+
+    def _run(self, emit):
+        started = time.monotonic()
+
+        def on_shot(shot_name, status, output_path=None, error=None, seconds=None):
+            review = output_path and self.review_proxy
+            emit(ShotResult(shot_name, STAGE_VIDEO, status, path=output_path, error=error, seconds=seconds,
+                            elapsed=time.monotonic() - started,
+                            proxy=proxy_path(output_path) if review else None,
+                            poster=poster_path(output_path) if review else None))
+
+        try:
+            csv_processor = CsvProcessor(None, self.sequence, output_dir=self.output_dir)
+            # sort_dataframe works in place: leave the caller's table untouched
+            self.processed_csv_path = csv_processor.process(load_shot_table(self.shot_table).copy())
+            shots = extract_shots(csv_processor.df)
+
+            if not self.project:
+                self._video_processor(shots, on_shot=on_shot).process()
+                return
+
+            # Length and cut checks first: a reel that does not match must fail before Kitsu is touched
+            video_processor = self._video_processor(shots, on_shot=on_shot)
+            video_processor.preflight()
+
+            publisher = self._publisher()
+            if not publisher.connect():
+                raise RuntimeError(f"Could not open Kitsu project '{self.project}', sequence '{self.sequence}'")
+            publisher.push_shots(self.processed_csv_path, csv_processor.shot_table)
+            publisher.prepare_publish()
+            publisher.validate(csv_processor.shot_table, [f"{shot_name}.mp4" for shot_name in shots],
+                               report_dir=self.output_dir)
+
+            def on_published(shot_name, video_path, outcome):
+                error = pipeline.stats['errors'].get(shot_name)
+                if outcome == 'unmatched':
+                    error = "No matching Kitsu task or file"
+                emit(ShotResult(shot_name, STAGE_PUBLISH, _PUBLISH_STATUSES[outcome], path=video_path, error=error,
+                                proxy=proxy_path(video_path) if self.review_proxy else None,
+                                seconds=pipeline.stats['timings'].get(shot_name),
+                                elapsed=time.monotonic() - started, detail=outcome))
+
+            with PublishPipeline(publisher, queue_size=self.queue_size, on_published=on_published) as pipeline:
+                video_processor.on_exported = pipeline.submit
+                video_processor.process()
+            self.stats = pipeline.stats
+        except BaseException as e:
+            self.error = e
+        finally:
+            self.history.flush()
+            emit(_DONE)
+
+    def _publisher(self):
+        from .kitsu.publisher import KitsuPublisher
+        ledger = PublishLedger() if self.ledger is True else self.ledger or None
+        return KitsuPublisher(
+            self.project, self.sequence,
+            workers=self.publish_workers,
+            retries=self.publish_retries,
+            ledger=ledger,
+            force=self.force,
+            refresh_cache=self.refresh_cache,
+            pool_size=self.pool_size,
+            sync_mode=self.sync_mode,
+            on_mismatch=self.on_mismatch or MISMATCH_ABORT,
+            history=self.history
+        )
+
+    def _video_processor(self, shots, on_exported=None, on_shot=None):
+        from .processors.video_processor import VideoProcessor
+        cache = RenderCache() if self.cache is True else self.cache or None
+        return VideoProcessor(
+            self.video_path, shots, self.output_dir,
+            mode=self.video_mode,
+            max_outputs=self.max_outputs,
+            jobs=self.jobs,
+            threads_per_job=self.threads_per_job,
+            cache=cache,
+            on_exported=on_exported,
+            on_shot=on_shot,
+            review=self.review_proxy,
+            verify=self.verify,
+            verify_retries=self.verify_retries,
+            check_cuts=self.check_cuts,
+            on_mismatch=self.on_mismatch or MISMATCH_CONTINUE,
+            shared_dir=self.shared_dir,
+            history=self.history
+        )
+
+
+def ingest(shot_table, video_path, **options):
+    # for result in ingest(table, 'breakdown.mov', project='Demo'): ...
+    return Ingest(shot_table, video_path, **options).results()
+
+
+def ingest_async(shot_table, video_path, **options):
+    # async for result in ingest_async(table, 'breakdown.mov', project='Demo'): ...
+    return Ingest(shot_table, video_path, **options).results_async()
@@ -1,9 +1,21 @@
+import os
+import sys
 import argparse
 import logging
+from .options import MODES, MODE_SEQUENTIAL, MODE_DISTRIBUTED, DEFAULT_MAX_OUTPUTS, DEFAULT_RETRIES, SYNC_MODES, \
+    SYNC_IMPORT, DEFAULT_VERIFY_RETRIES
 from .processors.csv_processor import CsvProcessor
-from .processors.video_processor import VideoProcessor
-from .kitsu.publisher import KitsuPublisher
-from .utils.validation import extract_shots, fetch_csv_from_folder
+from .processors.render_cache import RenderCache, DEFAULT_MAX_BYTES, DEFAULT_MAX_AGE_DAYS
+from .kitsu.ledger import PublishLedger
+from .kitsu.pipeline import PublishPipeline, DEFAULT_QUEUE_SIZE
+from .utils.history import ThroughputHistory
+from .utils.metrics import metrics
+from .utils.validation import extract_shots, fetch_csv_from_folder, read_breakdown_csv, MismatchError, \
+    MISMATCH_POLICIES, MISMATCH_CONTINUE, default_mismatch_policy
+
+# Only light modules are imported above. The video stage (ffmpeg) and the Kitsu stage
+# (gazu, requests) are imported when a run reaches them, so --help, argument errors and
+# CSV-only runs start quickly; pandas loads with the first CSV read.
 
 logging.basicConfig(
     level=logging.INFO,
@@ -14,54 +26,263 @@ class Workflow:
     def __init__(self, args):
         self.args = args
         self.output_dir = None
+        self.history = ThroughputHistory()
 
+    @metrics.span('run')
     def run(self):
+        try:
+            self._run()
+        finally:
+            # Measured encode and upload throughput, for --plan
+            self.history.flush()
+
+    def _run(self):
         if self.args.push_only:
             self.output_dir = self.args.push_only
             csv_path = fetch_csv_from_folder(self.args.push_only)
+            shot_table = read_breakdown_csv(csv_path)
 
-            publisher = KitsuPublisher(self.args.push, self.args.sequence)
+            publisher = self._publisher(verify=not self.args.no_verify)
             if publisher.connect():
-                publisher.import_shots_from_csv(csv_path)
-                stats = publisher.publish_previews(self.output_dir)
-                logging.info(f"Finished publishing previews. "
-                             f"Matched: {stats['matched']}, "
-                             f"Unmatched: {stats['unmatched']}, "
-                             f"Failed: {stats['failed']}")
+                publisher.push_shots(csv_path, shot_table)
+                stats = publisher.publish_previews(self.output_dir, shot_table)
+                self._log_stats(stats)
         else:
             # Process CSV
-            csv_processor = CsvProcessor(self.args.csv, self.args.sequence)
+            csv_processor = CsvProcessor(self.args.csv, self.args.sequence, output_dir=self.args.output_dir)
             processed_csv_path = csv_processor.process()
             self.output_dir = csv_processor.output_dir
 
+            if self.args.pipeline:
+                self._run_pipeline(csv_processor, processed_csv_path)
+                return
+
             # Process video if provided
             if self.args.video:
                 shots = extract_shots(csv_processor.df)
-                video_processor = VideoProcessor(self.args.video, shots, self.output_dir)
-                video_processor.process()
+                self._video_processor(shots).process()
 
             # Push to Kitsu if requested
             if self.args.push:
-                publisher = KitsuPublisher(self.args.push, self.args.sequence)
+                publisher = self._publisher()
                 if publisher.connect():
-                    publisher.import_shots_from_csv(processed_csv_path)
-                    stats = publisher.publish_previews(self.output_dir)
-                    logging.info(f"Finished publishing previews. "
-                                 f"Matched: {stats['matched']}, "
-                                 f"Unmatched: {stats['unmatched']}, "
-                                 f"Failed: {stats['failed']}")
+                    publisher.push_shots(processed_csv_path, csv_processor.shot_table)
+                    stats = publisher.publish_previews(self.output_dir, csv_processor.shot_table)
+                    self._log_stats(stats)
+
+    def _run_pipeline(self, csv_processor, processed_csv_path):
+        # Encode and publish concurrently: validate against the CSV up front, then
+        # upload each shot as soon as its file is written.
+        shots = extract_shots(csv_processor.df)
+        # Length and cut checks first: a reel that does not match must fail before Kitsu is touched
+        video_processor = self._video_processor(shots)
+        video_processor.preflight()
+
+        publisher = self._publisher()
+        if not publisher.connect():
+            return
+        publisher.push_shots(processed_csv_path, csv_processor.shot_table)
+        publisher.prepare_publish()
+        publisher.validate(csv_processor.shot_table, [f"{shot_name}.mp4" for shot_name in shots],
+                           report_dir=self.output_dir)
+
+        with PublishPipeline(publisher, queue_size=self.args.queue_size) as pipeline:
+            video_processor.on_exported = pipeline.submit
+            video_processor.process()
+        self._log_stats(pipeline.stats)
+
+    def _publisher(self, verify=False):
+        # Encoded shots are verified by the video stage; only pushed folders need it here
+        from .kitsu.publisher import KitsuPublisher
+        return KitsuPublisher(
+            self.args.push, self.args.sequence,
+            workers=self.args.publish_workers,
+            retries=self.args.publish_retries,
+            ledger=PublishLedger(),
+            force=self.args.force,
+            refresh_cache=self.args.refresh_cache,
+            pool_size=self.args.http_pool_size,
+            sync_mode=self.args.sync_mode,
+            on_mismatch=self.args.on_mismatch,
+            verify=verify,
+            history=self.history
+        )
+
+    def _video_processor(self, shots, on_exported=None):
+        from .processors.video_processor import VideoProcessor
+        cache = None
+        if not self.args.no_cache:
+            cache = RenderCache(
+                root=self.args.cache_dir,
+                max_bytes=int(self.args.cache_max_gb * 1024 ** 3),
+                max_age_days=self.args.cache_max_age_days
+            )
+        return VideoProcessor(
+            self.args.video, shots, self.output_dir,
+            mode=self.args.video_mode,
+            max_outputs=self.args.max_outputs,
+            jobs=self.args.jobs,
+            threads_per_job=self.args.threads_per_job,
+            cache=cache,
+            on_exported=on_exported,
+            review=self.args.review_proxy,
+            verify=not self.args.no_verify,
+            verify_retries=self.args.verify_retries,
+            check_cuts=not self.args.no_check_cuts,
+            on_mismatch=self.args.cut_mismatch,
+            shared_dir=self.args.shared_dir,
+            history=self.history
+        )
+
+    def write_metrics(self):
+        stages = {}
+        for span in metrics.spans:
+            stages[span['name']] = stages.get(span['name'], 0.0) + span['duration']
+        if stages:
+            logging.info("Stage timings: " + ", ".join(f"{name} {duration:.1f}s" for name, duration in stages.items()))
+
+        if self.args.metrics_json:
+            metrics.write_json(self.args.metrics_json)
+            logging.info(f"Run report written to: {self.args.metrics_json}")
+        if self.args.metrics_prom:
+            metrics.write_prometheus(self.args.metrics_prom)
+            logging.info(f"Prometheus metrics written to: {self.args.metrics_prom}")
+
+    def _log_stats(self, stats):
+        timings = list(stats['timings'].values())
+        average = sum(timings) / len(timings) if timings else 0.0
+        logging.info(f"Finished publishing previews. "
+                     f"Matched: {stats['matched']}, "
+                     f"Unmatched: {stats['unmatched']}, "
+                     f"Failed: {stats['failed']}, "
+                     f"Skipped: {stats['skipped']}, "
+                     f"Excluded: {stats['excluded']}, "
+                     f"Retries: {stats['retries']}, "
+                     f"Average time per shot: {average:.1f}s")
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Kitsu Ingest Tool')
+def build_parser(description='Kitsu Ingest Tool', inputs=True):
+    # Shared by the one-shot CLI and serve mode; serve finds its inputs in the watch folder
+    parser = argparse.ArgumentParser(description=description)
 
-    parser.add_argument('--csv', help='Path to the breakdown CSV file')
-    parser.add_argument('-v', '--video', help='Path to the breakdown video file')
+    if inputs:
+        parser.add_argument('--csv', help='Path to the breakdown CSV file')
+        parser.add_argument('-v', '--video', help='Path to the breakdown video file')
     parser.add_argument('-p', '--push', metavar='PROJECT', help='Project name to push to Kitsu')
-    parser.add_argument('--push_only', help='Push a folder (path) containing CSV and videos to Kitsu')
+    if inputs:
+        parser.add_argument('--push_only', help='Push a folder (path) containing CSV and videos to Kitsu')
     parser.add_argument('--sequence', default='SQ01', help='Sequence name to assign to all shots')
+    parser.add_argument('--output-dir',
+                        help='Where the processed CSV and shot files are written (default: kitsu_ingest/processed/<timestamp>)')
+    parser.add_argument('--video-mode', choices=MODES, default=MODE_SEQUENTIAL,
+                        help='How shots are cut from the video: sequential (one ffmpeg run per shot), '
+                             'single-pass (one decode fanned out to all shot encoders), '
+                             'parallel (concurrent seeking encodes), smart-cut (copy whole GOPs, '
+                             're-encode only shot boundaries) or distributed (shots encoded by '
+                             '"kitsu-ingest worker" processes on other nodes, see --shared-dir)')
+    parser.add_argument('--shared-dir', metavar='DIR',
+                        help='Folder shared with the workers, where distributed jobs are written '
+                             '(--video-mode distributed)')
+    parser.add_argument('--max-outputs', type=int, default=DEFAULT_MAX_OUTPUTS,
+                        help='Maximum number of shot outputs per ffmpeg run in single-pass mode')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Number of shots encoded concurrently in parallel and smart-cut modes (default: derived from CPU count)')
+    parser.add_argument('--threads-per-job', type=int,
+                        help='Encoder threads for each parallel job (default: CPU count divided by --jobs)')
+    parser.add_argument('--review-proxy', action='store_true',
+                        help='In the same encode, also write a Kitsu-ready review proxy (H.264, at most 1920x1080, '
+                             'faststart) and a poster frame per shot; the proxy is published without server-side '
+                             'normalization')
+    parser.add_argument('--no-verify', action='store_true',
+                        help='Skip the check of every output against the CSV frame count, FPS and duration '
+                             'before it is published')
+    parser.add_argument('--verify-retries', type=int, default=DEFAULT_VERIFY_RETRIES,
+                        help='Full re-encodes of a shot that fails verification before it is left unpublished')
+    parser.add_argument('--no-check-cuts', action='store_true',
+                        help='Skip matching the cuts detected in the video against the breakdown before encoding')
+    parser.add_argument('--pipeline', action='store_true',
+                        help='With --video and --push, publish each shot while the next ones are still encoding')
+    parser.add_argument('--publish-workers', type=int, default=1, help='Number of concurrent preview uploads')
+    parser.add_argument('--publish-retries', type=int, default=DEFAULT_RETRIES,
+                        help='Retries with exponential backoff for transient publish failures')
+    parser.add_argument('--force', action='store_true',
+                        help='Publish every shot, even those the publish ledger records as already published')
+    parser.add_argument('--sync-mode', choices=SYNC_MODES, default=SYNC_IMPORT,
+                        help='How shots reach Kitsu: import the whole CSV, or diff against Kitsu and only '
+                             'create missing shots and update changed fields')
+    parser.add_argument('--on-mismatch', choices=MISMATCH_POLICIES,
+                        help='What to do when the CSV, Kitsu and the MP4s disagree: abort, continue, skip-shot '
+                             '(publish everything except the mismatched shots) or prompt (default: prompt when '
+                             'run from a terminal, abort otherwise). Video cuts that do not match the breakdown '
+                             'only warn unless this is given')
+    parser.add_argument('--refresh-cache', action='store_true',
+                        help='Ignore cached Kitsu metadata (projects, sequences, task types, shots) and fetch it again')
+    parser.add_argument('--http-pool-size', type=int,
+                        help='Keep-alive connections to Kitsu (default: at least one per publish worker)')
+    parser.add_argument('--queue-size', type=int, default=DEFAULT_QUEUE_SIZE,
+                        help='Encoded shots allowed to wait for upload before encoding pauses (--pipeline)')
+    parser.add_argument('--no-cache', action='store_true', help='Encode every shot, bypassing the render cache')
+    parser.add_argument('--cache-dir', help='Render cache location (default: ~/.cache/kitsu_ingest/renders)')
+    parser.add_argument('--cache-max-gb', type=float, default=DEFAULT_MAX_BYTES / 1024 ** 3,
+                        help='Evict least recently used renders beyond this size')
+    parser.add_argument('--metrics-json', metavar='PATH',
+                        help='Write a JSON run report: stage timings, counters and API latency per endpoint')
+    parser.add_argument('--metrics-prom', metavar='PATH',
+                        help='Write the run metrics as a Prometheus textfile (node_exporter textfile collector)')
+    parser.add_argument('--profile', metavar='PATH',
+                        help='Run under cProfile and dump the stats to PATH (inspect with python -m pstats)')
+    parser.add_argument('--cache-max-age-days', type=float, default=DEFAULT_MAX_AGE_DAYS,
+                        help='Evict renders not used for this many days')
+    if inputs:
+        parser.add_argument('--plan', action='store_true',
+                            help='Estimate encode time, output size, upload time and Kitsu API calls from the '
+                                 'throughput of past runs, without encoding or publishing')
+        parser.add_argument('--plan-json', metavar='PATH', help='Also write the --plan estimate as JSON')
+        parser.add_argument('--plan-window', type=float, metavar='HOURS',
+                            help='With --plan: check the run fits in HOURS and suggest a worker node count')
+    return parser
 
-    args = parser.parse_args()
+
+def apply_mismatch_defaults(args, default):
+    # The cut detector is a heuristic: an offset cut only warns unless --on-mismatch
+    # was given, while CSV/Kitsu mismatches fall back to `default`
+    args.cut_mismatch = args.on_mismatch or MISMATCH_CONTINUE
+    if args.on_mismatch is None:
+        args.on_mismatch = default
+
+
+def check_args(parser, args):
+    if args.max_outputs < 1:
+        parser.error("--max-outputs must be at least 1")
+    if (args.jobs is not None and args.jobs < 1) or (args.threads_per_job is not None and args.threads_per_job < 1):
+        parser.error("--jobs and --threads-per-job must be at least 1")
+    if args.publish_workers < 1 or args.queue_size < 1:
+        parser.error("--publish-workers and --queue-size must be at least 1")
+    if args.http_pool_size is not None and args.http_pool_size < 1:
+        parser.error("--http-pool-size must be at least 1")
+    if args.publish_retries < 0:
+        parser.error("--publish-retries cannot be negative")
+    if args.verify_retries < 0:
+        parser.error("--verify-retries cannot be negative")
+    if args.video_mode == MODE_DISTRIBUTED and not args.shared_dir:
+        parser.error("--video-mode distributed requires --shared-dir")
+    if args.shared_dir and not os.path.isdir(args.shared_dir):
+        parser.error(f"--shared-dir folder not found: {args.shared_dir}")
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if argv[:1] == ['serve']:
+        # Long-running watch-folder mode, only imported when asked for
+        from .serve import main as serve_main
+        return serve_main(argv[1:])
+    if argv[:1] == ['worker']:
+        # Distributed encode worker, see distributed.py
+        from .distributed import main as worker_main
+        return worker_main(argv[1:])
+
+    parser = build_parser()
+    args = parser.parse_args(argv)
 
     if args.push_only:
         if args.csv or args.video:
@@ -72,8 +293,47 @@ def main():
     if args.video and not args.csv:
         parser.error("--video requires --csv to define shots and frame ranges")
 
+    check_args(parser, args)
+    if args.pipeline and not (args.video and args.push):
+        parser.error("--pipeline requires --video and --push")
+
     if not any([args.csv, args.video, args.push_only]):
         parser.error("You must provide at least one of --csv, --csv + --video, or --push_only + --push")
 
+    # Fail on bad paths now rather than after the stages have been imported
+    if args.csv and not os.path.isfile(args.csv):
+        parser.error(f"--csv file not found: {args.csv}")
+    if args.video and not os.path.isfile(args.video):
+        parser.error(f"--video file not found: {args.video}")
+    if args.push_only and not os.path.isdir(args.push_only):
+        parser.error(f"--push_only folder not found: {args.push_only}")
+
+    if args.plan:
+        if not (args.csv and args.video):
+            parser.error("--plan requires --csv and --video")
+        if args.plan_window is not None and args.plan_window <= 0:
+            parser.error("--plan-window must be positive")
+        from .planner import run_plan
+        run_plan(args)
+        return
+
+    apply_mismatch_defaults(args, default_mismatch_policy())
+
+    profiler = None
+    if args.profile:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+
     workflow = Workflow(args)
-    workflow.run()
\ No newline at end of file
+    try:
+        workflow.run()
+    except MismatchError as e:
+        logging.error(e)
+        sys.exit(1)
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+            logging.info(f"Profile written to: {args.profile}")
+        workflow.write_metrics()
\ No newline at end of file
@@ -0,0 +1,427 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import signal
+import socket
+import argparse
+import logging
+import threading
+from datetime import datetime
+from .processors.review import PROXY_DIR, POSTER_DIR, PROXY_SUFFIX, POSTER_SUFFIX, make_review_dirs
+from .utils.metrics import metrics
+
+# Distributed encoding over a shared POSIX filesystem, no queue service. The
+# coordinator (--video-mode distributed) writes a job folder under --shared-dir:
+#
+#   <job>/job.json           source video and the shots to encode (seek time, length)
+#   <job>/leases/<shot>      claimed with O_CREAT | O_EXCL, heartbeat = mtime
+#   <job>/reclaimed/         leases taken over from dead workers
+#   <job>/outputs/           encoded shots (and review proxies / posters)
+#   <job>/done/<shot>.json   result, written after the output is in place
+#   <job>/complete           set by the coordinator: workers stop claiming
+#
+# `kitsu-ingest worker --shared-dir DIR` claims shots of every open job, encodes
+# them and writes the result back. A lease whose mtime has not moved for
+# LEASE_TIMEOUT (on the filesystem's clock, so node clocks may disagree) belongs to
+# a dead worker: it is renamed away, which only one reclaimer can do, and the shot
+# is claimed again.
+
+JOB_SPEC_NAME = 'job.json'
+COMPLETE_NAME = 'complete'
+LEASES_DIR = 'leases'
+OUTPUTS_DIR = 'outputs'
+DONE_DIR = 'done'
+RECLAIMED_DIR = 'reclaimed'
+CLOCK_DIR = 'clock'
+
+DEFAULT_POLL_INTERVAL = 2.0
+HEARTBEAT_SECONDS = 15.0
+LEASE_TIMEOUT = 120.0
+
+# Coordinator progress line while waiting on workers
+PROGRESS_SECONDS = 30.0
+
+RESULT_OK = 'ok'
+RESULT_FAILED = 'failed'
+
+
+def _write_json(path, data):
+    # Readers on other nodes must never see a half-written file
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def _read_json(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _done_name(shot_name):
+    return f"{shot_name}.json"
+
+
+def _review_names(shot_name, file_name):
+    # Final → private name of the review artifacts of an output, relative to the outputs folder
+    stem = os.path.splitext(file_name)[0]
+    return {os.path.join(PROXY_DIR, f"{shot_name}.mp4"): os.path.join(PROXY_DIR, file_name),
+            os.path.join(POSTER_DIR, f"{shot_name}.jpg"): os.path.join(POSTER_DIR, f"{stem}.jpg")}
+
+
+class DistributedJob:
+    # Coordinator side of one job folder
+    def __init__(self, path):
+        self.path = path
+        self.job_id = os.path.basename(path)
+
+    @classmethod
+    def create(cls, shared_dir, video_path, shots, review_size=None):
+        # shots: [{'shot', 'seek_time', 'nb_frames'}] in breakdown order
+        job_id = f"{datetime.now():%Y%m%d_%H%M%S}_{uuid.uuid4().hex[:8]}"
+        path = os.path.join(shared_dir, job_id)
+        for name in (LEASES_DIR, OUTPUTS_DIR, DONE_DIR, RECLAIMED_DIR, CLOCK_DIR):
+            os.makedirs(os.path.join(path, name))
+        if review_size:
+            make_review_dirs(os.path.join(path, OUTPUTS_DIR))
+        # Written last: workers only pick up folders that have a spec
+        _write_json(os.path.join(path, JOB_SPEC_NAME), {
+            'video_path': os.path.abspath(video_path),
+            'review_size': list(review_size) if review_size else None,
+            'created_at': datetime.now().isoformat(timespec='seconds'),
+            'coordinator': socket.gethostname(),
+            'shots': shots
+        })
+        return cls(path)
+
+    def results(self, expected, poll_interval=DEFAULT_POLL_INTERVAL):
+        # Yields (shot_name, result) as workers finish, until every expected shot is done
+        remaining = set(expected)
+        last_progress = time.monotonic()
+        done_dir = os.path.join(self.path, DONE_DIR)
+        while remaining:
+            found = False
+            for file_name in os.listdir(done_dir):
+                shot_name = file_name[:-len('.json')] if file_name.endswith('.json') else None
+                if shot_name not in remaining:
+                    continue
+                result = _read_json(os.path.join(done_dir, file_name))
+                if result is None:
+                    continue
+                remaining.discard(shot_name)
+                found = True
+                yield shot_name, result
+
+            if remaining and time.monotonic() - last_progress >= PROGRESS_SECONDS:
+                leased = len(os.listdir(os.path.join(self.path, LEASES_DIR)))
+                logging.info(f"Distributed job {self.job_id}: {len(expected) - len(remaining)}/{len(expected)} "
+                             f"shots done, {leased} being encoded")
+                if not leased:
+                    logging.warning(f"No worker is encoding. Start one with: "
+                                    f"kitsu-ingest worker --shared-dir {os.path.dirname(self.path)}")
+                last_progress = time.monotonic()
+            if remaining and not found:
+                time.sleep(poll_interval)
+
+    def collect(self, shot_name, output_path, artifacts=None):
+        # Move a finished shot (and its review artifacts) out of the shared folder
+        outputs = os.path.join(self.path, OUTPUTS_DIR)
+        shutil.move(os.path.join(outputs, f"{shot_name}.mp4"), output_path)
+        if artifacts:
+            sources = {PROXY_SUFFIX: os.path.join(outputs, PROXY_DIR, f"{shot_name}.mp4"),
+                       POSTER_SUFFIX: os.path.join(outputs, POSTER_DIR, f"{shot_name}.jpg")}
+            for suffix, dest in artifacts.items():
+                if os.path.exists(sources[suffix]):
+                    shutil.move(sources[suffix], dest)
+
+    def close(self, remove=True):
+        # Workers stop claiming shots of a complete job; an interrupted job is kept for inspection
+        open(os.path.join(self.path, COMPLETE_NAME), 'w').close()
+        if remove:
+            shutil.rmtree(self.path, ignore_errors=True)
+
+
+class Lease:
+    def __init__(self, job_path, shot, token):
+        self.job_path = job_path
+        self.shot = shot
+        self.token = token
+        self.lost = False
+
+    @property
+    def path(self):
+        return os.path.join(self.job_path, LEASES_DIR, self.shot['shot'])
+
+    def held(self):
+        data = _read_json(self.path)
+        return bool(data) and data.get('token') == self.token
+
+    def heartbeat(self):
+        # Touch only our own lease: after a reclaim the same name belongs to someone else
+        if self.lost:
+            return
+        if not self.held():
+            self.lost = True
+            logging.warning(f"Lease on {self.shot['shot']} was reclaimed by another worker")
+            return
+        try:
+            os.utime(self.path)
+        except FileNotFoundError:
+            self.lost = True
+
+    def release(self):
+        if self.held():
+            try:
+                os.remove(self.path)
+            except FileNotFoundError:
+                pass
+
+
+class EncodeWorker:
+    # One `kitsu-ingest worker` process: `jobs` encode threads (ffmpeg runs in its own
+    # process, so threads are enough) and one heartbeat thread for the leases held
+    def __init__(self, shared_dir, jobs=None, threads_per_job=None, poll_interval=DEFAULT_POLL_INTERVAL,
+                 once=False, lease_timeout=LEASE_TIMEOUT, heartbeat_seconds=HEARTBEAT_SECONDS):
+        from .processors.video_processor import resolve_cpu_budget
+        self.shared_dir = shared_dir
+        self.jobs, self.threads_per_job = resolve_cpu_budget(jobs, threads_per_job)
+        self.poll_interval = poll_interval
+        self.once = once
+        self.lease_timeout = lease_timeout
+        self.heartbeat_seconds = heartbeat_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.stop_event = threading.Event()
+        self._leases = set()
+        self._leases_lock = threading.Lock()
+        self._claim_lock = threading.Lock()
+        self._specs = {}
+        self.encoded = 0
+
+    def stop(self, *_):
+        if not self.stop_event.is_set():
+            logging.info("Stopping: shots being encoded will finish, no new shots are claimed")
+        self.stop_event.set()
+
+    def run(self):
+        logging.info(f"Worker {self.worker_id} watching {self.shared_dir}: {self.jobs} jobs, "
+                     f"{self.threads_per_job} threads each")
+        heartbeat = threading.Thread(target=self._heartbeat, name='lease-heartbeat', daemon=True)
+        heartbeat.start()
+        threads = [threading.Thread(target=self._loop, name=f"encode-{i}") for i in range(self.jobs)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.stop_event.set()
+        logging.info(f"Worker {self.worker_id} encoded {self.encoded} shots")
+
+    def _heartbeat(self):
+        while not self.stop_event.wait(self.heartbeat_seconds):
+            with self._leases_lock:
+                leases = list(self._leases)
+            for lease in leases:
+                try:
+                    lease.heartbeat()
+                except OSError as e:
+                    # ESTALE and friends on a network mount: try again next beat
+                    logging.warning(f"Could not refresh the lease on {lease.shot['shot']}: {e}")
+
+    def _loop(self):
+        # A shared-folder error (a job removed by its coordinator mid-scan, ESTALE on
+        # NFS) costs one poll, never the encode thread
+        while not self.stop_event.is_set():
+            try:
+                lease = self._claim_next()
+                if lease:
+                    self._encode(lease)
+                    continue
+                if self.once:
+                    return
+            except OSError as e:
+                logging.warning(f"Shared folder error, retrying in {self.poll_interval:g}s: {e}")
+            self.stop_event.wait(self.poll_interval)
+
+    def _open_jobs(self):
+        for name in sorted(os.listdir(self.shared_dir)):
+            path = os.path.join(self.shared_dir, name)
+            if os.path.exists(os.path.join(path, COMPLETE_NAME)):
+                self._specs.pop(path, None)
+                continue
+            if path not in self._specs:
+                spec = _read_json(os.path.join(path, JOB_SPEC_NAME))
+                if not spec:
+                    continue
+                self._specs[path] = spec
+            yield path, self._specs[path]
+
+    def _fs_now(self, job_path):
+        # The filesystem's idea of now, comparable with lease mtimes whatever this node's clock says
+        clock_path = os.path.join(job_path, CLOCK_DIR, self.worker_id)
+        with open(clock_path, 'w'):
+            pass
+        return os.stat(clock_path).st_mtime
+
+    def _claim_next(self):
+        # One scan per claim: two listdirs per job, then a stat per lease
+        skipped = None
+        with self._claim_lock:
+            for job_path, spec in self._open_jobs():
+                try:
+                    lease = self._claim_in(job_path, spec)
+                except OSError as e:
+                    # Usually a job completed and removed while we scanned it
+                    logging.info(f"Skipping job {os.path.basename(job_path)}: {e}")
+                    self._specs.pop(job_path, None)
+                    skipped = e
+                    continue
+                if lease:
+                    return lease
+        if skipped:
+            # Not "nothing left to claim" (--once): look again after a poll
+            raise skipped
+        return None
+
+    def _claim_in(self, job_path, spec):
+        done = set(os.listdir(os.path.join(job_path, DONE_DIR)))
+        leased = set(os.listdir(os.path.join(job_path, LEASES_DIR)))
+        now = None
+        for shot in spec['shots']:
+            shot_name = shot['shot']
+            if _done_name(shot_name) in done:
+                continue
+            if shot_name in leased:
+                if now is None:
+                    now = self._fs_now(job_path)
+                if not self._reclaim(job_path, shot_name, now):
+                    continue
+            lease = self._claim(job_path, shot)
+            if lease:
+                return lease
+        return None
+
+    def _claim(self, job_path, shot):
+        token = uuid.uuid4().hex
+        lease = Lease(job_path, shot, token)
+        try:
+            fd = os.open(lease.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY, 0o644)
+        except FileExistsError:
+            return None
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': token, 'worker': self.worker_id, 'host': socket.gethostname(), 'pid': os.getpid(),
+                       'claimed_at': datetime.now().isoformat(timespec='seconds')}, f)
+        if os.path.exists(os.path.join(job_path, DONE_DIR, _done_name(shot['shot']))):
+            # Finished and released between our scan and the claim
+            lease.release()
+            return None
+        with self._leases_lock:
+            self._leases.add(lease)
+        return lease
+
+    def _reclaim(self, job_path, shot_name, now):
+        # True when the lease was stale and has been moved out of the way
+        path = os.path.join(job_path, LEASES_DIR, shot_name)
+        try:
+            age = now - os.stat(path).st_mtime
+        except FileNotFoundError:
+            return True
+        if age < self.lease_timeout:
+            return False
+        owner = (_read_json(path) or {}).get('worker', 'unknown worker')
+        try:
+            # rename is atomic: of several workers reclaiming at once, one wins
+            os.rename(path, os.path.join(job_path, RECLAIMED_DIR, f"{shot_name}.{uuid.uuid4().hex}"))
+        except FileNotFoundError:
+            return True
+        logging.warning(f"Reclaimed {shot_name} from {owner} (no heartbeat for {age:.0f}s)")
+        metrics.count('leases_reclaimed')
+        return True
+
+    def _encode(self, lease):
+        from .processors.video_processor import _encode_shot
+
+        spec = self._specs.get(lease.job_path) or _read_json(os.path.join(lease.job_path, JOB_SPEC_NAME))
+        shot_name = lease.shot['shot']
+        outputs = os.path.join(lease.job_path, OUTPUTS_DIR)
+        # Private file names until the result is published: a worker that lost its
+        # lease must not overwrite the output of the one that reclaimed it
+        file_name = f".{shot_name}.{lease.token}.mp4"
+        review_size = tuple(spec['review_size']) if spec.get('review_size') else None
+        logging.info(f"Encoding {shot_name} ({lease.shot['nb_frames']} frames) "
+                     f"for job {os.path.basename(lease.job_path)}")
+
+        started = time.monotonic()
+        if os.path.exists(spec['video_path']):
+            error = _encode_shot(spec['video_path'], os.path.join(outputs, file_name), lease.shot['seek_time'],
+                                 lease.shot['nb_frames'], self.threads_per_job, review_size)
+        else:
+            error = f"Source video not reachable from {socket.gethostname()}: {spec['video_path']}"
+        elapsed = time.monotonic() - started
+
+        renames = {f"{shot_name}.mp4": file_name}
+        if review_size:
+            renames.update(_review_names(shot_name, file_name))
+        try:
+            if lease.lost or not lease.held():
+                logging.warning(f"Dropping {shot_name}: its lease was reclaimed while encoding")
+                return
+            if error is None:
+                for final_name, private_name in renames.items():
+                    if os.path.exists(os.path.join(outputs, private_name)):
+                        os.replace(os.path.join(outputs, private_name), os.path.join(outputs, final_name))
+                self.encoded += 1
+                metrics.count('shots_encoded')
+                logging.info(f"Encoded {shot_name} in {elapsed:.1f}s")
+            else:
+                logging.warning(f"Failed to encode {shot_name}: {error}")
+            _write_json(os.path.join(lease.job_path, DONE_DIR, _done_name(shot_name)), {
+                'status': RESULT_OK if error is None else RESULT_FAILED,
+                'error': error,
+                'seconds': elapsed,
+                'worker': self.worker_id
+            })
+            lease.release()
+        finally:
+            with self._leases_lock:
+                self._leases.discard(lease)
+            for private_name in renames.values():
+                path = os.path.join(outputs, private_name)
+                if os.path.exists(path):
+                    os.remove(path)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Kitsu Ingest distributed encode worker')
+    parser.prog = f"{parser.prog} worker"
+    parser.add_argument('--shared-dir', required=True, metavar='DIR',
+                        help='Shared folder the coordinators write jobs to (--video-mode distributed)')
+    parser.add_argument('-j', '--jobs', type=int,
+                        help='Shots encoded at the same time on this node (default: derived from CPU count)')
+    parser.add_argument('--threads-per-job', type=int,
+                        help='Encoder threads for each shot (default: CPU count divided by --jobs)')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between scans for shots to claim')
+    parser.add_argument('--lease-timeout', type=float, default=LEASE_TIMEOUT,
+                        help='Seconds without a heartbeat after which another worker takes over a shot')
+    parser.add_argument('--once', action='store_true',
+                        help='Exit when no shot is left to claim instead of waiting for new jobs')
+
+    args = parser.parse_args(argv)
+    if not os.path.isdir(args.shared_dir):
+        parser.error(f"--shared-dir folder not found: {args.shared_dir}")
+    if (args.jobs is not None and args.jobs < 1) or (args.threads_per_job is not None and args.threads_per_job < 1):
+        parser.error("--jobs and --threads-per-job must be at least 1")
+    if args.poll_interval <= 0:
+        parser.error("--poll-interval must be positive")
+    if args.lease_timeout <= HEARTBEAT_SECONDS * 2:
+        parser.error(f"--lease-timeout must be more than {HEARTBEAT_SECONDS * 2:g}s (two heartbeats)")
+
+    worker = EncodeWorker(args.shared_dir, jobs=args.jobs, threads_per_job=args.threads_per_job,
+                          poll_interval=args.poll_interval, once=args.once, lease_timeout=args.lease_timeout)
+    signal.signal(signal.SIGTERM, worker.stop)
+    signal.signal(signal.SIGINT, worker.stop)
+    worker.run()
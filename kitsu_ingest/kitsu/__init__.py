@@ -1,5 +1,13 @@
-from .auth import kitsu_login
-from .publisher import KitsuPublisher
+# Imported on first use: gazu and requests are only loaded when publishing
+def __getattr__(name):
+    if name == 'kitsu_login':
+        from .auth import kitsu_login
+        return kitsu_login
+    if name == 'KitsuPublisher':
+        from .publisher import KitsuPublisher
+        return KitsuPublisher
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 
 # Define what should be exposed when using "from kitsu import *"
-__all__ = ['kitsu_login', 'KitsuPublisher']
\ No newline at end of file
+__all__ = ['kitsu_login', 'KitsuPublisher']
@@ -1,22 +1,211 @@
 import os
+import json
+import time
+import base64
 import logging
+import threading
 import gazu
+import requests
 from dotenv import load_dotenv
+from requests.adapters import HTTPAdapter
+from ..utils.storage import cache_dir
+from ..utils.metrics import metrics
 
-def kitsu_login():
-    load_dotenv()
-    kitsu_server = os.getenv('KITSU_SERVER')
-    kitsu_email = os.getenv('KITSU_EMAIL')
-    kitsu_password = os.getenv('KITSU_PASSWORD')
+DEFAULT_POOL_SIZE = 10
 
-    if not all([kitsu_server, kitsu_email, kitsu_password]):
-        raise EnvironmentError("Missing one of KITSU_SERVER, KITSU_EMAIL, or KITSU_PASSWORD in .env")
+# Refresh tokens that expire within this many seconds instead of risking a 401 mid-run
+TOKEN_EXPIRY_MARGIN = 300
 
-    logging.info(f"Connecting to Kitsu server: {kitsu_server}")
+# Statuses gazu does not raise for (it only checks 500 and 502), sent by a throttle
+# or a proxy in front of Kitsu when the request was not served
+RETRYABLE_STATUSES = (429, 502, 503, 504)
+MAX_RETRY_AFTER = 60
+
+
+class RetryableStatusError(requests.exceptions.HTTPError):
+    def __init__(self, response):
+        super().__init__(f"{response.status_code} {response.reason} for {response.url}", response=response)
+        self.retry_after = _retry_after(response)
+
+
+def _retry_after(response):
+    # Seconds form of Retry-After only; HTTP dates are rare from throttles
+    try:
+        return min(MAX_RETRY_AFTER, max(0.0, float(response.headers.get('Retry-After', 0))))
+    except ValueError:
+        return 0.0
+
+
+def _raise_retryable(response, *args, **kwargs):
+    # requests response hook: fail before gazu parses a throttle's error page as a result
+    if response.status_code in RETRYABLE_STATUSES:
+        raise RetryableStatusError(response)
+
+
+# A cached session the server no longer accepts: revoked tokens get a 401 (after
+# gazu's own refresh attempt fails), tokens signed before a secret rotation a 422
+REJECTED_SESSION_ERRORS = (gazu.exception.NotAuthenticatedException, gazu.exception.ValidationException)
+
+_active_session = None
+_session_lock = threading.Lock()
+
+
+def _token_expiry(token):
+    # JWT "exp" claim, read locally so checking a cached token costs no round trip
     try:
-        gazu.set_host(kitsu_server)
-        gazu.log_in(kitsu_email, kitsu_password)
-        logging.info("Successfully logged in to Kitsu")
+        payload = token.split('.')[1]
+        payload += '=' * (-len(payload) % 4)
+        return json.loads(base64.urlsafe_b64decode(payload)).get('exp', 0)
+    except (AttributeError, IndexError, ValueError):
+        return 0
+
+
+def _is_fresh(token):
+    return bool(token) and _token_expiry(token) > time.time() + TOKEN_EXPIRY_MARGIN
+
+
+class KitsuSession:
+    # Keeps access/refresh tokens on disk between runs and one pooled keep-alive
+    # HTTP session (gazu's default client) for every gazu call in the process.
+    def __init__(self, server, email, path=None):
+        self.server = server
+        self.email = email
+        self.path = path or os.path.join(cache_dir(), 'session.json')
+        self.pool_size = 0
+        self.client = gazu.client.default_client
+        self._save_lock = threading.Lock()
+
+    def configure_pool(self, pool_size):
+        # One connection per concurrent publisher worker, reused across requests. Only ever grows.
+        if pool_size <= self.pool_size:
+            return
+        self.pool_size = pool_size
+        adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size)
+        self.client.session.mount('http://', adapter)
+        self.client.session.mount('https://', adapter)
+
+    def _load_tokens(self):
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('server') != self.server or data.get('email') != self.email:
+            return None
+        return data.get('tokens')
+
+    def _save_tokens(self):
+        tokens = {
+            'access_token': self.client.access_token,
+            'refresh_token': self.client.refresh_token
+        }
+        # Owner-only permissions: the tokens grant the same access as the password
+        with self._save_lock:
+            fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w') as f:
+                json.dump({'server': self.server, 'email': self.email, 'tokens': tokens}, f)
+            os.chmod(self.path, 0o600)
+
+    def _forget_tokens(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logging.warning(f"Could not remove cached Kitsu session {self.path}: {e}")
+
+    def _save_refreshed_tokens(self):
+        # gazu refreshes an expired access token by itself during long runs (publisher
+        # workers included): keep the new one so the next run does not start stale
+        refresh = self.client.refresh_access_token
+        if getattr(refresh, '_saves_tokens', False):
+            return
+
+        def refresh_and_save(*args, **kwargs):
+            tokens = refresh(*args, **kwargs)
+            try:
+                self._save_tokens()
+            except OSError as e:
+                logging.warning(f"Could not cache refreshed Kitsu session tokens: {e}")
+            return tokens
+
+        refresh_and_save._saves_tokens = True
+        self.client.refresh_access_token = refresh_and_save
+
+    def _resume(self):
+        tokens = self._load_tokens()
+        if not tokens:
+            return False
+
+        gazu.client.set_tokens(dict(tokens), client=self.client)
+        if _is_fresh(tokens.get('access_token')):
+            # An unexpired token can still have been revoked (logout elsewhere, server
+            # reinstalled or its secret rotated): one cheap call tells
+            try:
+                gazu.client.get_current_user(client=self.client)
+            except REJECTED_SESSION_ERRORS as e:
+                logging.info(f"Cached Kitsu session was rejected, logging in again: {e}")
+                self._forget_tokens()
+                return False
+            logging.info("Reusing cached Kitsu session")
+            return True
+
+        if _is_fresh(tokens.get('refresh_token')):
+            try:
+                # Saved by the _save_refreshed_tokens hook
+                gazu.refresh_access_token(client=self.client)
+                logging.info("Refreshed cached Kitsu session")
+                return True
+            except gazu.exception.GazuException as e:
+                logging.info(f"Could not refresh cached Kitsu session: {e}")
+        self._forget_tokens()
+        return False
+
+    def login(self, password):
+        gazu.set_host(self.server, client=self.client)
+        if _raise_retryable not in self.client.session.hooks['response']:
+            self.client.session.hooks['response'].append(_raise_retryable)
+        # Let gazu refresh the access token itself if it expires during a long run
+        self.client.use_refresh_token = True
+        self._save_refreshed_tokens()
+
+        if self._resume():
+            return True
+
+        gazu.log_in(self.email, password, client=self.client)
+        try:
+            self._save_tokens()
+        except OSError as e:
+            logging.warning(f"Could not cache Kitsu session tokens: {e}")
         return True
-    except Exception as e:
-        raise RuntimeError("Kitsu login failed. Check your credentials or host address.") from e
\ No newline at end of file
+
+
+def kitsu_login(pool_size=DEFAULT_POOL_SIZE):
+    global _active_session
+
+    with _session_lock:
+        if _active_session is not None:
+            # Already logged in in this process: only grow the connection pool if needed
+            _active_session.configure_pool(pool_size)
+            return True
+
+        load_dotenv()
+        kitsu_server = os.getenv('KITSU_SERVER')
+        kitsu_email = os.getenv('KITSU_EMAIL')
+        kitsu_password = os.getenv('KITSU_PASSWORD')
+
+        if not all([kitsu_server, kitsu_email, kitsu_password]):
+            raise EnvironmentError("Missing one of KITSU_SERVER, KITSU_EMAIL, or KITSU_PASSWORD in .env")
+
+        logging.info(f"Connecting to Kitsu server: {kitsu_server}")
+        # Count and time every request per endpoint, including the ones gazu makes internally
+        metrics.instrument(gazu.client, ('get', 'post', 'put', 'delete', 'upload'))
+        session = KitsuSession(kitsu_server, kitsu_email)
+        session.configure_pool(pool_size)
+        try:
+            session.login(kitsu_password)
+            logging.info("Successfully logged in to Kitsu")
+            _active_session = session
+            return True
+        except Exception as e:
+            raise RuntimeError("Kitsu login failed. Check your credentials or host address.") from e
@@ -0,0 +1,53 @@
+import os
+import sqlite3
+import logging
+import threading
+from datetime import datetime, timezone
+from ..utils.storage import cache_dir
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS publishes (
+    task_id TEXT NOT NULL,
+    file_hash TEXT NOT NULL,
+    shot_name TEXT NOT NULL,
+    preview_id TEXT,
+    project TEXT,
+    sequence TEXT,
+    published_at TEXT NOT NULL,
+    PRIMARY KEY (task_id, file_hash)
+)
+"""
+
+
+# Durable record of successful publishes, so a re-run after a crash skips what already made it to Kitsu
+class PublishLedger:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), 'publish_ledger.sqlite3')
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(SCHEMA)
+        logging.info(f"Using publish ledger: {self.path}")
+
+    def is_published(self, task_id, file_hash):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM publishes WHERE task_id = ? AND file_hash = ?", (task_id, file_hash)
+            ).fetchone()
+        return row is not None
+
+    def record(self, shot_name, task_id, preview_id, file_hash, project=None, sequence=None):
+        published_at = datetime.now(timezone.utc).isoformat()
+        # Commit per shot: an entry must survive a crash on the very next shot
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO publishes "
+                "(task_id, file_hash, shot_name, preview_id, project, sequence, published_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (task_id, file_hash, shot_name, preview_id, project, sequence, published_at)
+            )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,83 @@
+import os
+import json
+import time
+import hashlib
+import logging
+import threading
+from ..utils.storage import cache_dir
+
+# Seconds before each kind of lookup is fetched again. Names and ids of projects,
+# task types and statuses almost never change; shot and task lists do.
+DEFAULT_TTLS = {
+    'project': 24 * 3600,
+    'sequence': 24 * 3600,
+    'task_type': 7 * 24 * 3600,
+    'task_status': 7 * 24 * 3600,
+    'shots': 10 * 60,
+    'tasks': 10 * 60
+}
+
+_shared = {}
+_shared_lock = threading.Lock()
+
+
+# On-disk cache of Kitsu lookups, one file per server and project
+class MetadataCache:
+    def __init__(self, server, project_name, ttls=None, refresh=False, path=None):
+        key = hashlib.sha1(f"{server}|{project_name}".encode('utf-8')).hexdigest()[:16]
+        self.path = path or os.path.join(cache_dir('metadata'), f"{key}.json")
+        self.ttls = {**DEFAULT_TTLS, **(ttls or {})}
+        self.refresh = refresh
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable metadata cache {self.path}: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.path)
+
+    def get(self, kind, name, fetch):
+        with self._lock:
+            entry = self._entries.get(kind, {}).get(name)
+            if entry and not self.refresh and time.time() - entry['fetched_at'] < self.ttls[kind]:
+                self.hits += 1
+                return entry['value']
+
+        value = fetch()
+        with self._lock:
+            self.misses += 1
+            # Never cache a miss: a project or shot created a minute later must be found
+            if value:
+                self._entries.setdefault(kind, {})[name] = {'fetched_at': time.time(), 'value': value}
+                self._save()
+        return value
+
+    def invalidate(self, *kinds):
+        with self._lock:
+            for kind in kinds:
+                self._entries.pop(kind, None)
+            self._save()
+
+
+def shared_cache(server, project_name, refresh=False):
+    # One instance per server and project for the whole process: a long-running
+    # process (serve mode) keeps its lookups in memory between jobs, and concurrent
+    # jobs share one lock instead of racing on the cache file.
+    with _shared_lock:
+        cache = _shared.get((server, project_name))
+        if cache is None:
+            cache = _shared[(server, project_name)] = MetadataCache(server, project_name, refresh=refresh)
+        return cache
@@ -0,0 +1,74 @@
+import queue
+import logging
+import threading
+
+DEFAULT_QUEUE_SIZE = 4
+
+
+class PublishPipeline:
+    # Publishes shots while later shots are still encoding. The queue is bounded,
+    # so submit() blocks the encoder whenever uploads fall behind.
+    def __init__(self, publisher, queue_size=DEFAULT_QUEUE_SIZE, on_published=None):
+        self.publisher = publisher
+        self.on_published = on_published
+        self.workers = publisher.workers
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.stats = publisher.new_stats()
+        self._threads = []
+        # (shot_name, exception) raised by publish_shot or on_published, re-raised by close()
+        self.errors = []
+        self._errors_lock = threading.Lock()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        # An error in the block wins over the publish errors, which are logged already
+        self.close(raise_errors=exc_type is None)
+
+    def start(self):
+        for idx in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"publish-{idx}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logging.info(f"Publish pipeline started with {self.workers} workers, queue size {self.queue.maxsize}")
+
+    def submit(self, shot_name, video_path):
+        self.queue.put((shot_name, video_path))
+
+    def close(self, raise_errors=True):
+        for _ in self._threads:
+            self.queue.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        if raise_errors and self.errors:
+            shot_name, error = self.errors[0]
+            raise RuntimeError(f"Publishing failed unexpectedly for {len(self.errors)} shots, "
+                               f"first {shot_name}: {error}") from error
+        return self.stats
+
+    def _worker(self):
+        # Never dies on an item: a dead worker would leave submit() and close() blocked
+        # on the bounded queue forever
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            shot_name, video_path = item
+            try:
+                outcome = self.publisher.publish_shot(shot_name, video_path, self.stats)
+            except Exception as e:
+                outcome = self.publisher.count_failed(self.stats, shot_name, e)
+                self._record_error(shot_name, e)
+            if self.on_published:
+                try:
+                    self.on_published(shot_name, video_path, outcome)
+                except Exception as e:
+                    logging.error(f"Publish callback failed for {shot_name}: {e}")
+                    self._record_error(shot_name, e)
+
+    def _record_error(self, shot_name, error):
+        with self._errors_lock:
+            self.errors.append((shot_name, error))
@@ -1,28 +1,114 @@
 import os
+import time
+import random
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import gazu
-from .auth import kitsu_login
+import requests
+import urllib3
+from .auth import kitsu_login, DEFAULT_POOL_SIZE, RetryableStatusError
+from .metadata_cache import shared_cache
+from ..options import SYNC_IMPORT, SYNC_DIFF, DEFAULT_RETRIES
+from ..processors.review import proxy_path
+from ..processors.verify import verify_outputs, describe
+from ..utils.hashing import hash_file, hash_files
+from ..utils.history import KIND_UPLOAD
+from ..utils.metrics import metrics
 from ..utils.validation import safety_check_kitsu_vs_local_mp4, safety_check_matching_metadata, build_data_dicts, \
-    fetch_shot_name_from_tasks
+    fetch_shot_name_from_tasks, kitsu_shot_table, local_shot_table, resolve_mismatches, MISMATCH_ABORT
 
 TASK_TYPE_NAME = "From EVEREST"
 TASK_STATUS_NAME = "Done"
 
+SYNC_FIELDS = ("frame_in", "frame_out", "nb_frames", "fps", "description")
+
+DEFAULT_BACKOFF = 1.0
+
+# Failures worth retrying: the server or the network, not bad input. gazu only
+# raises for 500 and 502; auth.RetryableStatusError covers 429, 503 and 504.
+TRANSIENT_ERRORS = (
+    gazu.exception.ServerErrorException,
+    RetryableStatusError,
+    gazu.exception.UploadFailedException,
+    requests.exceptions.ConnectionError,
+    requests.exceptions.Timeout
+)
+
+# Failures of a request that never left this machine: resending it cannot duplicate anything
+UNSENT_ERRORS = (
+    requests.exceptions.ConnectTimeout,
+    urllib3.exceptions.NewConnectionError,
+    urllib3.exceptions.ConnectTimeoutError
+)
+
+PUBLISH_COMMENT = "Auto-published preview."
+
+
+def _unsent(error):
+    # requests wraps urllib3's connect errors: MaxRetryError(reason=NewConnectionError)
+    if isinstance(error, UNSENT_ERRORS):
+        return True
+    cause = error.args[0] if isinstance(error, requests.exceptions.ConnectionError) and error.args else None
+    return isinstance(getattr(cause, 'reason', cause), UNSENT_ERRORS)
+
 
 class KitsuPublisher:
-    def __init__(self, project_name, sequence_name):
+    def __init__(self, project_name, sequence_name, workers=1, retries=DEFAULT_RETRIES, backoff=DEFAULT_BACKOFF,
+                 ledger=None, force=False, use_cache=True, refresh_cache=False, pool_size=None,
+                 sync_mode=SYNC_IMPORT, on_mismatch=MISMATCH_ABORT, verify=False, history=None):
         self.project_name = project_name
         self.sequence_name = sequence_name
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.ledger = ledger
+        self.force = force
+        self.file_hashes = {}
+        self.use_cache = use_cache
+        self.refresh_cache = refresh_cache
+        self.cache = None
+        self.pool_size = pool_size or max(DEFAULT_POOL_SIZE, workers)
+        self.sync_mode = sync_mode
+        self.on_mismatch = on_mismatch
+        self.excluded_shots = set()
+        # Probe the MP4s of publish_previews against the shot table first (see verify.py)
+        self.verify = verify
+        self.rejected_shots = {}
+        # ThroughputHistory that measured uploads are added to
+        self.history = history
         self.project = None
         self.sequence = None
         self.kitsu_data = None
         self.local_data = None
+        self.task_type = None
+        self.task_status = None
+        self.shots_from_sequence = None
+        self.shot_task_map = {}
+        self._stats_lock = threading.Lock()
+
+    def _cached(self, kind, name, fetch):
+        if self.cache is None:
+            return fetch()
+        return self.cache.get(kind, name, fetch)
 
+    @metrics.span('kitsu.connect')
     def connect(self):
-        kitsu_login()
+        kitsu_login(pool_size=self.pool_size)
+        if self.use_cache:
+            self.cache = shared_cache(gazu.client.get_host(), self.project_name, refresh=self.refresh_cache)
         try:
-            self.project = gazu.project.get_project_by_name(self.project_name)
-            self.sequence = gazu.shot.get_sequence_by_name(self.project, self.sequence_name)
+            self.project = self._cached(
+                'project', self.project_name,
+                lambda: gazu.project.get_project_by_name(self.project_name)
+            )
+            if not self.project:
+                logging.warning(f"Project '{self.project_name}' not found")
+                return False
+            self.sequence = self._cached(
+                'sequence', self.sequence_name,
+                lambda: gazu.shot.get_sequence_by_name(self.project, self.sequence_name)
+            )
             logging.info(f"Connected to project '{self.project_name}', sequence '{self.sequence_name}'")
             return True
         except gazu.exception.RouteNotFoundException as e:
@@ -32,67 +118,355 @@ class KitsuPublisher:
     def import_shots_from_csv(self, csv_path):
         logging.info(f"Importing shots from CSV: {csv_path}")
         gazu.shot.import_shots_with_csv(self.project, csv_path)
+        if self.cache:
+            # The import creates shots and their tasks
+            self.cache.invalidate('shots', 'tasks')
         logging.info("Shot import complete")
 
-    def publish_previews(self, output_dir):
-        logging.info("Preparing to publish previews...")
-        task_type = gazu.task.get_task_type_by_name(TASK_TYPE_NAME)
-        task_status = gazu.task.get_task_status_by_name(TASK_STATUS_NAME)
+    @metrics.span('kitsu.push_shots')
+    def push_shots(self, csv_path, shot_table=None):
+        if self.sync_mode == SYNC_DIFF:
+            return self.sync_shots_from_csv(csv_path, shot_table)
+        return self.import_shots_from_csv(csv_path)
+
+    def sync_shots_from_csv(self, csv_path, shot_table=None):
+        # Create missing shots and update changed ones with targeted calls, instead of
+        # having the server re-process the whole CSV
+        logging.info(f"Syncing shots from CSV: {csv_path}")
+        shots = gazu.shot.all_shots_for_sequence(self.sequence)
+        shots_by_name = {shot["name"]: shot for shot in shots}
+        kitsu_data, local_data = build_data_dicts(shots, csv_path if shot_table is None else shot_table)
 
-        shots_from_sequence = gazu.shot.all_shots_for_sequence(self.sequence)
-        all_tasks = gazu.task.all_tasks_for_project(self.project, task_type)
-        shot_task_map = fetch_shot_name_from_tasks(all_tasks)
+        report = {"created": [], "updated": {}, "unchanged": 0}
+
+        for shot_name, local in local_data.items():
+            local = {**local, "description": _text(local["description"])}
+            kitsu = kitsu_data.get(shot_name)
+
+            if kitsu is None:
+                gazu.shot.new_shot(
+                    self.project, self.sequence, shot_name,
+                    nb_frames=local["nb_frames"],
+                    frame_in=local["frame_in"],
+                    frame_out=local["frame_out"],
+                    description=local["description"],
+                    data={"fps": local["fps"]}
+                )
+                report["created"].append(shot_name)
+                continue
+
+            changes = {
+                field: {"kitsu": kitsu[field], "csv": local[field]}
+                for field in SYNC_FIELDS if _differs(kitsu[field], local[field])
+            }
+            if not changes:
+                report["unchanged"] += 1
+                continue
+
+            shot = shots_by_name[shot_name]
+            gazu.shot.update_shot({
+                "id": shot["id"],
+                "nb_frames": local["nb_frames"],
+                "description": local["description"],
+                "data": {
+                    **(shot.get("data") or {}),
+                    "frame_in": local["frame_in"],
+                    "frame_out": local["frame_out"],
+                    "fps": local["fps"]
+                }
+            })
+            report["updated"][shot_name] = changes
+
+        if report["created"]:
+            self._create_publish_tasks(report["created"])
+        if self.cache and (report["created"] or report["updated"]):
+            self.cache.invalidate('shots', 'tasks')
+
+        logging.info(f"Shot sync complete. Created: {len(report['created'])}, "
+                     f"Updated: {len(report['updated'])}, Unchanged: {report['unchanged']}")
+        for shot_name in report["created"]:
+            logging.info(f"  created {shot_name}")
+        for shot_name, changes in report["updated"].items():
+            summary = ", ".join(f"{field} {change['kitsu']} → {change['csv']}" for field, change in changes.items())
+            logging.info(f"  updated {shot_name}: {summary}")
+        return report
+
+    def _create_publish_tasks(self, shot_names):
+        # Shots created one by one do not get the publish task the CSV import would give them
+        task_type = self._cached(
+            'task_type', TASK_TYPE_NAME, lambda: gazu.task.get_task_type_by_name(TASK_TYPE_NAME)
+        )
+        shots = gazu.shot.all_shots_for_sequence(self.sequence)
+        tasks = gazu.task.all_tasks_for_sequence(self.sequence)
+        has_task = {task["entity_id"] for task in tasks if task.get("task_type_id") == task_type["id"]}
+
+        for shot in shots:
+            if shot["name"] in shot_names and shot["id"] not in has_task:
+                gazu.task.new_task(shot, task_type)
+
+    @metrics.span('kitsu.prepare')
+    def prepare_publish(self):
+        # Everything publishing needs from Kitsu, fetched once before the first upload
+        self.task_type = self._cached(
+            'task_type', TASK_TYPE_NAME, lambda: gazu.task.get_task_type_by_name(TASK_TYPE_NAME)
+        )
+        self.task_status = self._cached(
+            'task_status', TASK_STATUS_NAME, lambda: gazu.task.get_task_status_by_name(TASK_STATUS_NAME)
+        )
+        self.shots_from_sequence = self._cached(
+            'shots', self.sequence["id"], lambda: gazu.shot.all_shots_for_sequence(self.sequence)
+        )
+
+        # Only the target sequence's tasks, resolved against the shots fetched above
+        sequence_tasks = self._cached(
+            'tasks', self.sequence["id"], lambda: gazu.task.all_tasks_for_sequence(self.sequence)
+        )
+        tasks = [task for task in sequence_tasks if task.get("task_type_id") == self.task_type["id"]]
+        self.shot_task_map = fetch_shot_name_from_tasks(tasks, self.shots_from_sequence)
+
+    @metrics.span('kitsu.validate')
+    def validate(self, shot_table, mp4_files, report_dir=None):
+        self.kitsu_data, self.local_data = build_data_dicts(self.shots_from_sequence, shot_table)
+
+        # Perform safety checks
+        report = safety_check_kitsu_vs_local_mp4(self.kitsu_data, mp4_files)
+        report.update(safety_check_matching_metadata(
+            kitsu_shot_table(self.shots_from_sequence), local_shot_table(shot_table)
+        ))
+        self.excluded_shots = resolve_mismatches(report, self.on_mismatch, report_dir)
+        return report
+
+    def new_stats(self):
+        return {"matched": 0, "unmatched": 0, "failed": 0, "skipped": 0, "excluded": 0, "retries": 0,
+                "timings": {}, "errors": {}}
+
+    def _count(self, stats, key, amount=1):
+        # Publisher workers share one stats dict
+        with self._stats_lock:
+            stats[key] += amount
+
+    def count_failed(self, stats, shot_name, error):
+        logging.error(f"Failed to publish preview for {shot_name}: {error}")
+        self._count(stats, "failed")
+        metrics.count('shots_failed')
+        with self._stats_lock:
+            stats["errors"][shot_name] = str(error)
+        return "failed"
+
+    def _with_retries(self, step, shot_name, stats, func, *args, recover=None, **kwargs):
+        # Exponential backoff with jitter so concurrent workers do not retry in lockstep.
+        # recover: for requests that create something (POSTs), looks up what an attempt
+        # that failed after reaching the server created, so a retry reuses it instead
+        # of creating it twice
+        maybe_sent = False
+        for attempt in range(self.retries + 1):
+            try:
+                if maybe_sent:
+                    found = recover()
+                    if found is not None:
+                        logging.info(f"{step} for {shot_name} went through despite the error, reusing it")
+                        return found
+                return func(*args, **kwargs)
+            except TRANSIENT_ERRORS as e:
+                maybe_sent = maybe_sent or (recover is not None and not _unsent(e))
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt + random.uniform(0, self.backoff)
+                # A throttling server says how long to wait
+                delay = max(delay, getattr(e, 'retry_after', 0))
+                logging.warning(f"{step} failed for {shot_name} ({e}), retrying in {delay:.1f}s "
+                                f"[{attempt + 1}/{self.retries}]")
+                self._count(stats, "retries")
+                metrics.count('retries', step=step)
+                time.sleep(delay)
+
+    def publish_shot(self, shot_name, video_path, stats):
+        # Returns the stats key the shot was counted under
+        if shot_name in self.excluded_shots:
+            logging.info(f"Metadata mismatch, not publishing: {shot_name}")
+            self._count(stats, "excluded")
+            return "excluded"
+
+        if shot_name in self.rejected_shots:
+            logging.warning(f"Failed verification, not publishing: {shot_name}")
+            self._count(stats, "failed")
+            with self._stats_lock:
+                stats["errors"][shot_name] = f"Verification failed: {self.rejected_shots[shot_name]}"
+            return "failed"
+
+        task = self.shot_task_map.get(shot_name)
+
+        if not task:
+            logging.warning(f"No matching Kitsu task found for shot: {shot_name}")
+            self._count(stats, "unmatched")
+            return "unmatched"
+
+        if not os.path.exists(video_path):
+            logging.warning(f"Video file not found: {video_path}")
+            self._count(stats, "unmatched")
+            return "unmatched"
+
+        try:
+            upload_path, normalize = self._upload_file(video_path)
+            file_hash = None
+            published = False
+            if self.ledger:
+                file_hash = self.file_hashes.get(upload_path) or hash_file(upload_path)
+                published = not self.force and self.ledger.is_published(task["id"], file_hash)
+        except Exception as e:
+            # An unreadable file or ledger fails this shot, never the whole publish
+            return self.count_failed(stats, shot_name, e)
+        if published:
+            logging.info(f"Already published, skipping: {shot_name}")
+            self._count(stats, "skipped")
+            metrics.count('ledger_skipped')
+            return "skipped"
+
+        logging.info(f"Publishing {'review proxy' if not normalize else 'preview'} for: {shot_name}")
+        started = time.monotonic()
+
+        try:
+            # Each step is retried on its own, so a failed upload never adds a second comment or
+            # revision. The comment and revision POSTs are only resent when they cannot have
+            # reached Kitsu; otherwise what a lost response created is looked up and reused.
+            comment = self._with_retries(
+                "Comment", shot_name, stats, gazu.task.add_comment,
+                task=task,
+                task_status=self.task_status,
+                comment=PUBLISH_COMMENT,
+                recover=lambda: self._posted_comment(task)
+            )
+            preview = self._with_retries(
+                "Preview creation", shot_name, stats, gazu.task.create_preview, task, comment,
+                recover=lambda: self._posted_preview(task, comment)
+            )
+            upload_started = time.monotonic()
+            preview = self._with_retries(
+                "Upload", shot_name, stats, gazu.task.upload_preview_file,
+                preview, upload_path, normalize_movie=normalize
+            )
+            self._record_upload(upload_path, time.monotonic() - upload_started, normalize)
+            self._with_retries("Set main preview", shot_name, stats, gazu.task.set_main_preview, preview)
+            if self.ledger:
+                self.ledger.record(shot_name, task["id"], preview.get("id"), file_hash,
+                                   project=self.project_name, sequence=self.sequence_name)
+            self._count(stats, "matched")
+            metrics.count('shots_published')
+            return "matched"
+        except Exception as e:
+            return self.count_failed(stats, shot_name, e)
+        finally:
+            elapsed = time.monotonic() - started
+            with self._stats_lock:
+                stats["timings"][shot_name] = elapsed
+            metrics.observe('publish_shot_seconds', elapsed)
+
+    def _posted_comment(self, task):
+        # The task's latest comment is ours if it has our text and status but no preview
+        # yet: a comment left by an earlier publish carries its preview
+        comments = gazu.task.all_comments_for_task(task)
+        last = comments[0] if comments else None
+        if (last and last.get("text") == PUBLISH_COMMENT and not last.get("previews")
+                and last.get("task_status_id") == self.task_status["id"]):
+            return last
+        return None
+
+    @staticmethod
+    def _posted_preview(task, comment):
+        for posted in gazu.task.all_comments_for_task(task):
+            if posted["id"] == comment["id"] and posted.get("previews"):
+                preview = posted["previews"][-1]
+                # Kitsu lists preview dicts, the stand-in their ids
+                return preview if isinstance(preview, dict) else {"id": preview}
+        return None
+
+    @staticmethod
+    def _upload_file(video_path):
+        # A review proxy is already in Kitsu's format: upload it as is and let the
+        # server skip its transcode. Without one, the server normalizes the shot file.
+        review_proxy = proxy_path(video_path)
+        if os.path.exists(review_proxy):
+            return review_proxy, False
+        return video_path, True
+
+    def _record_upload(self, video_path, elapsed, normalize=True):
+        size = os.path.getsize(video_path)
+        metrics.count('upload_bytes', size)
+        metrics.count('uploads', file='shot' if normalize else 'proxy')
+        metrics.observe('upload_seconds', elapsed)
+        if elapsed > 0:
+            metrics.observe('upload_mbps', size / 1024 ** 2 / elapsed)
+        if self.history:
+            self.history.add(KIND_UPLOAD, bytes=size, seconds=elapsed, file='shot' if normalize else 'proxy',
+                             workers=self.workers)
+
+    @metrics.span('publish.verify')
+    def verify_files(self, output_dir, mp4_files):
+        # Files in a folder were encoded elsewhere: a shot that fails can only be held back
+        expected = {}
+        for file_name in mp4_files:
+            shot = self.local_data.get(os.path.splitext(file_name)[0])
+            try:
+                expected[os.path.join(output_dir, file_name)] = (int(shot["nb_frames"]), float(shot["fps"]))
+            except (TypeError, ValueError):
+                # Not in the CSV, or no length to check against: validation reports those
+                continue
+
+        logging.info(f"Verifying {len(expected)} MP4 files against the shot table...")
+        failures = verify_outputs(expected)
+        self.rejected_shots = {
+            os.path.splitext(os.path.basename(path))[0]: describe(problems) for path, problems in failures.items()
+        }
+        for shot_name, problem in sorted(self.rejected_shots.items()):
+            logging.warning(f"Verification failed for {shot_name}: {problem}")
+        metrics.count('verify_failed', len(self.rejected_shots))
+        return self.rejected_shots
+
+    @metrics.span('publish')
+    def publish_previews(self, output_dir, shot_table=None):
+        logging.info("Preparing to publish previews...")
+        self.prepare_publish()
 
         mp4_files = [f for f in os.listdir(output_dir) if f.endswith(".mp4")]
         logging.info(f"Found {len(mp4_files)} MP4 files to publish")
 
         # Build data dictionaries for validation
-        processed_csv_files = [f for f in os.listdir(output_dir) if f.endswith(".csv")]
-        if processed_csv_files:
-            processed_csv_path = os.path.join(output_dir, processed_csv_files[0])
-            self.kitsu_data, self.local_data = build_data_dicts(shots_from_sequence, processed_csv_path)
+        if shot_table is None:
+            processed_csv_files = [f for f in os.listdir(output_dir) if f.endswith(".csv")]
+            if not processed_csv_files:
+                raise FileNotFoundError("No CSV file found for validation. Process aborted.")
+            shot_table = os.path.join(output_dir, processed_csv_files[0])
+        self.validate(shot_table, mp4_files, report_dir=output_dir)
+        if self.verify:
+            self.verify_files(output_dir, mp4_files)
 
-            # Perform safety checks
-            safety_check_kitsu_vs_local_mp4(self.kitsu_data, mp4_files)
-            safety_check_matching_metadata(self.kitsu_data, self.local_data)
-        else:
-            raise FileNotFoundError("No CSV file found for validation. Process aborted.")
+        stats = self.new_stats()
 
-        stats = {"matched": 0, "unmatched": 0, "failed": 0}
+        if self.ledger:
+            logging.info("Hashing MP4 files for the publish ledger...")
+            self.file_hashes = hash_files(self._upload_file(os.path.join(output_dir, f))[0] for f in mp4_files)
 
-        for file_name in mp4_files:
-            shot_name = os.path.splitext(file_name)[0]
-            task = shot_task_map.get(shot_name)
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = [
+                executor.submit(self.publish_shot, os.path.splitext(file_name)[0],
+                                os.path.join(output_dir, file_name), stats)
+                for file_name in mp4_files
+            ]
+        # publish_shot counts its own failures; anything else it raised is a bug, not a failed shot
+        for future in futures:
+            future.result()
 
-            if not task:
-                logging.warning(f"No matching Kitsu task found for shot: {shot_name}")
-                stats["unmatched"] += 1
-                continue
+        return stats
 
-            video_path = os.path.join(output_dir, file_name)
-            if not os.path.exists(video_path):
-                logging.warning(f"Video file not found: {video_path}")
-                stats["unmatched"] += 1
-                continue
 
-            logging.info(f"Publishing preview for: {shot_name}")
+def _text(value):
+    # Empty CSV cells come back from pandas as NaN
+    return "" if value is None or value != value else str(value)
 
-            try:
-                comment = gazu.task.add_comment(
-                    task=task,
-                    task_status=task_status,
-                    comment="Auto-published preview."
-                )
-                preview = gazu.task.add_preview(
-                    task=task,
-                    comment=comment,
-                    preview_file_path=video_path,
-                    normalize_movie=True
-                )
-                gazu.task.set_main_preview(preview)
-                stats["matched"] += 1
-            except Exception as e:
-                logging.error(f"Failed to publish preview for {shot_name}: {e}")
-                stats["failed"] += 1
 
-        return stats
\ No newline at end of file
+def _differs(kitsu_value, csv_value):
+    if isinstance(csv_value, float):
+        return abs(csv_value - float(kitsu_value or 0)) >= 1e-3
+    if isinstance(csv_value, str):
+        return (kitsu_value or "") != csv_value
+    return kitsu_value != csv_value
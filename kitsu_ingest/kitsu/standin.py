@@ -0,0 +1,507 @@
+import io
+import re
+import csv
+import json
+import time
+import uuid
+import base64
+import random
+import logging
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import urlsplit, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+API_PREFIX = '/api'
+
+# Lifetime of the tokens handed out by the stand-in, long enough for any benchmark
+TOKEN_LIFETIME = 24 * 3600
+
+DEFAULT_TASK_TYPE = "From EVEREST"
+DEFAULT_TASK_STATUS = "Done"
+
+DEFAULT_PORT = 5000
+
+# Request bodies are read in chunks of this size when the bandwidth is capped
+READ_CHUNK_SIZE = 64 * 1024
+
+_ID = r'(?P<{}>[0-9a-f-]{{36}})'
+
+
+def _new_id():
+    return str(uuid.uuid4())
+
+
+def _token(kind):
+    # Unsigned JWT-shaped token: auth.py only reads the "exp" claim
+    def part(data):
+        return base64.urlsafe_b64encode(json.dumps(data).encode('utf-8')).rstrip(b'=').decode('ascii')
+    return f"{part({'alg': 'none'})}.{part({'type': kind, 'exp': int(time.time()) + TOKEN_LIFETIME})}.standin"
+
+
+def _multipart_parts(body, content_type):
+    # {field name: content} of a multipart/form-data body, as sent by gazu uploads
+    message = BytesParser(policy=HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body
+    )
+    return {part.get_param('name', header='content-disposition'): part.get_payload(decode=True)
+            for part in message.iter_parts()}
+
+
+def _route(method, pattern):
+    # Named groups in the pattern become handler keyword arguments
+    regex = re.compile('^' + pattern.format(**{name: _ID.format(name) for name in
+                                               ('project_id', 'sequence_id', 'task_id', 'comment_id',
+                                                'preview_id', 'entity_id')}) + '$')
+
+    def register(func):
+        func._route = (method, regex)
+        return func
+    return register
+
+
+# In-memory stand-in for the part of the Kitsu (Zou) API that kitsu-ingest uses.
+# Serves gazu over plain HTTP with simulated latency, throttling, server errors and
+# a capped upload bandwidth, so whole ingests run offline at realistic scale.
+class KitsuStandin:
+    def __init__(self, latency=0.0, jitter=0.0, max_concurrency=None, rate_limit=None, error_rate=0.0,
+                 upload_error_rate=None, bandwidth=None, normalize_rate=None):
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit = rate_limit
+        self.error_rate = error_rate
+        self.upload_error_rate = error_rate if upload_error_rate is None else upload_error_rate
+        self.bandwidth = bandwidth
+        # Bytes per second of the simulated server-side transcode (uploads without normalize=false)
+        self.normalize_rate = normalize_rate
+        self.normalize_seconds = 0.0
+        self._slots = threading.BoundedSemaphore(max_concurrency) if max_concurrency else None
+        self._lock = threading.Lock()
+        self._next_slot = 0.0
+        self._next_byte_slot = 0.0
+        self.requests = 0
+        self.errors = 0
+        self.projects = {}
+        self.sequences = {}
+        self.shots = {}
+        self.tasks = {}
+        self.task_types = {}
+        self.task_statuses = {}
+        self.comments = {}
+        self.previews = {}
+        self.routes = [getattr(self, name)._route + (getattr(self, name),)
+                       for name in dir(self) if hasattr(getattr(self, name), '_route')]
+
+    def add_project(self, name):
+        project = {"id": _new_id(), "type": "Project", "name": name}
+        self.projects[project["id"]] = project
+        return project
+
+    def add_sequence(self, project, name):
+        sequence = {"id": _new_id(), "type": "Sequence", "name": name, "project_id": project["id"]}
+        self.sequences[sequence["id"]] = sequence
+        return sequence
+
+    def add_task_type(self, name, for_entity="Shot"):
+        task_type = {"id": _new_id(), "type": "TaskType", "name": name, "for_entity": for_entity}
+        self.task_types[task_type["id"]] = task_type
+        return task_type
+
+    def add_task_status(self, name, is_default=False):
+        task_status = {"id": _new_id(), "type": "TaskStatus", "name": name, "is_default": is_default}
+        self.task_statuses[task_status["id"]] = task_status
+        return task_status
+
+    def add_shot(self, sequence, name, nb_frames=0, frame_in=None, frame_out=None, fps=None, description=""):
+        data = {key: value for key, value in (("frame_in", frame_in), ("frame_out", frame_out), ("fps", fps))
+                if value is not None}
+        shot = {
+            "id": _new_id(), "type": "Shot", "name": name, "parent_id": sequence["id"],
+            "project_id": sequence["project_id"], "nb_frames": nb_frames, "description": description, "data": data
+        }
+        self.shots[shot["id"]] = shot
+        return shot
+
+    def add_task(self, entity, task_type, task_status=None, name="main"):
+        task_status = task_status or self._default_status()
+        task = {
+            "id": _new_id(), "type": "Task", "name": name, "project_id": entity["project_id"],
+            "entity_id": entity["id"], "task_type_id": task_type["id"], "task_status_id": task_status["id"]
+        }
+        self.tasks[task["id"]] = task
+        return task
+
+    def seed(self, project_name, sequence_name, shots=()):
+        # A project with one sequence, the publish task type and status, and
+        # optionally shots given as (name, nb_frames, frame_in, frame_out, fps, description)
+        project = self._named(self.projects, project_name) or self.add_project(project_name)
+        sequence = self._sequence(project, sequence_name) or self.add_sequence(project, sequence_name)
+        # Task types and statuses are shared by all projects, as in Kitsu
+        task_type = self._named(self.task_types, DEFAULT_TASK_TYPE) or self.add_task_type(DEFAULT_TASK_TYPE)
+        if not self.task_statuses:
+            self.add_task_status("Todo", is_default=True)
+        if not self._named(self.task_statuses, DEFAULT_TASK_STATUS):
+            self.add_task_status(DEFAULT_TASK_STATUS)
+        for name, nb_frames, frame_in, frame_out, fps, description in shots:
+            shot = self.add_shot(sequence, name, nb_frames, frame_in, frame_out, fps, description)
+            self.add_task(shot, task_type)
+        return project, sequence
+
+    @staticmethod
+    def _named(entities, name):
+        return next((entity for entity in entities.values() if entity["name"] == name), None)
+
+    def _default_status(self):
+        return next((status for status in self.task_statuses.values() if status["is_default"]), None)
+
+    def _sequence(self, project, name):
+        return next((sequence for sequence in self.sequences.values()
+                     if sequence["project_id"] == project["id"] and sequence["name"] == name), None)
+
+    def _shot(self, sequence, name):
+        return next((shot for shot in self.shots.values()
+                     if shot["parent_id"] == sequence["id"] and shot["name"] == name), None)
+
+    def _create_shot_tasks(self, shot):
+        # What the project's task type settings do in Kitsu: every shot gets a task per shot task type
+        for task_type in self.task_types.values():
+            if task_type["for_entity"] == "Shot":
+                self.add_task(shot, task_type)
+
+    def _throttle(self):
+        # Spread requests out to at most rate_limit per second, like a rate-limiting proxy
+        if not self.rate_limit:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + 1.0 / self.rate_limit
+        time.sleep(slot - now)
+
+    def read_body(self, stream, length):
+        # Receive at most `bandwidth` bytes per second across all connections, like a shared uplink
+        if not self.bandwidth:
+            return stream.read(length)
+        chunks = []
+        while length > 0:
+            chunk = stream.read(min(READ_CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            chunks.append(chunk)
+            with self._lock:
+                now = time.monotonic()
+                done = max(now, self._next_byte_slot) + len(chunk) / self.bandwidth
+                self._next_byte_slot = done
+            time.sleep(done - now)
+        return b''.join(chunks)
+
+    def _fails(self, path):
+        if path.startswith('/auth/'):
+            return False
+        rate = self.upload_error_rate if path.startswith(('/pictures/', '/import/')) else self.error_rate
+        return rate > 0 and random.random() < rate
+
+    def handle(self, method, path, query, body, content_type=None):
+        with self._lock:
+            self.requests += 1
+        self._throttle()
+        if self._slots:
+            self._slots.acquire()
+        try:
+            if self.latency or self.jitter:
+                time.sleep(self.latency + random.uniform(0, self.jitter))
+            if self._fails(path):
+                with self._lock:
+                    self.errors += 1
+                return 500, {"message": "Simulated server error", "stacktrace": "kitsu stand-in"}
+            if content_type and content_type.startswith('multipart/form-data'):
+                body = _multipart_parts(body, content_type)
+            for route_method, regex, handler in self.routes:
+                match = regex.match(path)
+                if route_method == method and match:
+                    return handler(query=query, body=body, **match.groupdict())
+            return 404, {"message": f"No stand-in route for {method} {path}"}
+        finally:
+            if self._slots:
+                self._slots.release()
+
+    @staticmethod
+    def _filter(entities, query, *fields):
+        return [entity for entity in entities
+                if all(field not in query or str(entity.get(field)) == query[field] for field in fields)]
+
+    @_route('POST', '/auth/login')
+    def _login(self, query, body):
+        return 200, {"login": True, "user": {"email": json.loads(body).get("email")},
+                     "access_token": _token("access"), "refresh_token": _token("refresh")}
+
+    @_route('GET', '/auth/authenticated')
+    def _authenticated(self, query, body):
+        return 200, {"authenticated": True, "user": {"email": "standin@localhost"}}
+
+    @_route('GET', '/auth/refresh-token')
+    def _refresh_token(self, query, body):
+        return 200, {"access_token": _token("access")}
+
+    @_route('GET', '/data/projects')
+    def _get_projects(self, query, body):
+        return 200, self._filter(self.projects.values(), query, "name")
+
+    @_route('GET', '/data/sequences')
+    def _get_sequences(self, query, body):
+        return 200, self._filter(self.sequences.values(), query, "project_id", "name")
+
+    @_route('GET', '/data/sequences/{sequence_id}/shots')
+    def _get_sequence_shots(self, query, body, sequence_id):
+        return 200, [shot for shot in self.shots.values() if shot["parent_id"] == sequence_id]
+
+    @_route('GET', '/data/sequences/{sequence_id}/tasks')
+    def _get_sequence_tasks(self, query, body, sequence_id):
+        shot_ids = {shot["id"] for shot in self.shots.values() if shot["parent_id"] == sequence_id}
+        return 200, [task for task in self.tasks.values() if task["entity_id"] in shot_ids]
+
+    @_route('GET', '/data/shots/all')
+    def _get_shots(self, query, body):
+        shots = [dict(shot, sequence_id=shot["parent_id"]) for shot in self.shots.values()]
+        return 200, self._filter(shots, query, "sequence_id", "name")
+
+    @_route('POST', '/data/projects/{project_id}/shots')
+    def _new_shot(self, query, body, project_id):
+        data = json.loads(body)
+        sequence = self.sequences.get(data.get("sequence_id"))
+        if project_id not in self.projects or sequence is None:
+            return 404, {"message": "Project or sequence not found"}
+        with self._lock:
+            shot = self._shot(sequence, data["name"]) or self.add_shot(sequence, data["name"])
+            shot.update(nb_frames=data.get("nb_frames", shot["nb_frames"]),
+                        description=data.get("description", shot["description"]),
+                        data={**shot["data"], **(data.get("data") or {})})
+        return 201, shot
+
+    @_route('PUT', '/data/entities/{entity_id}')
+    def _update_entity(self, query, body, entity_id):
+        shot = self.shots.get(entity_id)
+        if shot is None:
+            return 404, {"message": "Entity not found"}
+        data = json.loads(body)
+        with self._lock:
+            shot.update({key: value for key, value in data.items() if key not in ("id", "type")})
+        return 200, shot
+
+    @_route('GET', '/data/tasks')
+    def _get_tasks(self, query, body):
+        return 200, self._filter(self.tasks.values(), query, "name", "task_type_id", "entity_id")
+
+    @_route('POST', '/data/tasks')
+    def _new_task(self, query, body):
+        data = json.loads(body)
+        shot = self.shots.get(data.get("entity_id"))
+        task_type = self.task_types.get(data.get("task_type_id"))
+        if shot is None or task_type is None:
+            return 404, {"message": "Entity or task type not found"}
+        with self._lock:
+            task = self.add_task(shot, task_type, self.task_statuses.get(data.get("task_status_id")),
+                                 name=data.get("name") or "main")
+        return 201, task
+
+    @_route('POST', '/import/csv/projects/{project_id}/shots')
+    def _import_shots_csv(self, query, body, project_id):
+        project = self.projects.get(project_id)
+        if project is None:
+            return 404, {"message": "Project not found"}
+        if not isinstance(body, dict) or "file" not in body:
+            return 400, {"message": "No CSV file uploaded"}
+
+        shots = []
+        with self._lock:
+            for row in csv.DictReader(io.StringIO(body["file"].decode('utf-8-sig'))):
+                sequence = self._sequence(project, row["Sequence"]) or self.add_sequence(project, row["Sequence"])
+                shot = self._shot(sequence, row["Name"])
+                if shot is None:
+                    shot = self.add_shot(sequence, row["Name"])
+                    self._create_shot_tasks(shot)
+                shot.update(nb_frames=int(row.get("Nb Frames") or 0), description=row.get("Description", ""))
+                for column, key, cast in (("Frame In", "frame_in", int), ("Frame Out", "frame_out", int),
+                                          ("FPS", "fps", float)):
+                    if row.get(column):
+                        shot["data"][key] = cast(float(row[column])) if cast is int else cast(row[column])
+                shots.append(shot)
+        return 201, shots
+
+    @_route('GET', '/data/task-types')
+    def _get_task_types(self, query, body):
+        return 200, self._filter(self.task_types.values(), query, "name")
+
+    @_route('GET', '/data/task-status')
+    def _get_task_statuses(self, query, body):
+        statuses = self._filter(self.task_statuses.values(), query, "name")
+        if "is_default" in query:
+            statuses = [status for status in statuses if status["is_default"]]
+        return 200, statuses
+
+    @_route('POST', '/actions/tasks/{task_id}/comment')
+    def _add_comment(self, query, body, task_id):
+        if task_id not in self.tasks:
+            return 404, {"message": "Task not found"}
+        data = json.loads(body)
+        comment = {"id": _new_id(), "type": "Comment", "object_id": task_id, "text": data.get("comment", ""),
+                   "task_status_id": data.get("task_status_id"), "previews": []}
+        with self._lock:
+            self.comments[comment["id"]] = comment
+            self.tasks[task_id]["task_status_id"] = data.get("task_status_id")
+        return 201, comment
+
+    @_route('GET', '/data/tasks/{task_id}/comments')
+    def _get_comments(self, query, body, task_id):
+        # Newest first, like Kitsu
+        return 200, [comment for comment in reversed(list(self.comments.values())) if comment["object_id"] == task_id]
+
+    @_route('POST', '/actions/tasks/{task_id}/comments/{comment_id}/add-preview')
+    def _add_preview(self, query, body, task_id, comment_id):
+        comment = self.comments.get(comment_id)
+        if comment is None:
+            return 404, {"message": "Comment not found"}
+        with self._lock:
+            revision = 1 + sum(1 for preview in self.previews.values() if preview["task_id"] == task_id)
+            preview = {"id": _new_id(), "type": "PreviewFile", "task_id": task_id, "revision": revision,
+                       "status": "processing", "file_size": 0}
+            self.previews[preview["id"]] = preview
+            comment["previews"].append(preview["id"])
+        return 201, preview
+
+    @_route('POST', '/pictures/preview-files/{preview_id}')
+    def _upload_preview(self, query, body, preview_id):
+        preview = self.previews.get(preview_id)
+        if preview is None:
+            return 404, {"message": "Preview file not found"}
+        file_size = sum(len(part) for part in body.values()) if isinstance(body, dict) else len(body)
+        normalized = query.get("normalize") != "false"
+        if normalized and self.normalize_rate:
+            seconds = file_size / self.normalize_rate
+            with self._lock:
+                self.normalize_seconds += seconds
+            time.sleep(seconds)
+        preview.update(status="ready", file_size=file_size, normalized=normalized)
+        return 201, preview
+
+    @_route('PUT', '/actions/preview-files/{preview_id}/set-main-preview')
+    def _set_main_preview(self, query, body, preview_id):
+        preview = self.previews.get(preview_id)
+        if preview is None:
+            return 404, {"message": "Preview file not found"}
+        task = self.tasks[preview["task_id"]]
+        self.shots[task["entity_id"]]["preview_file_id"] = preview_id
+        return 200, self.shots[task["entity_id"]]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def _dispatch(self, method):
+        url = urlsplit(self.path)
+        path = url.path[len(API_PREFIX):] if url.path.startswith(API_PREFIX) else url.path
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+        standin = self.server.standin
+        body = standin.read_body(self.rfile, int(self.headers.get('Content-Length') or 0))
+
+        status, payload = standin.handle(method, path, query, body, self.headers.get('Content-Type'))
+
+        data = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        self._dispatch('GET')
+
+    def do_POST(self):
+        self._dispatch('POST')
+
+    def do_PUT(self):
+        self._dispatch('PUT')
+
+    def log_message(self, format, *args):
+        logging.debug(f"stand-in: {format % args}")
+
+
+# Runs a KitsuStandin on a background thread; use as a context manager
+class StandinServer:
+    def __init__(self, standin=None, host='127.0.0.1', port=0):
+        self.standin = standin or KitsuStandin()
+        self.httpd = ThreadingHTTPServer((host, port), _Handler)
+        self.httpd.daemon_threads = True
+        self.httpd.standin = self.standin
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}{API_PREFIX}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="kitsu-standin", daemon=True)
+        self._thread.start()
+        logging.info(f"Kitsu stand-in listening on {self.url}")
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Local Kitsu API stand-in for offline ingests and load tests')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--project', action='append', help='Project to create (repeatable, default: Standin)')
+    parser.add_argument('--sequence', action='append', help='Sequence to create in every project (default: SQ01)')
+    parser.add_argument('--latency', type=float, default=0.0, help='Seconds added to every request')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Random extra seconds per request')
+    parser.add_argument('--rate-limit', type=float, help='Requests served per second')
+    parser.add_argument('--max-concurrency', type=int, help='Requests served at once')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='Fraction of requests failing with a 500')
+    parser.add_argument('--upload-error-rate', type=float, help='Error rate for uploads (default: --error-rate)')
+    parser.add_argument('--bandwidth-mbps', type=float, help='Upload bandwidth shared by all clients, in MB/s')
+    parser.add_argument('--normalize-mbps', type=float,
+                        help='Simulate the server transcode of uploads sent without normalize=false, in MB/s')
+    args = parser.parse_args()
+
+    for rate in (args.error_rate, args.upload_error_rate):
+        if rate is not None and not 0 <= rate <= 1:
+            parser.error("error rates must be between 0 and 1")
+
+    logging.basicConfig(level=logging.INFO, format='[%(levelname)s] %(message)s')
+    standin = KitsuStandin(
+        latency=args.latency, jitter=args.jitter, max_concurrency=args.max_concurrency,
+        rate_limit=args.rate_limit, error_rate=args.error_rate, upload_error_rate=args.upload_error_rate,
+        bandwidth=args.bandwidth_mbps * 1024 ** 2 if args.bandwidth_mbps else None,
+        normalize_rate=args.normalize_mbps * 1024 ** 2 if args.normalize_mbps else None
+    )
+    for project_name in args.project or ['Standin']:
+        for sequence_name in args.sequence or ['SQ01']:
+            standin.seed(project_name, sequence_name)
+
+    server = StandinServer(standin, host=args.host, port=args.port)
+    logging.info(f"Point kitsu-ingest at it with: KITSU_SERVER={server.url} KITSU_EMAIL=any KITSU_PASSWORD=any")
+    try:
+        server.start()
+        server._thread.join()
+    except KeyboardInterrupt:
+        logging.info(f"Stopping. Served {standin.requests} requests, {standin.errors} simulated errors")
+        server.stop()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,27 @@
+# CLI choices and defaults, shared with the stages that use them. Nothing here may
+# import pandas, ffmpeg or gazu: argument parsing must stay cheap.
+
+MODE_SEQUENTIAL = 'sequential'
+MODE_SINGLE_PASS = 'single-pass'
+MODE_PARALLEL = 'parallel'
+MODE_SMART_CUT = 'smart-cut'
+MODE_DISTRIBUTED = 'distributed'
+MODES = (MODE_SEQUENTIAL, MODE_SINGLE_PASS, MODE_PARALLEL, MODE_SMART_CUT, MODE_DISTRIBUTED)
+
+DEFAULT_MAX_OUTPUTS = 16
+
+SYNC_IMPORT = "import"
+SYNC_DIFF = "diff"
+SYNC_MODES = (SYNC_IMPORT, SYNC_DIFF)
+
+DEFAULT_RETRIES = 3
+
+# Full re-encodes of a shot whose output fails post-encode verification
+DEFAULT_VERIFY_RETRIES = 1
+
+# Per-shot outcomes, as reported to callers of kitsu_ingest.api
+SHOT_ENCODED = 'encoded'
+SHOT_CACHED = 'cached'
+SHOT_PUBLISHED = 'published'
+SHOT_SKIPPED = 'skipped'
+SHOT_FAILED = 'failed'
@@ -0,0 +1,262 @@
+import os
+import json
+import math
+import logging
+import statistics
+from .options import MODE_SEQUENTIAL, MODE_PARALLEL, MODE_SMART_CUT, MODE_DISTRIBUTED, SYNC_DIFF
+from .utils.history import ThroughputHistory, KIND_ENCODE, KIND_UPLOAD, resolution_class, length_class
+from .utils.validation import extract_shots, read_breakdown_csv, sort_dataframe
+
+# --plan: how long an ingest will take, without encoding anything. The shot table
+# is read and the source probed (container header only), then per-frame costs are
+# taken from the throughput history of past runs (utils/history.py), from the most
+# specific match with enough samples down to built-in defaults.
+
+MIN_SAMPLES = 3
+
+# Until the history has measurements: libx264 crf 18 'medium' on a recent x86 core
+DEFAULT_CPU_SECONDS_PER_MEGAPIXEL_FRAME = 0.12
+DEFAULT_BYTES_PER_MEGAPIXEL_FRAME = 40000
+DEFAULT_PROXY_BYTES_PER_FRAME = 25000
+DEFAULT_UPLOAD_BYTES_PER_SECOND = 10 * 1024 ** 2
+
+# Smart cut copies most GOPs: only the partial GOPs at shot boundaries are encoded.
+# Also converts history between smart-cut and full-encode modes.
+SMART_CUT_COST_RATIO = 0.25
+
+# Threads per concurrent encode; libx264 stops scaling well past these
+THREADS_BY_RESOLUTION = {'480p': 2, '576p': 2, '720p': 3, '1080p': 4, '1440p': 6, '2160p': 8}
+DEFAULT_THREADS = 8
+
+# Parallel encodes lose some time to seeks and process start-up
+PARALLEL_EFFICIENCY = 0.9
+
+# Kitsu requests with cold metadata caches: login, project, sequence, CSV import,
+# task type, task status, shots and tasks (twice each)
+KITSU_SETUP_CALLS = 10
+# add_comment, create_preview, upload_preview_file, set_main_preview
+KITSU_CALLS_PER_SHOT = 4
+
+
+def _probe_source(video_path):
+    import ffmpeg
+
+    probe = ffmpeg.probe(video_path, select_streams='v:0')
+    streams = probe.get('streams') or []
+    if not streams:
+        raise ValueError(f"No video stream found in {video_path}")
+    stream = streams[0]
+    return {
+        'codec': stream.get('codec_name'),
+        'width': int(stream.get('width') or 0),
+        'height': int(stream.get('height') or 0),
+        'size': int((probe.get('format') or {}).get('size') or os.path.getsize(video_path))
+    }
+
+
+def _per_frame(records, value, filters):
+    # Median per-frame value of the first filter with enough samples → (value, label, samples)
+    for label, keep in filters:
+        samples = [value(record) / record['frames'] for record in records if record.get('frames') and keep(record)]
+        if len(samples) >= MIN_SAMPLES:
+            return statistics.median(samples), label, len(samples)
+    return None, 'default', 0
+
+
+class CapacityPlan:
+    def __init__(self, shots, source, mode=MODE_SEQUENTIAL, review=False, publish=False, publish_workers=1,
+                 sync_mode=None, window_hours=None, history=None):
+        # shots: {shot_name: (length, fps)}, source: _probe_source() of the video
+        self.shots = shots
+        self.source = source
+        self.mode = mode
+        self.review = review
+        self.publish = publish
+        self.publish_workers = publish_workers
+        self.sync_mode = sync_mode
+        self.window_hours = window_hours
+        self.history = history or ThroughputHistory()
+        self.cpu_count = os.cpu_count() or 1
+
+    def _encode_filters(self, frames):
+        codec, resolution = self.source['codec'], resolution_class(self.source['height'])
+        same_source = lambda record: (record.get('codec') == codec
+                                      and resolution_class(record.get('height')) == resolution)
+        return [
+            (f"{self.mode}, {codec} {resolution}, {length_class(frames)} frames",
+             lambda record: record.get('mode') == self.mode and same_source(record)
+             and length_class(record['frames']) == length_class(frames)),
+            (f"{self.mode}, {codec} {resolution}",
+             lambda record: record.get('mode') == self.mode and same_source(record)),
+            (f"{codec} {resolution}", same_source)
+        ]
+
+    def _cpu_seconds(self, record):
+        # The last filter mixes modes: bring smart-cut timings and full-encode timings
+        # to the cost of the planned mode
+        cpu_seconds = record['seconds'] * record.get('threads', 1)
+        smart_cut = record.get('mode') == MODE_SMART_CUT
+        if self.mode == MODE_SMART_CUT and not smart_cut:
+            return cpu_seconds * SMART_CUT_COST_RATIO
+        if self.mode != MODE_SMART_CUT and smart_cut:
+            return cpu_seconds / SMART_CUT_COST_RATIO
+        return cpu_seconds
+
+    def estimate(self):
+        encodes = self.history.load(KIND_ENCODE)
+        megapixels = self.source['width'] * self.source['height'] / 1e6
+        cpu_seconds = 0.0
+        output_bytes = 0.0
+        proxy_bytes = 0.0
+        sources = {}
+
+        # Shots of the same length class share their per-frame costs
+        by_length = {}
+        for shot_name, (length, fps) in self.shots.items():
+            by_length.setdefault(length_class(length), []).append(int(length))
+        for lengths in by_length.values():
+            filters = self._encode_filters(lengths[0])
+            cost, label, samples = _per_frame(encodes, self._cpu_seconds, filters)
+            if cost is None:
+                cost = DEFAULT_CPU_SECONDS_PER_MEGAPIXEL_FRAME * megapixels
+                if self.mode == MODE_SMART_CUT:
+                    cost *= SMART_CUT_COST_RATIO
+            size, _, _ = _per_frame(encodes, lambda r: r['bytes'], filters)
+            if size is None:
+                size = DEFAULT_BYTES_PER_MEGAPIXEL_FRAME * megapixels
+            frames = sum(lengths)
+            cpu_seconds += cost * frames
+            output_bytes += size * frames
+            if self.review:
+                proxy, _, _ = _per_frame([r for r in encodes if 'proxy_bytes' in r], lambda r: r['proxy_bytes'],
+                                         filters)
+                proxy_bytes += (proxy or DEFAULT_PROXY_BYTES_PER_FRAME) * frames
+            sources[label] = sources.get(label, 0) + samples
+
+        total_frames = sum(int(length) for length, fps in self.shots.values())
+        jobs, threads = self.suggest_jobs()
+        encode_wall = self._encode_wall(cpu_seconds, jobs, threads)
+
+        plan = {
+            'shots': len(self.shots),
+            'frames': total_frames,
+            'source': self.source,
+            'mode': self.mode,
+            'encode_cpu_seconds': round(cpu_seconds, 1),
+            'encode_seconds': round(encode_wall, 1),
+            'output_bytes': int(output_bytes),
+            'proxy_bytes': int(proxy_bytes) if self.review else None,
+            'suggested_jobs': jobs,
+            'suggested_threads_per_job': threads,
+            'history_samples': sources,
+            'cpu_count': self.cpu_count
+        }
+        total_seconds = encode_wall
+        if self.publish:
+            upload_bytes = proxy_bytes if self.review else output_bytes
+            upload_seconds = self._upload_seconds(upload_bytes)
+            plan.update(self._publish_plan(upload_bytes, upload_seconds, encode_wall))
+            total_seconds = plan['total_seconds_pipeline']
+        if self.window_hours:
+            # Nodes like this one needed to fit the encode in the window
+            plan['window_hours'] = self.window_hours
+            plan['suggested_worker_nodes'] = max(1, math.ceil(encode_wall / (self.window_hours * 3600)))
+            plan['fits_window'] = total_seconds <= self.window_hours * 3600
+        return plan
+
+    def suggest_jobs(self):
+        threads = THREADS_BY_RESOLUTION.get(resolution_class(self.source['height']), DEFAULT_THREADS)
+        threads = min(threads, self.cpu_count)
+        return max(1, min(len(self.shots), self.cpu_count // threads)), threads
+
+    def _encode_wall(self, cpu_seconds, jobs, threads):
+        if self.mode in (MODE_PARALLEL, MODE_SMART_CUT, MODE_DISTRIBUTED):
+            return cpu_seconds / (jobs * threads * PARALLEL_EFFICIENCY)
+        # Sequential and single-pass encode one shot (or chunk) at a time on every core;
+        # sequential history already counts the cores it left idle
+        return cpu_seconds / (self.cpu_count * (1.0 if self.mode == MODE_SEQUENTIAL else PARALLEL_EFFICIENCY))
+
+    def _upload_seconds(self, upload_bytes):
+        uploads = [r for r in self.history.load(KIND_UPLOAD) if r.get('seconds') and r.get('bytes')]
+        file_kind = 'proxy' if self.review else 'shot'
+        same_kind = [r for r in uploads if r.get('file') == file_kind]
+        samples = same_kind if len(same_kind) >= MIN_SAMPLES else uploads
+        rate = statistics.median(r['bytes'] / r['seconds'] for r in samples) if len(samples) >= MIN_SAMPLES \
+            else DEFAULT_UPLOAD_BYTES_PER_SECOND
+        # Workers share the link: assume they scale until it is full, which the history does not tell us
+        return upload_bytes / (rate * self.publish_workers)
+
+    def _publish_plan(self, upload_bytes, upload_seconds, encode_wall):
+        shots = len(self.shots)
+        calls = KITSU_SETUP_CALLS + KITSU_CALLS_PER_SHOT * shots
+        # A first delivery also creates a task per shot, and the diff sync a shot per shot
+        first_delivery = shots * (2 if self.sync_mode == SYNC_DIFF else 1)
+        return {
+            'upload_bytes': int(upload_bytes),
+            'upload_seconds': round(upload_seconds, 1),
+            'kitsu_api_calls': calls,
+            'kitsu_api_calls_first_delivery': calls + first_delivery,
+            'publish_workers': self.publish_workers,
+            # Enough upload workers that uploads keep pace with encoding under --pipeline
+            'suggested_publish_workers': max(1, min(8, math.ceil(upload_seconds * self.publish_workers
+                                                                 / max(encode_wall, 1.0)))),
+            'total_seconds_sequential': round(encode_wall + upload_seconds, 1),
+            'total_seconds_pipeline': round(max(encode_wall, upload_seconds), 1)
+        }
+
+
+def _duration(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h{minutes:02d}m{seconds:02d}s" if hours else f"{minutes}m{seconds:02d}s"
+
+
+def log_plan(plan):
+    source = plan['source']
+    logging.info(f"Plan: {plan['shots']} shots, {plan['frames']} frames from {source['codec']} "
+                 f"{source['width']}x{source['height']}, --video-mode {plan['mode']}")
+    logging.info(f"Encode: {plan['encode_cpu_seconds']:.0f} CPU-seconds, about {_duration(plan['encode_seconds'])} "
+                 f"on this machine ({plan['cpu_count']} cores), {plan['output_bytes'] / 1024 ** 3:.2f} GB of shots"
+                 + (f" + {plan['proxy_bytes'] / 1024 ** 3:.2f} GB of proxies" if plan['proxy_bytes'] else ""))
+    logging.info(f"Suggested: --jobs {plan['suggested_jobs']} --threads-per-job {plan['suggested_threads_per_job']}")
+    if 'upload_bytes' in plan:
+        logging.info(f"Publish: {plan['upload_bytes'] / 1024 ** 3:.2f} GB uploaded in about "
+                     f"{_duration(plan['upload_seconds'])} with {plan['publish_workers']} workers, "
+                     f"{plan['kitsu_api_calls']} Kitsu API calls "
+                     f"({plan['kitsu_api_calls_first_delivery']} on a first delivery); "
+                     f"suggested --publish-workers {plan['suggested_publish_workers']}")
+        logging.info(f"Total: about {_duration(plan['total_seconds_sequential'])}, "
+                     f"{_duration(plan['total_seconds_pipeline'])} with --pipeline")
+    if 'window_hours' in plan:
+        logging.info(f"Window of {plan['window_hours']:g}h: {'fits' if plan['fits_window'] else 'does not fit'}; "
+                     f"{plan['suggested_worker_nodes']} node(s) like this one for the encode "
+                     f"(--video-mode distributed)")
+    measured = {label: samples for label, samples in plan['history_samples'].items() if samples}
+    if measured:
+        logging.info("Based on " + ", ".join(f"{samples} measured shots ({label})"
+                                             for label, samples in measured.items()))
+    else:
+        logging.info("No measured throughput for this kind of source yet: using defaults. "
+                     "Estimates improve as real runs are recorded.")
+
+
+def run_plan(args):
+    from .processors.csv_processor import name_shots
+
+    # The shots a real run would encode, without writing the processed CSV
+    shots = extract_shots(name_shots(sort_dataframe(read_breakdown_csv(args.csv))))
+    plan = CapacityPlan(
+        shots, _probe_source(args.video),
+        mode=args.video_mode,
+        review=args.review_proxy,
+        publish=bool(args.push),
+        publish_workers=args.publish_workers,
+        sync_mode=args.sync_mode,
+        window_hours=args.plan_window
+    ).estimate()
+    log_plan(plan)
+    if args.plan_json:
+        with open(args.plan_json, 'w') as f:
+            json.dump(plan, f, indent=2)
+        logging.info(f"Plan written to: {args.plan_json}")
+    return plan
@@ -1,8 +1,15 @@
 import os
-import pandas as pd
 from datetime import datetime
 import logging
-from ..utils.validation import sort_dataframe
+from ..utils.validation import sort_dataframe, read_breakdown_csv
+from ..utils.metrics import metrics
+
+PROCESSED_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'processed')
+
+
+def name_shots(df):
+    # First two '_' parts of the shot, e.g. 'SHOT_0030_A006C012_241206VG' → 'SHOT_0030'
+    return df.assign(final_shot_name=df['SHOT'].str.extract(r'^([^_]*(?:_[^_]*)?)', expand=False))
 
 
 class CsvProcessor:
@@ -11,23 +18,21 @@ class CsvProcessor:
         self.sequence = sequence
         self.timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
         self.output_dir = output_dir or self._create_output_dir()
+        os.makedirs(self.output_dir, exist_ok=True)
         self.df = None
+        self.shot_table = None
         self.processed_csv_path = None
 
 
     def _create_output_dir(self):
-        processed_dir = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'processed', self.timestamp)
-        os.makedirs(processed_dir, exist_ok=True)
-        return processed_dir
-
-    def process(self):
-        self.df = pd.read_csv(self.csv_path)
-        self.df = sort_dataframe(self.df)
-        self.df.loc[:, 'final_shot_name'] = self.df['SHOT'].apply(
-            lambda shot: '_'.join(str(shot).split('_')[:2])
-        )
-
-        df = self.df.copy(deep=True)
+        return os.path.join(PROCESSED_DIR, self.timestamp)
+
+    @metrics.span('csv')
+    def process(self, df=None):
+        # df: an already loaded breakdown table (kitsu_ingest.api); read from csv_path otherwise
+        self.df = read_breakdown_csv(self.csv_path) if df is None else df
+        self.df = name_shots(sort_dataframe(self.df))
+
         rename_mapping = {
             'final_shot_name': 'Name',
             'FRAME IN': 'Frame In',
@@ -36,16 +41,18 @@ class CsvProcessor:
             'Clip Name': 'Description'
         }
 
-        missing_cols = [col for col in rename_mapping if col not in df.columns]
+        missing_cols = [col for col in rename_mapping if col not in self.df.columns]
         if missing_cols:
             raise ValueError(f"Missing required columns for rename: {missing_cols}")
 
-        df.rename(columns=rename_mapping, inplace=True)
-        df['Sequence'] = self.sequence
-        columns_to_keep = ['Sequence'] + list(rename_mapping.values()) + ['FPS']
-        df = df[columns_to_keep]
+        # Typed shot table, built once and handed to the video and publish stages in memory
+        df = self.df[list(rename_mapping) + ['FPS']].rename(columns=rename_mapping)
+        df.insert(0, 'Sequence', self.sequence)
+        df = df.reset_index(drop=True)
+        self.shot_table = df
+        metrics.gauge('breakdown_shots', len(df))
 
-        input_filename = os.path.splitext(os.path.basename(self.csv_path))[0]
+        input_filename = os.path.splitext(os.path.basename(self.csv_path))[0] if self.csv_path else 'breakdown'
         output_filename = f"{input_filename}_kitsu_{self.timestamp}.csv"
         output_path = os.path.join(self.output_dir, output_filename)
         df.to_csv(output_path, index=False)
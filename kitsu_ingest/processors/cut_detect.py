@@ -0,0 +1,151 @@
+import os
+import logging
+import time
+import numpy as np
+import ffmpeg
+from numpy.lib.stride_tricks import sliding_window_view
+from ..utils.metrics import metrics
+from ..utils.storage import cache_dir
+
+# Checks that the source video really is the breakdown's shots laid end to end. A
+# thumbnail-sized grayscale decode is piped into NumPy, scored for frame-to-frame
+# change in vectorized batches, and the detected cuts are matched against the CSV
+# boundaries: a slate or a dropped frame shows up as every later cut being offset.
+
+# Enough pixels to see a cut, few enough that scoring costs nothing next to the decode
+CUT_WIDTH = 64
+CUT_HEIGHT = 36
+BATCH_FRAMES = 1024
+
+# A cut is a change of at least CUT_THRESHOLD (mean absolute difference on the
+# 0-255 gray scale) that also stands CUT_RATIO times above the median change of the
+# CUT_WINDOW frames around it, so fast motion and camera moves are not cuts
+CUT_THRESHOLD = 12.0
+CUT_RATIO = 4.0
+CUT_WINDOW = 12
+
+# How far from a CSV boundary a detected cut still counts as that boundary, shifted
+DEFAULT_MAX_OFFSET = 48
+
+SCORES_SUFFIX = '.npy'
+
+
+def frame_scores(video_path, width=CUT_WIDTH, height=CUT_HEIGHT, batch_frames=BATCH_FRAMES):
+    # scores[f]: change from frame f - 1 to frame f (scores[0] is 0)
+    frame_size = width * height
+    process = (
+        # The loop filter only sharpens block edges: skipping it decodes faster and
+        # makes no difference at thumbnail size
+        ffmpeg.input(video_path, skip_loop_filter='all').video
+        .filter('scale', width, height, flags='area')
+        .output('pipe:', format='rawvideo', pix_fmt='gray')
+        .global_args('-v', 'error')
+        .run_async(pipe_stdout=True, pipe_stderr=True)
+    )
+
+    batches = [np.zeros(1, dtype=np.float32)]
+    previous = None
+    try:
+        while True:
+            data = process.stdout.read(frame_size * batch_frames)
+            count = len(data) // frame_size
+            if not count:
+                break
+            frames = np.frombuffer(data, dtype=np.uint8, count=count * frame_size).reshape(count, frame_size)
+            # Carry the last frame over so the change across batches is scored too
+            block = frames if previous is None else np.concatenate((previous, frames))
+            changes = np.abs(np.diff(block.astype(np.int16), axis=0)).mean(axis=1, dtype=np.float32)
+            batches.append(changes)
+            previous = frames[-1:]
+    finally:
+        process.stdout.close()
+        err = process.stderr.read()
+        process.wait()
+    if process.returncode != 0:
+        raise ffmpeg.Error('ffmpeg', b'', err)
+    if previous is None:
+        return np.zeros(0, dtype=np.float32)
+    return np.concatenate(batches)
+
+
+def cached_scores(video_path, fingerprint):
+    # Frame scores depend only on the source: a re-run of the same reel skips the decode
+    path = os.path.join(cache_dir('cuts'), f"{fingerprint}_{CUT_WIDTH}x{CUT_HEIGHT}{SCORES_SUFFIX}")
+    if os.path.exists(path):
+        try:
+            return np.load(path)
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable cut scores {path}: {e}")
+
+    started = time.monotonic()
+    scores = frame_scores(video_path)
+    elapsed = time.monotonic() - started
+    if elapsed > 0:
+        metrics.gauge('cut_detect_fps', len(scores) / elapsed)
+    logging.info(f"Scored {len(scores)} frames for cuts in {elapsed:.1f}s")
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        np.save(f, scores)
+    os.replace(tmp_path, path)
+    return scores
+
+
+def detect_cuts(scores, threshold=CUT_THRESHOLD, ratio=CUT_RATIO, window=CUT_WINDOW):
+    # Frames that start a new shot, ascending
+    if len(scores) < 2:
+        return np.zeros(0, dtype=np.int64)
+    local = np.median(sliding_window_view(np.pad(scores, window, mode='edge'), 2 * window + 1), axis=1)
+    is_cut = (scores >= threshold) & (scores >= ratio * np.maximum(local, 1.0))
+    is_cut[0] = False
+    return np.flatnonzero(is_cut)
+
+
+def compare_cuts(cuts, shots, max_offset=DEFAULT_MAX_OFFSET):
+    # shots: [(shot_name, start_frame, end_frame)] laid end to end. Returns
+    # ({shot_name: offset entry} for boundaries whose cut is elsewhere, names of the
+    # shots whose starting cut was not detected at all). A detected cut stands for at
+    # most one boundary, so a dissolve next to a short shot does not borrow its cut.
+    if len(shots) < 2:
+        return {}, []
+    boundaries = np.array([start_frame for shot_name, start_frame, end_frame in shots[1:]], dtype=np.int64)
+    cuts = np.asarray(cuts, dtype=np.int64)
+
+    # Exact hits first: those boundaries are fine and their cuts are taken
+    exact = np.isin(boundaries, cuts)
+    free = np.setdiff1d(cuts, boundaries[exact])
+    pending = np.flatnonzero(~exact)
+
+    shifted = {}
+    undetected = []
+    if len(free) and len(pending):
+        # Nearest free cut to every remaining boundary at once
+        right = np.clip(np.searchsorted(free, boundaries[pending]), 0, len(free) - 1)
+        left = np.clip(right - 1, 0, len(free) - 1)
+        nearest = np.where(np.abs(free[left] - boundaries[pending]) <= np.abs(free[right] - boundaries[pending]),
+                           free[left], free[right])
+        offsets = nearest - boundaries[pending]
+        # A cut wanted by several boundaries goes to the closest one (the earlier on a tie)
+        claimed = {}
+        for idx, cut, offset in zip(pending.tolist(), nearest.tolist(), offsets.tolist()):
+            if abs(offset) <= max_offset and (cut not in claimed or abs(offset) < abs(claimed[cut][1])):
+                claimed[cut] = (idx, offset)
+        matched = {idx: (cut, offset) for cut, (idx, offset) in claimed.items()}
+    else:
+        matched = {}
+
+    for idx in pending.tolist():
+        previous_shot, shot_name = shots[idx][0], shots[idx + 1][0]
+        if idx not in matched:
+            # No free cut nearby: a dissolve or a match cut can hide a boundary, which
+            # is not evidence of a shift
+            undetected.append(shot_name)
+            continue
+        cut, offset = matched[idx]
+        shifted[shot_name] = {
+            "expected_frame": int(boundaries[idx]),
+            "detected_frame": cut,
+            "offset": offset,
+            "shots": [previous_shot, shot_name]
+        }
+    return shifted, undetected
@@ -0,0 +1,173 @@
+import os
+import json
+import hashlib
+import logging
+import subprocess
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+import ffmpeg
+from ..utils.hashing import hash_file
+from ..utils.storage import cache_dir
+
+SIDECAR_SUFFIX = '.kidx'
+SIDECAR_MAGIC = b'KIDX1\n'
+
+STREAM_FIELDS = ('codec_name', 'profile', 'pix_fmt', 'level', 'width', 'height', 'avg_frame_rate')
+
+
+def _probe_packets(video_path):
+    # Packet timestamps and key flags only: no decode, so this runs at I/O speed
+    args = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+        '-show_entries', 'packet=pts_time,flags', '-of', 'csv=p=0', video_path
+    ]
+    p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    if p.returncode != 0:
+        raise ffmpeg.Error('ffprobe', out, err)
+
+    packets = []
+    for line in out.decode('utf-8').splitlines():
+        pts_time, _, flags = line.partition(',')
+        if pts_time and pts_time != 'N/A':
+            packets.append((float(pts_time), 'K' in flags))
+    # Packets come in decode order; frames are addressed in display order
+    packets.sort()
+    return packets
+
+
+def _probe_stream(video_path):
+    streams = ffmpeg.probe(video_path, select_streams='v:0').get('streams', [])
+    if not streams:
+        raise ValueError(f"No video stream found in {video_path}")
+    return {field: streams[0].get(field) for field in STREAM_FIELDS}
+
+
+def _sidecar_paths(video_path):
+    # Next to the video when possible, otherwise in the user cache (read-only mounts)
+    real_path = os.path.realpath(video_path)
+    path_hash = hashlib.sha1(real_path.encode('utf-8')).hexdigest()[:16]
+    fallback_name = f"{path_hash}_{os.path.basename(real_path)}{SIDECAR_SUFFIX}"
+    return [f"{real_path}{SIDECAR_SUFFIX}", os.path.join(cache_dir('index'), fallback_name)]
+
+
+class FrameIndex:
+    def __init__(self, pts, keyflags, stream, size, mtime_ns, content_hash):
+        self.pts = pts
+        self.keyflags = keyflags
+        self.stream = stream
+        self.size = size
+        self.mtime_ns = mtime_ns
+        self.content_hash = content_hash
+        self.keyframes = array('q', (idx for idx, flag in enumerate(keyflags) if flag))
+
+    @property
+    def total_frames(self):
+        return len(self.pts)
+
+    @property
+    def fingerprint(self):
+        return f"{self.size}-{self.content_hash}"
+
+    @property
+    def fps(self):
+        num, _, den = (self.stream.get('avg_frame_rate') or '0/1').partition('/')
+        return float(num) / float(den or 1) if float(den or 1) else 0.0
+
+    def seek_before(self, frame):
+        # Seek target halfway between frame-1 and frame: accurate seeks start exactly at frame
+        if frame <= 0:
+            return 0.0
+        return (self.pts[frame - 1] + self.pts[frame]) / 2 - self.pts[0]
+
+    def seek_into(self, frame):
+        # Seek target inside frame: keyframe seeks (stream copy) land exactly on frame
+        if frame + 1 < len(self.pts):
+            return (self.pts[frame] + self.pts[frame + 1]) / 2 - self.pts[0]
+        return self.pts[frame] - self.pts[0]
+
+    @classmethod
+    def build(cls, video_path):
+        stat = os.stat(video_path)
+        logging.info(f"Indexing frames of {video_path}")
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            content_hash = executor.submit(hash_file, video_path)
+            packets = _probe_packets(video_path)
+            stream = _probe_stream(video_path)
+
+        pts = array('d', (pts_time for pts_time, _ in packets))
+        keyflags = bytearray(is_key for _, is_key in packets)
+        index = cls(pts, keyflags, stream, stat.st_size, stat.st_mtime_ns, content_hash.result())
+        logging.info(f"Indexed {index.total_frames} frames, {len(index.keyframes)} keyframes")
+        return index
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            if f.readline() != SIDECAR_MAGIC:
+                raise ValueError(f"Not a frame index: {path}")
+            header = json.loads(f.readline())
+            pts = array('d')
+            pts.frombytes(f.read(header['total_frames'] * pts.itemsize))
+            keyflags = bytearray(f.read(header['total_frames']))
+        if len(pts) != header['total_frames'] or len(keyflags) != header['total_frames']:
+            raise ValueError(f"Truncated frame index: {path}")
+        return cls(pts, keyflags, header['stream'], header['size'], header['mtime_ns'], header['hash'])
+
+    def save(self, path):
+        header = {
+            'size': self.size,
+            'mtime_ns': self.mtime_ns,
+            'hash': self.content_hash,
+            'total_frames': self.total_frames,
+            'stream': self.stream
+        }
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(SIDECAR_MAGIC)
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+                f.write(self.pts.tobytes())
+                f.write(bytes(self.keyflags))
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    @classmethod
+    def for_video(cls, video_path):
+        # Probe once, cut many: reuse the sidecar while size and mtime (or the content hash) still match
+        stat = os.stat(video_path)
+        sidecars = _sidecar_paths(video_path)
+
+        for sidecar in sidecars:
+            if not os.path.exists(sidecar):
+                continue
+            try:
+                index = cls.load(sidecar)
+            except (OSError, ValueError, KeyError) as e:
+                logging.warning(f"Ignoring unreadable frame index {sidecar}: {e}")
+                continue
+            if index.size != stat.st_size:
+                continue
+            if index.mtime_ns != stat.st_mtime_ns:
+                # Touched or copied: only trust the index if the content is unchanged
+                if hash_file(video_path) != index.content_hash:
+                    continue
+                index.mtime_ns = stat.st_mtime_ns
+                index._persist(sidecars)
+            logging.info(f"Loaded frame index: {sidecar}")
+            return index
+
+        index = cls.build(video_path)
+        index._persist(sidecars)
+        return index
+
+    def _persist(self, sidecars):
+        for sidecar in sidecars:
+            try:
+                self.save(sidecar)
+                return
+            except OSError:
+                continue
+        logging.warning("Could not write the frame index sidecar; the video will be probed again next run")
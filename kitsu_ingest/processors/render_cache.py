@@ -0,0 +1,119 @@
+import os
+import json
+import time
+import threading
+import hashlib
+import logging
+from ..utils.storage import cache_dir, link_or_copy
+
+DEFAULT_MAX_BYTES = 50 * 1024 ** 3
+DEFAULT_MAX_AGE_DAYS = 30
+
+
+# Content-addressed store of encoded shots, shared by every run on this machine
+class RenderCache:
+    def __init__(self, root=None, max_bytes=DEFAULT_MAX_BYTES, max_age_days=DEFAULT_MAX_AGE_DAYS):
+        self.root = root or cache_dir('renders')
+        os.makedirs(self.root, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, source_fingerprint, start_frame, end_frame, fps, params):
+        payload = json.dumps({
+            'source': source_fingerprint,
+            'start_frame': int(start_frame),
+            'end_frame': int(end_frame),
+            'fps': float(fps),
+            'params': params
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _entry_path(self, key, suffix='mp4'):
+        return os.path.join(self.root, key[:2], f"{key}.{suffix}")
+
+    def fetch(self, key, dest_path, artifacts=None):
+        # artifacts: {suffix: dest_path} of extra files rendered with the shot (review
+        # proxy, poster). A hit needs all of them, so an entry is never half used.
+        entry_path = self._entry_path(key)
+        sources = {suffix: self._entry_path(key, suffix) for suffix in artifacts or {}}
+        if not os.path.exists(entry_path) or not all(os.path.exists(path) for path in sources.values()):
+            self.misses += 1
+            return False
+
+        try:
+            link_or_copy(entry_path, dest_path)
+            for suffix, source in sources.items():
+                link_or_copy(source, artifacts[suffix])
+            # Access time is unreliable (noatime mounts), so mtime tracks recency for LRU eviction
+            os.utime(entry_path)
+        except FileNotFoundError:
+            # Evicted by another run since the check
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def store(self, key, path, artifacts=None):
+        # Artifacts first: the shot file is what marks the entry as present
+        files = [(suffix, artifact) for suffix, artifact in (artifacts or {}).items() if os.path.exists(artifact)]
+        for suffix, artifact in files + [('mp4', path)]:
+            entry_path = self._entry_path(key, suffix)
+            if os.path.exists(entry_path) and os.path.samefile(artifact, entry_path):
+                # Already linked from the cache; renaming a link over itself would leave the tmp behind
+                continue
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            # Unique per thread too: serve runs several jobs in one process
+            tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            try:
+                link_or_copy(artifact, tmp_path)
+                os.replace(tmp_path, entry_path)
+            except OSError as e:
+                logging.warning(f"Could not store {artifact} in render cache: {e}")
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+                return
+
+    def evict(self):
+        # An entry is the shot file plus its artifacts; the shot's mtime dates all of them
+        entries = {}
+        for dirpath, _, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                key, _, suffix = filename.partition('.')
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    # Evicted by a concurrent run (serve --concurrent-jobs, a shared cache)
+                    continue
+                entry = entries.setdefault(key, {'mtime': 0.0, 'size': 0, 'paths': []})
+                entry['size'] += stat.st_size
+                entry['paths'].append(path)
+                if suffix == 'mp4':
+                    entry['mtime'] = stat.st_mtime
+
+        # Artifacts left without their shot (mtime 0) go first
+        ordered = sorted(entries.values(), key=lambda entry: entry['mtime'])
+        now = time.time()
+        max_age = self.max_age_days * 86400
+        total_bytes = sum(entry['size'] for entry in ordered)
+        evicted = 0
+
+        for entry in ordered:
+            if now - entry['mtime'] <= max_age and total_bytes <= self.max_bytes:
+                break
+            for path in entry['paths']:
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+            total_bytes -= entry['size']
+            evicted += 1
+
+        if evicted:
+            logging.info(f"Render cache: evicted {evicted} entries, {total_bytes / 1024 ** 2:.0f} MB kept")
@@ -0,0 +1,50 @@
+import os
+
+# Review proxies: shot files already in the format Kitsu normalizes uploads to, so
+# they can be published with normalization off and the server only stores them.
+# No heavy imports here: the publisher and the API use the path helpers too.
+
+PROXY_DIR = 'proxies'
+POSTER_DIR = 'posters'
+
+# Kitsu's default preview resolution; smaller sources are never upscaled
+PROXY_MAX_WIDTH = 1920
+PROXY_MAX_HEIGHT = 1080
+
+PROXY_OPTIONS = {
+    'vcodec': 'libx264',
+    'pix_fmt': 'yuv420p',
+    'preset': 'medium',
+    'crf': 23,
+    'movflags': '+faststart'
+}
+
+POSTER_OPTIONS = {
+    'vframes': 1,
+    'q:v': 2
+}
+
+# Render cache suffixes of the extra artifacts stored next to each shot
+PROXY_SUFFIX = 'proxy.mp4'
+POSTER_SUFFIX = 'poster.jpg'
+
+
+def proxy_path(shot_path):
+    # <dir>/<shot>.mp4 → <dir>/proxies/<shot>.mp4, out of the way of the shot listing
+    return os.path.join(os.path.dirname(shot_path), PROXY_DIR, os.path.basename(shot_path))
+
+
+def poster_path(shot_path):
+    # <dir>/<shot>.mp4 → <dir>/posters/<shot>.jpg
+    name = os.path.splitext(os.path.basename(shot_path))[0]
+    return os.path.join(os.path.dirname(shot_path), POSTER_DIR, f"{name}.jpg")
+
+
+def review_paths(shot_path):
+    # Render cache suffix → destination of each review artifact of a shot
+    return {PROXY_SUFFIX: proxy_path(shot_path), POSTER_SUFFIX: poster_path(shot_path)}
+
+
+def make_review_dirs(output_dir):
+    for name in (PROXY_DIR, POSTER_DIR):
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
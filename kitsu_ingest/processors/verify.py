@@ -0,0 +1,97 @@
+import os
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from ..utils.validation import FPS_TOLERANCE
+
+# Post-encode integrity check: every exported shot must hold the breakdown's
+# FRAME DURATION frames at its FPS before it is uploaded. Frames are counted from
+# packets (ffprobe -count_packets reads the container, it never decodes), so a
+# shot costs a few milliseconds and hundreds of them verify in seconds.
+
+# ffprobe is a subprocess waiting on I/O: threads, not CPU cores, bound the fan-out
+VERIFY_WORKERS = min(32, (os.cpu_count() or 1) * 4)
+
+# Container durations are rounded to timebase ticks; allow half a frame of slack
+DURATION_TOLERANCE_FRAMES = 0.5
+
+
+def _rate(value):
+    # '24000/1001' → 23.976...; ffprobe reports '0/0' when it cannot tell
+    num, _, den = (value or '').partition('/')
+    try:
+        return float(num) / float(den or 1)
+    except (ValueError, ZeroDivisionError):
+        return None
+
+
+def _number(value, cast=float):
+    try:
+        return cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def probe_output(path):
+    # Frame count, frame rate and duration of the first video stream of an output
+    args = [
+        'ffprobe', '-v', 'error', '-select_streams', 'v:0', '-count_packets',
+        '-show_entries', 'stream=nb_read_packets,avg_frame_rate,r_frame_rate,duration',
+        '-show_entries', 'format=duration', '-of', 'json', path
+    ]
+    p = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    out, err = p.communicate()
+    if p.returncode != 0:
+        raise RuntimeError(err.decode('utf-8', 'replace').strip() or f"ffprobe exited with {p.returncode}")
+
+    data = json.loads(out.decode('utf-8') or '{}')
+    streams = data.get('streams') or []
+    if not streams:
+        raise RuntimeError("no video stream")
+    stream = streams[0]
+    return {
+        'frames': _number(stream.get('nb_read_packets'), int),
+        'fps': _rate(stream.get('avg_frame_rate')) or _rate(stream.get('r_frame_rate')),
+        'duration': _number(stream.get('duration')) or _number((data.get('format') or {}).get('duration'))
+    }
+
+
+def check_output(path, frames, fps, fps_tolerance=FPS_TOLERANCE):
+    # {check: problem} for one output, empty when it matches the shot table
+    if not os.path.exists(path):
+        return {'missing': "output is missing"}
+    try:
+        probe = probe_output(path)
+    except Exception as e:
+        return {'unreadable': f"unreadable: {e}"}
+
+    problems = {}
+    if probe['frames'] != int(frames):
+        problems['frames'] = f"{probe['frames']} frames, expected {int(frames)}"
+    if probe['fps'] is None or abs(probe['fps'] - float(fps)) > fps_tolerance:
+        problems['fps'] = f"{probe['fps'] or 'unknown'} fps, expected {float(fps):g}"
+    # Against the file's own rate, so a wrong fps is reported once, as an fps problem
+    rate = probe['fps'] or float(fps)
+    if probe['duration'] is not None and \
+            abs(probe['duration'] - int(frames) / rate) > DURATION_TOLERANCE_FRAMES / rate:
+        problems['duration'] = f"{probe['duration']:.3f}s long, expected {int(frames) / rate:.3f}s"
+    return problems
+
+
+def verify_outputs(expected, workers=VERIFY_WORKERS, fps_tolerance=FPS_TOLERANCE):
+    # {path: (frames, fps)} → {path: {check: problem}} for the outputs that failed
+    if not expected:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(workers, len(expected))) as executor:
+        results = executor.map(lambda item: (item[0], check_output(item[0], *item[1], fps_tolerance=fps_tolerance)),
+                               expected.items())
+        return {path: problems for path, problems in results if problems}
+
+
+def describe(problems):
+    return '; '.join(problems.values())
+
+
+def can_reencode(problems):
+    # The encoders keep the source frame rate, so re-encoding cannot fix an fps mismatch
+    return set(problems) != {'fps'}
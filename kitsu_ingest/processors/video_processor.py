@@ -1,56 +1,706 @@
 import os
+import bisect
+import itertools
 import logging
+import tempfile
+import threading
+import time
 import ffmpeg
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, FIRST_COMPLETED
+from .frame_index import FrameIndex
+from .review import PROXY_MAX_WIDTH, PROXY_MAX_HEIGHT, PROXY_OPTIONS, POSTER_OPTIONS, proxy_path, poster_path, \
+    review_paths, make_review_dirs
+from .verify import VERIFY_WORKERS, check_output, describe, can_reencode
+from .cut_detect import cached_scores, detect_cuts, compare_cuts
+from ..utils.metrics import metrics
+from ..utils.history import KIND_ENCODE
+from ..utils.validation import resolve_mismatches, MISMATCH_CONTINUE, CUT_REPORT_NAME, MAX_LOGGED_MISMATCHES
+from ..options import MODE_SEQUENTIAL, MODE_SINGLE_PASS, MODE_PARALLEL, MODE_SMART_CUT, MODE_DISTRIBUTED, MODES, \
+    DEFAULT_MAX_OUTPUTS, SHOT_ENCODED, SHOT_CACHED, SHOT_FAILED, DEFAULT_VERIFY_RETRIES
+
+ENCODE_OPTIONS = {
+    'vcodec': 'libx264',
+    'pix_fmt': 'yuv420p',
+    'crf': 18
+}
+
+SEGMENT_COPY = 'copy'
+SEGMENT_ENCODE = 'encode'
+
+# Source streams we can copy GOPs from and still produce a uniform H.264 file
+SMART_CUT_PROFILES = {
+    'Constrained Baseline': 'baseline',
+    'Baseline': 'baseline',
+    'Main': 'main',
+    'High': 'high'
+}
+
+# Modes whose per-shot encode time is that shot's own cost, worth keeping for --plan:
+# single-pass shares one decode across a chunk, distributed shots run on other nodes
+HISTORY_MODES = (MODE_SEQUENTIAL, MODE_PARALLEL, MODE_SMART_CUT)
+
+
+def resolve_cpu_budget(jobs=None, threads_per_job=None):
+    # Split the available cores between concurrent encodes so jobs * threads
+    # never exceeds the machine, unless both values are given explicitly.
+    cpu_count = os.cpu_count() or 1
+    if jobs is None:
+        jobs = max(1, cpu_count // threads_per_job) if threads_per_job else cpu_count
+    if threads_per_job is None:
+        threads_per_job = max(1, cpu_count // jobs)
+    return jobs, threads_per_job
+
+
+def _error_text(error):
+    stderr = getattr(error, 'stderr', None)
+    if not stderr:
+        return str(error)
+    return stderr.decode(errors='replace') if isinstance(stderr, bytes) else str(stderr)
+
+
+def proxy_size(width, height):
+    # Fit inside Kitsu's preview resolution without upscaling; libx264 needs even dimensions
+    scale = min(1.0, PROXY_MAX_WIDTH / width, PROXY_MAX_HEIGHT / height)
+    return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+
+def _review_outputs(stream, output_path, nb_frames, review_size, **options):
+    # Proxy and poster frame (the middle frame) of one shot, from a single scale
+    split = stream.filter('scale', *review_size).filter_multi_output('split')
+    poster = split[1].trim(start_frame=nb_frames // 2, end_frame=nb_frames // 2 + 1)
+    return [
+        ffmpeg.output(split[0], proxy_path(output_path), **PROXY_OPTIONS, **options),
+        ffmpeg.output(poster, poster_path(output_path), **POSTER_OPTIONS)
+    ]
+
+
+def _shot_outputs(stream, output_path, nb_frames, review_size=None, **options):
+    # The shot encode and, with review_size, its review artifacts from the same decode
+    if not review_size:
+        return [ffmpeg.output(stream, output_path, **ENCODE_OPTIONS, **options)]
+    split = stream.filter_multi_output('split')
+    return [ffmpeg.output(split[0], output_path, **ENCODE_OPTIONS, **options),
+            *_review_outputs(split[1], output_path, nb_frames, review_size, **options)]
+
+
+def _encode_range(video_path, output_path, seek_time, nb_frames, threads, review_size=None, **extra_options):
+    # Seek on the input so the decoder starts at the range instead of trimming from frame 0
+    input_args = {'ss': seek_time} if seek_time > 0 else {}
+    trimmed = (
+        ffmpeg.input(video_path, **input_args).video
+        .trim(start_frame=0, end_frame=nb_frames)
+        .setpts('PTS-STARTPTS')
+    )
+    outputs = _shot_outputs(trimmed, output_path, nb_frames, review_size, threads=threads, **extra_options)
+    ffmpeg.merge_outputs(*outputs).overwrite_output().run(quiet=True)
+
+
+def _copy_range(video_path, output_path, seek_time, nb_frames):
+    # seek_time must fall inside the first frame of the range, which has to be a keyframe
+    (
+        ffmpeg
+        .input(video_path, ss=seek_time).video
+        .output(output_path, vcodec='copy', format='mpegts', vframes=nb_frames, **{'bsf:v': 'h264_mp4toannexb'})
+        .overwrite_output()
+        .run(quiet=True)
+    )
+
+
+def _encode_shot(video_path, output_path, seek_time, nb_frames, threads, review_size=None):
+    # Runs in a worker process
+    try:
+        _encode_range(video_path, output_path, seek_time, nb_frames, threads, review_size)
+        return None
+    except ffmpeg.Error as e:
+        return _error_text(e)
+
+
+def _smart_cut_shot(video_path, output_path, segments, threads, encode_options, review_size=None):
+    # Runs in a worker process. Each segment is ('copy' | 'encode', seek_time, nb_frames);
+    # every piece is written as Annex B MPEG-TS so the per-piece SPS/PPS survive the concat.
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(output_path)) as tmp_dir:
+        parts = []
+        try:
+            for idx, (kind, seek_time, nb_frames) in enumerate(segments):
+                part_path = os.path.join(tmp_dir, f"part_{idx:03d}.ts")
+                if kind == SEGMENT_COPY:
+                    _copy_range(video_path, part_path, seek_time, nb_frames)
+                else:
+                    _encode_range(video_path, part_path, seek_time, nb_frames, threads,
+                                  format='mpegts', **encode_options)
+                parts.append(part_path)
+
+            list_path = os.path.join(tmp_dir, 'parts.txt')
+            with open(list_path, 'w') as f:
+                f.writelines(f"file '{part}'\n" for part in parts)
+
+            (
+                ffmpeg
+                .input(list_path, format='concat', safe=0)
+                .output(output_path, vcodec='copy', movflags='+faststart')
+                .overwrite_output()
+                .run(quiet=True)
+            )
+            if review_size:
+                # Copied GOPs cannot be scaled: derive the review artifacts from the cut shot
+                nb_frames = sum(segment[2] for segment in segments)
+                outputs = _review_outputs(ffmpeg.input(output_path).video, output_path, nb_frames, review_size,
+                                          threads=threads)
+                ffmpeg.merge_outputs(*outputs).overwrite_output().run(quiet=True)
+            return None
+        except ffmpeg.Error as e:
+            return _error_text(e)
 
 
 class VideoProcessor:
-    def __init__(self, video_path, shots_data, output_dir):
+    def __init__(self, video_path, shots_data, output_dir, mode=MODE_SEQUENTIAL, max_outputs=DEFAULT_MAX_OUTPUTS,
+                 jobs=None, threads_per_job=None, cache=None, index=None, on_exported=None, on_shot=None,
+                 review=False, verify=False, verify_retries=DEFAULT_VERIFY_RETRIES, check_cuts=False,
+                 on_mismatch=MISMATCH_CONTINUE, shared_dir=None, history=None):
+        if mode not in MODES:
+            raise ValueError(f"Unknown video mode '{mode}'. Expected one of: {', '.join(MODES)}")
+        if max_outputs < 1:
+            raise ValueError("max_outputs must be at least 1")
+        if (jobs is not None and jobs < 1) or (threads_per_job is not None and threads_per_job < 1):
+            raise ValueError("jobs and threads_per_job must be at least 1")
+        if verify_retries < 0:
+            raise ValueError("verify_retries cannot be negative")
+        if mode == MODE_DISTRIBUTED and not shared_dir:
+            raise ValueError("The distributed mode needs a shared_dir that the workers also see")
+
         self.video_path = video_path
         self.shots_data = shots_data
         self.output_dir = output_dir
+        self.mode = mode
+        self.max_outputs = max_outputs
+        self.jobs, self.threads_per_job = resolve_cpu_budget(jobs, threads_per_job)
+        self.cache = cache
+        self.index = index
+        self.on_exported = on_exported
+        self.on_shot = on_shot
+        # Also write a review proxy and poster frame per shot (see review.py)
+        self.review = review
+        self.review_size = None
+        # Probe every output against the shot table before handing it on (see verify.py)
+        self.verify = verify
+        self.verify_retries = verify_retries
+        self._verifier = None
+        # Bounds the shots waiting on a probe, so a blocking on_exported (a full
+        # publish queue) still pauses encoding when every shot goes through a verifier
+        self._verify_slots = None
+        self._checks = []
+        self._rejected = {}
+        # Match the cuts found in the source against the breakdown before encoding;
+        # on_mismatch decides what a shifted cut does (see cut_detect.py). The detector
+        # is a heuristic, so by default an offset cut only warns.
+        self.check_cuts = check_cuts
+        self.on_mismatch = on_mismatch
+        # Cuts that passed preflight(), None until it has run
+        self._cuts = None
+        # Job folder root for the distributed mode (see distributed.py)
+        self.shared_dir = shared_dir
+        # ThroughputHistory that measured encodes are added to
+        self.history = history
+        # How each shot was actually encoded, when it differs from mode: smart cut falls
+        # back to full encodes, and verification re-encodes like the parallel mode
+        self._encode_modes = {}
         self.processed_files = []
 
-    def process(self):
-        input_stream = ffmpeg.input(self.video_path)
+    def _build_cuts(self):
+        # (shot_name, start_frame, end_frame, fps), laid end to end from frame 0
+        cuts = []
         last_frame = 0
+        for shot_name, (length, fps) in self.shots_data.items():
+            end_frame = last_frame + int(length)
+            cuts.append((shot_name, last_frame, end_frame, fps))
+            last_frame = end_frame
+        return cuts
+
+    def _output_path(self, shot_name):
+        return os.path.join(self.output_dir, f"{shot_name}.mp4")
+
+    def _notify(self, shot_name, output_path, status=SHOT_ENCODED, seconds=None):
+        if self._verifier:
+            # Held back until its probe passes; encoding carries on meanwhile, unless
+            # `jobs` shots are already waiting on probes or on a blocked on_exported
+            self._verify_slots.acquire()
+            self._checks.append(self._verifier.submit(self._verify_shot, shot_name, output_path, status, seconds))
+        else:
+            self._deliver(shot_name, output_path, status, seconds)
+
+    def _deliver(self, shot_name, output_path, status, seconds):
+        # Hand each finished shot to the caller (e.g. the publish pipeline) as soon as it is written
+        mode = self._encode_modes.get(shot_name, self.mode)
+        if self.history and status == SHOT_ENCODED and seconds and mode in HISTORY_MODES:
+            self._record_history(shot_name, output_path, seconds, mode)
+        if self.on_shot:
+            self.on_shot(shot_name, status, output_path=output_path, seconds=seconds)
+        if self.on_exported:
+            self.on_exported(shot_name, output_path)
+
+    def _record_history(self, shot_name, output_path, seconds, mode):
+        length, fps = self.shots_data[shot_name]
+        stream = self.index.stream
+        fields = {
+            'mode': mode,
+            'codec': stream.get('codec_name'),
+            'width': stream.get('width'),
+            'height': stream.get('height'),
+            'fps': float(fps),
+            'frames': int(length),
+            'seconds': seconds,
+            # ffmpeg uses every core when it runs alone
+            'threads': (os.cpu_count() or 1) if mode == MODE_SEQUENTIAL else self.threads_per_job,
+            'bytes': os.path.getsize(output_path)
+        }
+        if self.review and os.path.exists(proxy_path(output_path)):
+            fields['proxy_bytes'] = os.path.getsize(proxy_path(output_path))
+        self.history.add(KIND_ENCODE, **fields)
+
+    def _notify_failed(self, shot_name, error, seconds=None):
+        if self.on_shot:
+            self.on_shot(shot_name, SHOT_FAILED, error=error, seconds=seconds)
+
+    def _verify_shot(self, shot_name, output_path, status, seconds):
+        # Runs on a verifier thread; the slot is held until the shot has been delivered
+        try:
+            started = time.monotonic()
+            length, fps = self.shots_data[shot_name]
+            problems = check_output(output_path, int(length), fps)
+            metrics.observe('verify_seconds', time.monotonic() - started)
+            if problems:
+                logging.warning(f"Verification failed for {shot_name}: {describe(problems)}")
+                self._rejected[shot_name] = problems
+            else:
+                self._deliver(shot_name, output_path, status, seconds)
+        finally:
+            self._verify_slots.release()
+
+    def _collect_rejected(self):
+        # Wait for the probes in flight, return the shots rejected since the last call
+        checks, self._checks = self._checks, []
+        for future in checks:
+            # Re-raise what the on_shot and on_exported callbacks raised on verifier threads
+            future.result()
+        rejected, self._rejected = self._rejected, {}
+        return rejected
 
+    def _discard(self, shot_name):
+        # Drop an output and its review artifacts; removed, never truncated, as they may be cache links
+        output_path = self._output_path(shot_name)
+        if output_path in self.processed_files:
+            self.processed_files.remove(output_path)
+        for path in [output_path, *(self._review_artifacts(output_path) or {}).values()]:
+            if os.path.lexists(path):
+                os.remove(path)
+
+    def _settle_verification(self, cuts):
+        # Re-encode the shots whose output failed verification, then give up on those
+        # still failing. Returns the re-encoded cuts that passed, for the render cache.
+        rejected = self._collect_rejected()
+        reencoded = []
+        for attempt in range(self.verify_retries):
+            retry = [cut for cut in cuts if cut[0] in rejected and can_reencode(rejected[cut[0]])]
+            if not retry:
+                break
+            logging.warning(f"Re-encoding {len(retry)} shots that failed verification")
+            for shot_name, start_frame, end_frame, fps in retry:
+                self._discard(shot_name)
+                rejected.pop(shot_name)
+            metrics.count('shots_reencoded', len(retry))
+            # Per-shot full re-encodes whatever the mode: a copied GOP or a shared chunk
+            # decode may be what went wrong the first time
+            self._process_parallel(retry)
+            rejected.update(self._collect_rejected())
+            reencoded.extend(cut for cut in retry if cut[0] not in rejected)
+
+        failed = [cut[0] for cut in cuts if cut[0] in rejected]
+        for shot_name in failed:
+            self._discard(shot_name)
+            self._notify_failed(shot_name, f"Verification failed: {describe(rejected[shot_name])}")
+        metrics.count('verify_failed', len(failed))
+        if failed:
+            logging.warning(f"{len(failed)} shots failed verification and will not be published: {', '.join(failed)}")
+        return reencoded
+
+    @metrics.span('video')
+    def process(self):
         logging.info(f"Processing video: {self.video_path}")
         logging.info(f"Found {len(self.shots_data)} shots to process")
 
-        for idx, (shot_name, (length, fps)) in enumerate(self.shots_data.items(), 1):
-            start_frame = last_frame
-            end_frame = last_frame + length
+        cuts = self.preflight()
+
+        if self.review:
+            self.review_size = proxy_size(int(self.index.stream['width']), int(self.index.stream['height']))
+            make_review_dirs(self.output_dir)
+            logging.info(f"Writing review proxies at {self.review_size[0]}x{self.review_size[1]} with poster frames")
+
+        if self.verify:
+            self._verifier = ThreadPoolExecutor(max_workers=VERIFY_WORKERS, thread_name_prefix='verify')
+            self._verify_slots = threading.BoundedSemaphore(self.jobs)
+        try:
+            stored, cache_keys = self._encode_and_verify(cuts)
+        finally:
+            if self._verifier:
+                self._verifier.shutdown(wait=True)
+                self._verifier = None
+
+        if self.cache:
+            for shot_name, start_frame, end_frame, fps in stored:
+                output_path = self._output_path(shot_name)
+                if output_path in self.processed_files:
+                    self.cache.store(cache_keys[shot_name], output_path, self._review_artifacts(output_path))
+            self.cache.evict()
+
+        # Cache hits and engine results arrive separately; report them in breakdown order
+        exported = set(self.processed_files)
+        self.processed_files = [
+            self._output_path(shot_name) for shot_name in self.shots_data
+            if self._output_path(shot_name) in exported
+        ]
+
+        metrics.count('output_bytes', sum(os.path.getsize(path) for path in self.processed_files))
+        if self.review:
+            metrics.count('proxy_bytes', sum(os.path.getsize(proxy_path(path)) for path in self.processed_files
+                                             if os.path.exists(proxy_path(path))))
+        logging.info(f"Video processing complete. Exported {len(self.processed_files)} shots.")
+        return self.processed_files
+
+    def preflight(self):
+        # Index the source and check it against the breakdown, without encoding. Called
+        # by process(); callers that publish as they encode run it first, so a reel that
+        # does not match fails before anything is pushed to Kitsu.
+        if self._cuts is not None:
+            return self._cuts
+        if self.index is None:
+            with metrics.span('video.index'):
+                self.index = FrameIndex.for_video(self.video_path)
+
+        cuts = self._build_cuts()
+        self._check_length(cuts)
+        if self.check_cuts:
+            with metrics.span('video.cuts'):
+                excluded = self._check_cuts(cuts)
+            cuts = [cut for cut in cuts if cut[0] not in excluded]
+        self._cuts = cuts
+        return cuts
 
+    def _encode_and_verify(self, cuts):
+        # Returns the cuts encoded by this run, whose outputs belong in the render cache, and their keys
+        all_cuts = cuts
+        cache_keys = {}
+        if self.cache:
+            cuts, cache_keys = self._fetch_cached(cuts)
+
+        if cuts:
+            started = time.monotonic()
+            with metrics.span('video.encode', mode=self.mode):
+                self._encode(cuts)
+            self._record_encode(cuts, time.monotonic() - started)
+
+        if self.verify:
+            with metrics.span('video.verify'):
+                # Cache hits are checked too: a bad entry is replaced by the re-encode
+                reencoded = self._settle_verification(all_cuts)
+            encoded = {cut[0]: cut for cut in [*cuts, *reencoded]}
+            cuts = list(encoded.values())
+        return cuts, cache_keys
+
+    def _record_encode(self, cuts, elapsed):
+        exported = set(self.processed_files)
+        frames = sum(end_frame - start_frame for shot_name, start_frame, end_frame, fps in cuts
+                     if self._output_path(shot_name) in exported)
+        metrics.count('shots_encoded', sum(1 for cut in cuts if self._output_path(cut[0]) in exported))
+        metrics.count('frames_encoded', frames)
+        if elapsed > 0:
+            metrics.gauge('encode_fps', frames / elapsed, mode=self.mode)
+
+    def _check_length(self, cuts):
+        # Fail before any encoding when the breakdown runs past the end of the video
+        needed = cuts[-1][2] if cuts else 0
+        if needed > self.index.total_frames:
+            raise ValueError(
+                f"Breakdown needs {needed} frames but {self.video_path} only has {self.index.total_frames}. "
+                f"Check the CSV 'FRAME DURATION' values against the video.")
+        if needed < self.index.total_frames:
+            logging.warning(f"Breakdown covers {needed} of {self.index.total_frames} video frames; "
+                            f"the trailing {self.index.total_frames - needed} frames are ignored")
+
+    def _check_cuts(self, cuts):
+        # Returns the shots not to encode
+        scores = cached_scores(self.video_path, self.index.fingerprint)
+        detected = detect_cuts(scores)
+        shifted, undetected = compare_cuts(detected, [cut[:3] for cut in cuts])
+        aligned = max(0, len(cuts) - 1 - len(shifted) - len(undetected))
+        logging.info(f"Cut check: {aligned} of {max(0, len(cuts) - 1)} breakdown cuts found in the video, "
+                     f"{len(shifted)} offset, {len(undetected)} not detected (dissolves and match cuts are not)")
+        metrics.count('cuts_offset', len(shifted))
+        if not shifted:
+            return set()
+
+        for shot_name, entry in list(shifted.items())[:MAX_LOGGED_MISMATCHES]:
+            logging.warning(f"Cut into {shot_name} is at frame {entry['detected_frame']}, "
+                            f"breakdown has it at {entry['expected_frame']} ({entry['offset']:+d} frames)")
+        offsets = [entry['offset'] for entry in shifted.values()]
+        common = max(set(offsets), key=offsets.count)
+        logging.warning(f"First offset cut is into {next(iter(shifted))}, most common offset {common:+d} frames. "
+                        f"Check the reel for a slate, or for dropped or added frames.")
+        report = {"cut_offsets": shifted, "undetected_cuts": undetected}
+        excluded = resolve_mismatches(report, self.on_mismatch, self.output_dir, report_name=CUT_REPORT_NAME,
+                                      problem="Video cuts do not match the breakdown")
+        for shot_name, start_frame, end_frame, fps in cuts:
+            if shot_name in excluded:
+                self._notify_failed(shot_name, "Cut mismatch between the video and the breakdown")
+        return excluded
+
+    def _review_artifacts(self, output_path):
+        return review_paths(output_path) if self.review else None
+
+    def _shot_task(self, shot_name, start_frame, end_frame):
+        return _encode_shot, (self.video_path, self._output_path(shot_name),
+                              self.index.seek_before(start_frame), end_frame - start_frame, self.threads_per_job,
+                              self.review_size)
+
+    def _encode(self, cuts):
+        if self.mode == MODE_SINGLE_PASS:
+            self._process_single_pass(cuts)
+        elif self.mode == MODE_PARALLEL:
+            self._process_parallel(cuts)
+        elif self.mode == MODE_SMART_CUT:
+            self._process_smart_cut(cuts)
+        elif self.mode == MODE_DISTRIBUTED:
+            self._process_distributed(cuts)
+        else:
+            self._process_sequential(cuts)
+
+    def _fetch_cached(self, cuts):
+        # Link cached renders into the output directory, return the cuts still to encode
+        source = self.index.fingerprint
+        # The shot itself does not depend on review, so runs with and without proxies
+        # share entries; a review run misses until an entry also holds its artifacts
+        params = {'mode': self.mode, **ENCODE_OPTIONS}
+        cache_keys = {}
+        remaining = []
+
+        for shot_name, start_frame, end_frame, fps in cuts:
+            started = time.monotonic()
+            key = self.cache.key(source, start_frame, end_frame, fps, params)
+            cache_keys[shot_name] = key
+            output_path = self._output_path(shot_name)
+            artifacts = self._review_artifacts(output_path)
+            if self.cache.fetch(key, output_path, artifacts):
+                logging.info(f"Cached: {output_path}")
+                self.processed_files.append(output_path)
+                self._notify(shot_name, output_path, SHOT_CACHED, time.monotonic() - started)
+            else:
+                # Never let ffmpeg truncate a file that may be hard-linked into the cache
+                for path in [output_path, *(artifacts or {}).values()]:
+                    if os.path.lexists(path):
+                        os.remove(path)
+                remaining.append((shot_name, start_frame, end_frame, fps))
+
+        metrics.count('render_cache_hits', len(cuts) - len(remaining))
+        metrics.count('render_cache_misses', len(remaining))
+        logging.info(f"Render cache: {len(cuts) - len(remaining)} hits, {len(remaining)} shots to encode")
+        return remaining, cache_keys
+
+    def _process_sequential(self, cuts):
+        input_stream = ffmpeg.input(self.video_path)
+
+        for idx, (shot_name, start_frame, end_frame, fps) in enumerate(cuts, 1):
             trimmed = (
                 input_stream.video
                 .trim(start_frame=start_frame, end_frame=end_frame)
                 .setpts('PTS-STARTPTS')
             )
 
-            output_path = os.path.join(self.output_dir, f"{shot_name}.mp4")
+            output_path = self._output_path(shot_name)
+            started = time.monotonic()
 
             try:
-                logging.info(f"Processing shot {idx}/{len(self.shots_data)}: {shot_name} ({start_frame}→{end_frame})")
-
-                (
-                    ffmpeg
-                    .output(
-                        trimmed,
-                        output_path,
-                        vcodec='libx264',
-                        pix_fmt='yuv420p',
-                        crf=18
-                    )
-                    .overwrite_output()
-                    .run(quiet=True)
-                )
+                logging.info(f"Processing shot {idx}/{len(cuts)}: {shot_name} ({start_frame}→{end_frame})")
+
+                outputs = _shot_outputs(trimmed, output_path, end_frame - start_frame, self.review_size)
+                ffmpeg.merge_outputs(*outputs).overwrite_output().run(quiet=True)
                 logging.info(f"Exported: {output_path}")
                 self.processed_files.append(output_path)
+                self._notify(shot_name, output_path, seconds=time.monotonic() - started)
             except ffmpeg.Error as e:
-                logging.warning(
-                    f"Failed to export {shot_name}: {e.stderr.decode() if hasattr(e, 'stderr') else str(e)}")
+                logging.warning(f"Failed to export {shot_name}: {_error_text(e)}")
+                self._notify_failed(shot_name, _error_text(e), time.monotonic() - started)
 
-            last_frame = end_frame
+    def _process_single_pass(self, cuts):
+        # Decode the source once per chunk and fan it out to one encoder per shot.
+        # Chunks after the first seek to their first frame, so the total decode
+        # cost stays linear in the length of the video.
+        chunks = [cuts[i:i + self.max_outputs] for i in range(0, len(cuts), self.max_outputs)]
 
-        logging.info(f"Video processing complete. Exported {len(self.processed_files)} shots.")
-        return self.processed_files
\ No newline at end of file
+        for chunk_idx, chunk in enumerate(chunks, 1):
+            chunk_start = chunk[0][1]
+
+            input_args = {}
+            if chunk_start > 0:
+                input_args['ss'] = self.index.seek_before(chunk_start)
+            input_stream = ffmpeg.input(self.video_path, **input_args)
+            split = input_stream.video.filter_multi_output('split')
+
+            outputs = []
+            for branch, (shot_name, start_frame, end_frame, fps) in enumerate(chunk):
+                trimmed = (
+                    split[branch]
+                    .trim(start_frame=start_frame - chunk_start, end_frame=end_frame - chunk_start)
+                    .setpts('PTS-STARTPTS')
+                )
+                outputs.extend(_shot_outputs(trimmed, self._output_path(shot_name), end_frame - start_frame,
+                                             self.review_size))
+
+            logging.info(f"Processing chunk {chunk_idx}/{len(chunks)}: "
+                         f"{len(chunk)} shots ({chunk_start}→{chunk[-1][2]}) in a single decode")
+
+            error = None
+            started = time.monotonic()
+            try:
+                ffmpeg.merge_outputs(*outputs).overwrite_output().run(quiet=True)
+            except ffmpeg.Error as e:
+                error = _error_text(e)
+            # Shots of a chunk are encoded together and share its duration
+            elapsed = time.monotonic() - started
+
+            for shot_name, start_frame, end_frame, fps in chunk:
+                output_path = self._output_path(shot_name)
+                if error is None and os.path.exists(output_path):
+                    logging.info(f"Exported: {output_path}")
+                    self.processed_files.append(output_path)
+                    self._notify(shot_name, output_path, seconds=elapsed)
+                else:
+                    logging.warning(f"Failed to export {shot_name}: {error or 'no output written'}")
+                    self._notify_failed(shot_name, error or 'no output written', elapsed)
+
+    def _process_parallel(self, cuts):
+        self._encode_modes.update((cut[0], MODE_PARALLEL) for cut in cuts)
+        self._run_pool(cuts, {
+            shot_name: self._shot_task(shot_name, start_frame, end_frame)
+            for shot_name, start_frame, end_frame, fps in cuts
+        })
+
+    def _run_pool(self, cuts, tasks):
+        logging.info(f"Encoding with {self.jobs} parallel jobs, {self.threads_per_job} threads each")
+        errors = {}
+
+        # Submit lazily, at most one shot per job in flight, so a blocking on_exported
+        # callback (a full publish queue) also pauses encoding.
+        pending = iter(tasks.items())
+        done_count = 0
+        with ProcessPoolExecutor(max_workers=self.jobs) as executor:
+            futures = {}
+            for shot_name, (worker, worker_args) in itertools.islice(pending, self.jobs):
+                futures[executor.submit(worker, *worker_args)] = (shot_name, time.monotonic())
+
+            while futures:
+                finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    shot_name, submitted = futures.pop(future)
+                    try:
+                        errors[shot_name] = future.result()
+                    except Exception as e:
+                        errors[shot_name] = str(e)
+                    done_count += 1
+                    logging.info(f"Processed shot {done_count}/{len(cuts)}: {shot_name}")
+                    if errors[shot_name] is None:
+                        self._notify(shot_name, self._output_path(shot_name), seconds=time.monotonic() - submitted)
+                    else:
+                        self._notify_failed(shot_name, errors[shot_name], time.monotonic() - submitted)
+
+                    for next_name, (worker, worker_args) in itertools.islice(pending, 1):
+                        futures[executor.submit(worker, *worker_args)] = (next_name, time.monotonic())
+
+        # Report in breakdown order regardless of completion order
+        for shot_name, start_frame, end_frame, fps in cuts:
+            output_path = self._output_path(shot_name)
+            if errors.get(shot_name) is None:
+                logging.info(f"Exported: {output_path}")
+                self.processed_files.append(output_path)
+            else:
+                logging.warning(f"Failed to export {shot_name}: {errors[shot_name]}")
+
+    def _smart_cut_options(self):
+        # libx264 settings matching the source, or None when GOPs cannot be copied as-is
+        stream = self.index.stream
+        profile = SMART_CUT_PROFILES.get(stream.get('profile'))
+        if stream.get('codec_name') != 'h264' or stream.get('pix_fmt') != 'yuv420p' or not profile:
+            logging.info(f"Source is {stream.get('codec_name')} {stream.get('profile')} {stream.get('pix_fmt')}, "
+                         f"smart cut needs H.264 yuv420p")
+            return None
+
+        options = {'profile:v': profile}
+        if stream.get('level'):
+            options['level'] = f"{int(stream['level']) / 10:.1f}"
+        return options
+
+    def _process_smart_cut(self, cuts):
+        encode_options = self._smart_cut_options()
+        if encode_options is None:
+            logging.info("Falling back to full re-encode")
+            self._process_parallel(cuts)
+            return
+
+        keyframes = self.index.keyframes
+        tasks = {}
+        copied_frames = 0
+
+        for shot_name, start_frame, end_frame, fps in cuts:
+            # Copy whole GOPs between the first keyframe at/after the start and the
+            # last keyframe at/before the end; re-encode the partial GOPs around them.
+            first_pos = bisect.bisect_left(keyframes, start_frame)
+            last_pos = bisect.bisect_right(keyframes, end_frame) - 1
+            if first_pos >= len(keyframes) or last_pos < 0 or keyframes[last_pos] <= keyframes[first_pos]:
+                # No whole GOP to copy: a full encode, timed like the parallel mode's
+                tasks[shot_name] = self._shot_task(shot_name, start_frame, end_frame)
+                self._encode_modes[shot_name] = MODE_PARALLEL
+                continue
+            first_key, last_key = keyframes[first_pos], keyframes[last_pos]
+
+            segments = []
+            if start_frame < first_key:
+                segments.append((SEGMENT_ENCODE, self.index.seek_before(start_frame), first_key - start_frame))
+            segments.append((SEGMENT_COPY, self.index.seek_into(first_key), last_key - first_key))
+            if last_key < end_frame:
+                segments.append((SEGMENT_ENCODE, self.index.seek_before(last_key), end_frame - last_key))
+
+            copied_frames += last_key - first_key
+            self._encode_modes[shot_name] = MODE_SMART_CUT
+            tasks[shot_name] = (_smart_cut_shot, (self.video_path, self._output_path(shot_name), segments,
+                                                  self.threads_per_job, encode_options, self.review_size))
+
+        total_frames = sum(end_frame - start_frame for _, start_frame, end_frame, _ in cuts)
+        logging.info(f"Smart cut: copying {copied_frames}/{total_frames} frames without re-encoding")
+        self._run_pool(cuts, tasks)
+
+    def _process_distributed(self, cuts):
+        # Per-shot seeking encodes, like the parallel mode, run by `kitsu-ingest worker`
+        # processes on any node that mounts shared_dir
+        from ..distributed import DistributedJob, RESULT_OK
+
+        job = DistributedJob.create(self.shared_dir, self.video_path, [
+            {'shot': shot_name, 'seek_time': self.index.seek_before(start_frame), 'nb_frames': end_frame - start_frame}
+            for shot_name, start_frame, end_frame, fps in cuts
+        ], self.review_size)
+        logging.info(f"Distributed job {job.job_id}: {len(cuts)} shots waiting for workers in {job.path}")
+
+        finished = False
+        try:
+            for idx, (shot_name, result) in enumerate(job.results([cut[0] for cut in cuts]), 1):
+                output_path = self._output_path(shot_name)
+                logging.info(f"Processed shot {idx}/{len(cuts)}: {shot_name} on {result['worker']}")
+                if result['status'] == RESULT_OK:
+                    job.collect(shot_name, output_path, self._review_artifacts(output_path))
+                    logging.info(f"Exported: {output_path}")
+                    self.processed_files.append(output_path)
+                    self._notify(shot_name, output_path, seconds=result['seconds'])
+                else:
+                    logging.warning(f"Failed to export {shot_name}: {result['error']}")
+                    self._notify_failed(shot_name, result['error'], result['seconds'])
+            finished = True
+        finally:
+            # An interrupted job is closed too, so workers stop, but kept for inspection
+            job.close(remove=finished)
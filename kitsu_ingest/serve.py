@@ -0,0 +1,346 @@
+import os
+import json
+import time
+import queue
+import signal
+import hashlib
+import argparse
+import logging
+import threading
+from datetime import datetime
+from .core import Workflow, build_parser, check_args, apply_mismatch_defaults
+from .processors.csv_processor import PROCESSED_DIR
+from .utils.metrics import metrics
+from .utils.storage import cache_dir
+from .utils.validation import MISMATCH_ABORT, MISMATCH_PROMPT, MISMATCH_REPORT_NAME
+
+DEFAULT_POLL_INTERVAL = 5.0
+
+# A delivery is picked up once none of its files has changed for this long
+DEFAULT_SETTLE_SECONDS = 30.0
+
+VIDEO_EXTENSIONS = ('.mov', '.mp4', '.mxf', '.mkv', '.avi')
+
+# Left behind by copy tools and browsers while a transfer is still running
+PARTIAL_SUFFIXES = ('.part', '.partial', '.tmp', '.crdownload', '.filepart')
+
+# Per-job overrides: <name>.json next to a CSV + video pair, job.json inside a push-only folder
+JOB_SETTINGS_NAME = 'job.json'
+JOB_SETTINGS_KEYS = ('project', 'sequence')
+
+JOB_PAIR = 'pair'
+JOB_PUSH_ONLY = 'push-only'
+
+STATUS_DONE = 'done'
+STATUS_FAILED = 'failed'
+STATUS_SKIPPED = 'skipped'
+
+
+def _visible(name):
+    # The mismatch report is written into push-only folders by the job itself and
+    # must not make the folder look changed
+    return not name.startswith('.') and name != MISMATCH_REPORT_NAME
+
+
+def _partial(name):
+    return name.lower().endswith(PARTIAL_SUFFIXES)
+
+
+class Job:
+    # One delivery found in the watch folder
+    def __init__(self, kind, name, files, csv=None, video=None, folder=None, settings_path=None):
+        self.kind = kind
+        self.name = name
+        self.files = files
+        self.csv = csv
+        self.video = video
+        self.folder = folder
+        self.settings_path = settings_path
+        self.signature = None
+
+    @property
+    def key(self):
+        return f"{self.kind}:{self.name}"
+
+    def read_signature(self):
+        # Name, size and mtime of every file of the job; None while a transfer is in progress
+        signature = []
+        for path in sorted(self.files):
+            if _partial(path):
+                return None
+            stat = os.stat(path)
+            signature.append([os.path.basename(path), stat.st_size, stat.st_mtime_ns])
+        return signature
+
+    def load_settings(self):
+        if not self.settings_path:
+            return {}
+        with open(self.settings_path) as f:
+            settings = json.load(f)
+        unknown = set(settings) - set(JOB_SETTINGS_KEYS)
+        if unknown:
+            raise ValueError(f"Unknown keys in {self.settings_path}: {sorted(unknown)}")
+        return settings
+
+
+def scan_watch_dir(root):
+    # Top level: <name>.csv next to <name>.<video> is a CSV + video job. Sub-folders
+    # holding a CSV and shot MP4s are push-only jobs. A lone CSV waits for its video.
+    jobs = []
+    entries = sorted((entry for entry in os.scandir(root) if _visible(entry.name)), key=lambda entry: entry.name)
+
+    files = {entry.name: entry.path for entry in entries if entry.is_file() and not _partial(entry.name)}
+    by_stem = {}
+    for name in files:
+        by_stem.setdefault(os.path.splitext(name)[0], []).append(name)
+    for stem, names in by_stem.items():
+        csvs = [name for name in names if name.lower().endswith('.csv')]
+        videos = [name for name in names if name.lower().endswith(VIDEO_EXTENSIONS)]
+        if not (csvs and videos):
+            continue
+        if len(videos) > 1:
+            logging.warning(f"Several videos for {stem} in the watch folder, using {videos[0]}")
+        settings_path = files.get(f"{stem}.json")
+        job_files = [files[csvs[0]], files[videos[0]]] + ([settings_path] if settings_path else [])
+        jobs.append(Job(JOB_PAIR, stem, job_files, csv=files[csvs[0]], video=files[videos[0]],
+                        settings_path=settings_path))
+
+    for entry in entries:
+        if not entry.is_dir():
+            continue
+        names = [name for name in os.listdir(entry.path) if _visible(name)]
+        if not (any(name.lower().endswith('.csv') for name in names)
+                and any(name.lower().endswith('.mp4') for name in names)):
+            continue
+        settings_path = os.path.join(entry.path, JOB_SETTINGS_NAME)
+        jobs.append(Job(JOB_PUSH_ONLY, entry.name, [os.path.join(entry.path, name) for name in names],
+                        folder=entry.path,
+                        settings_path=settings_path if JOB_SETTINGS_NAME in names else None))
+    return jobs
+
+
+class FolderWatcher:
+    # Polls the watch folder and hands out jobs once their files have settled. Jobs
+    # already run are remembered on disk with the files they ran with, so a restart
+    # does not publish a delivery twice, while a delivery whose files change runs again.
+    def __init__(self, root, settle_seconds=DEFAULT_SETTLE_SECONDS, state_path=None):
+        self.root = os.path.abspath(root)
+        self.settle_seconds = settle_seconds
+        key = hashlib.sha1(self.root.encode('utf-8')).hexdigest()[:16]
+        self.state_path = state_path or os.path.join(cache_dir('serve'), f"{key}.json")
+        self._lock = threading.Lock()
+        self._state = self._load()
+        self._candidates = {}
+
+    def _load(self):
+        try:
+            with open(self.state_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable serve state {self.state_path}: {e}")
+            return {}
+
+    def _save(self):
+        tmp_path = f"{self.state_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    @property
+    def settling(self):
+        return bool(self._candidates)
+
+    def poll(self, now=None):
+        now = time.monotonic() if now is None else now
+        ready = []
+        seen = set()
+        for job in scan_watch_dir(self.root):
+            seen.add(job.key)
+            try:
+                signature = job.read_signature()
+            except OSError:
+                # Moved or deleted while scanning
+                signature = None
+            if signature is None:
+                self._candidates.pop(job.key, None)
+                continue
+
+            with self._lock:
+                previous_run = self._state.get(job.key)
+            if previous_run and previous_run['signature'] == signature:
+                # Already run with these files (possibly while it was settling again)
+                self._candidates.pop(job.key, None)
+                continue
+
+            candidate = self._candidates.get(job.key)
+            if candidate is None or candidate[0] != signature:
+                # New or still being written: restart the settle timer
+                self._candidates[job.key] = (signature, now)
+                continue
+            if now - candidate[1] >= self.settle_seconds:
+                del self._candidates[job.key]
+                job.signature = signature
+                ready.append(job)
+
+        for key in set(self._candidates) - seen:
+            del self._candidates[key]
+        return ready
+
+    def record(self, job, status, error=None):
+        with self._lock:
+            self._state[job.key] = {
+                'signature': job.signature,
+                'status': status,
+                'error': error,
+                'finished_at': datetime.now().isoformat(timespec='seconds')
+            }
+            self._save()
+
+
+class IngestServer:
+    # Runs jobs from the watch folder through a queue. The Kitsu session, the
+    # metadata caches and the imported stages live for the whole process, so a job
+    # only pays for its own encoding and uploads.
+    def __init__(self, args, watcher, poll_interval=DEFAULT_POLL_INTERVAL, concurrent_jobs=1, once=False):
+        self.args = args
+        self.watcher = watcher
+        self.poll_interval = poll_interval
+        self.concurrent_jobs = concurrent_jobs
+        self.once = once
+        self.output_root = args.output_dir or PROCESSED_DIR
+        self.jobs = queue.Queue()
+        self.stop_event = threading.Event()
+        self._pending = set()
+        self._pending_lock = threading.Lock()
+
+    def stop(self, *_):
+        if not self.stop_event.is_set():
+            logging.info("Stopping: running jobs will finish, queued jobs are left for the next start")
+        self.stop_event.set()
+
+    def serve_forever(self):
+        workers = [threading.Thread(target=self._worker, name=f"ingest-job-{i}", daemon=True)
+                   for i in range(self.concurrent_jobs)]
+        for worker in workers:
+            worker.start()
+
+        logging.info(f"Watching {self.watcher.root} (poll every {self.poll_interval:g}s, "
+                     f"files must be unchanged for {self.watcher.settle_seconds:g}s)")
+        while not self.stop_event.is_set():
+            for job in self.watcher.poll():
+                with self._pending_lock:
+                    if job.key in self._pending:
+                        continue
+                    self._pending.add(job.key)
+                logging.info(f"Queued {job.kind} job: {job.name}")
+                self.jobs.put(job)
+            metrics.gauge('serve_queue_depth', self.jobs.qsize())
+
+            if self.once and not self.watcher.settling:
+                with self._pending_lock:
+                    if not self._pending:
+                        break
+            self.stop_event.wait(self.poll_interval)
+
+        for _ in workers:
+            self.jobs.put(None)
+        for worker in workers:
+            worker.join()
+
+    def _worker(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                return
+            try:
+                if not self.stop_event.is_set():
+                    self._run(job)
+            finally:
+                with self._pending_lock:
+                    self._pending.discard(job.key)
+
+    def _job_args(self, job):
+        settings = job.load_settings()
+        args = argparse.Namespace(**vars(self.args))
+        args.csv = args.video = args.push_only = None
+        args.push = settings.get('project', args.push)
+        args.sequence = settings.get('sequence', args.sequence)
+        if job.kind == JOB_PAIR:
+            args.csv, args.video = job.csv, job.video
+            args.pipeline = self.args.pipeline and bool(args.push)
+            args.output_dir = os.path.join(self.output_root, f"{job.name}_{datetime.now():%Y%m%d_%H%M%S}")
+        else:
+            args.push_only = job.folder
+            args.pipeline = False
+        return args
+
+    def _run(self, job):
+        started = time.monotonic()
+        error = None
+        try:
+            args = self._job_args(job)
+            if job.kind == JOB_PUSH_ONLY and not args.push:
+                logging.warning(f"Skipping push-only folder {job.name}: no project "
+                                f"(pass --push or set \"project\" in {JOB_SETTINGS_NAME})")
+                status = STATUS_SKIPPED
+            else:
+                logging.info(f"Starting {job.kind} job: {job.name}")
+                Workflow(args).run()
+                status = STATUS_DONE
+        except Exception as e:
+            # One bad delivery must not take the daemon down; it runs again once its files change
+            logging.exception(f"Job {job.name} failed: {e}")
+            status, error = STATUS_FAILED, str(e)
+
+        elapsed = time.monotonic() - started
+        metrics.count('serve_jobs', status=status)
+        metrics.observe('serve_job_seconds', elapsed, kind=job.kind)
+        self.watcher.record(job, status, error)
+        logging.info(f"Job {job.name} {status} in {elapsed:.1f}s")
+        self._write_metrics()
+
+    def _write_metrics(self):
+        # Cumulative since the daemon started, as a Prometheus textfile collector expects
+        if self.args.metrics_json:
+            metrics.write_json(self.args.metrics_json)
+        if self.args.metrics_prom:
+            metrics.write_prometheus(self.args.metrics_prom)
+
+
+def main(argv=None):
+    parser = build_parser(description='Kitsu Ingest watch-folder daemon', inputs=False)
+    parser.prog = f"{parser.prog} serve"
+    parser.add_argument('--watch', required=True, metavar='DIR',
+                        help='Folder to watch for <name>.csv + <name>.<video> pairs and push-only sub-folders')
+    parser.add_argument('--poll-interval', type=float, default=DEFAULT_POLL_INTERVAL,
+                        help='Seconds between scans of the watch folder')
+    parser.add_argument('--settle', type=float, default=DEFAULT_SETTLE_SECONDS,
+                        help='Seconds a delivery\'s files must stay unchanged before it is processed')
+    parser.add_argument('--concurrent-jobs', type=int, default=1,
+                        help='Deliveries processed at the same time')
+    parser.add_argument('--once', action='store_true',
+                        help='Process what is in the watch folder, then exit')
+
+    args = parser.parse_args(argv)
+    check_args(parser, args)
+    if not os.path.isdir(args.watch):
+        parser.error(f"--watch folder not found: {args.watch}")
+    if args.poll_interval <= 0 or args.settle < 0:
+        parser.error("--poll-interval must be positive and --settle cannot be negative")
+    if args.concurrent_jobs < 1:
+        parser.error("--concurrent-jobs must be at least 1")
+    if args.on_mismatch == MISMATCH_PROMPT:
+        parser.error("--on-mismatch prompt needs a terminal; serve mode runs unattended")
+    if args.profile:
+        parser.error("--profile is not supported in serve mode")
+    apply_mismatch_defaults(args, MISMATCH_ABORT)
+
+    server = IngestServer(args, FolderWatcher(args.watch, settle_seconds=args.settle),
+                          poll_interval=args.poll_interval,
+                          concurrent_jobs=args.concurrent_jobs,
+                          once=args.once)
+    signal.signal(signal.SIGTERM, server.stop)
+    signal.signal(signal.SIGINT, server.stop)
+    server.serve_forever()
@@ -0,0 +1,28 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+
+CHUNK_SIZE = 8 * 1024 * 1024
+
+
+def hash_file(path, chunk_size=CHUNK_SIZE):
+    digest = hashlib.blake2b(digest_size=20)
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    with open(path, 'rb', buffering=0) as f:
+        while True:
+            size = f.readinto(buffer)
+            if not size:
+                break
+            digest.update(view[:size])
+    return digest.hexdigest()
+
+
+def hash_files(paths, workers=None):
+    # hashlib releases the GIL on large buffers, so threads hash files in parallel
+    paths = list(paths)
+    if not paths:
+        return {}
+    workers = workers or min(len(paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return dict(zip(paths, executor.map(hash_file, paths)))
@@ -0,0 +1,75 @@
+import os
+import json
+import math
+import logging
+import threading
+from datetime import datetime
+from .storage import cache_dir
+
+# Measured throughput of past runs, the input of --plan (see planner.py). One JSON
+# line per encoded shot or uploaded file, appended when a run ends; only the most
+# recent MAX_RECORDS lines are read back.
+
+HISTORY_NAME = 'throughput_history.jsonl'
+MAX_RECORDS = 20000
+
+KIND_ENCODE = 'encode'
+KIND_UPLOAD = 'upload'
+
+# Standard frame heights; a source is filed under the first one it fits in
+RESOLUTION_CLASSES = (480, 576, 720, 1080, 1440, 2160, 4320)
+
+
+def resolution_class(height):
+    height = int(height or 0)
+    for limit in RESOLUTION_CLASSES:
+        if height <= limit:
+            return f"{limit}p"
+    return f"{height}p"
+
+
+def length_class(frames):
+    # Powers of two: 24 → '<=32', 100 → '<=128'
+    return f"<={2 ** max(0, math.ceil(math.log2(max(1, int(frames)))))}"
+
+
+class ThroughputHistory:
+    def __init__(self, path=None):
+        self.path = path or os.path.join(cache_dir(), HISTORY_NAME)
+        self._pending = []
+        self._lock = threading.Lock()
+
+    def add(self, kind, **fields):
+        # Buffered: encoder callbacks and publish workers add from several threads
+        with self._lock:
+            self._pending.append({'kind': kind, 'at': datetime.now().isoformat(timespec='seconds'), **fields})
+
+    def flush(self):
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return 0
+        try:
+            # One append per run; O_APPEND keeps lines whole when runs end together
+            with open(self.path, 'a') as f:
+                f.write(''.join(json.dumps(record) + '\n' for record in pending))
+        except OSError as e:
+            # Only the planner loses out: never fail a run over it
+            logging.warning(f"Could not record throughput history in {self.path}: {e}")
+            return 0
+        return len(pending)
+
+    def load(self, kind=None):
+        if not os.path.exists(self.path):
+            return []
+        with open(self.path) as f:
+            lines = f.readlines()[-MAX_RECORDS:]
+        records = []
+        for line in lines:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if kind is None or record.get('kind') == kind:
+                records.append(record)
+        return records
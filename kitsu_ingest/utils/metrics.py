@@ -0,0 +1,188 @@
+import os
+import re
+import json
+import time
+import threading
+import functools
+from contextlib import contextmanager
+from datetime import datetime
+
+PROMETHEUS_PREFIX = 'kitsu_ingest'
+
+# Latency buckets in seconds, from a cached lookup to a large upload
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Kitsu routes embed entity ids; group them per route, not per entity
+_ID_PATTERN = re.compile(r'[0-9a-f]{8}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{4}-[0-9a-f]{12}')
+
+
+def _series(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def _prom_labels(series, **extra):
+    labels = [*series, *extra.items()]
+    if not labels:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"') for _, value in labels)
+    return '{' + ','.join(f'{key}="{value}"' for (key, _), value in zip(labels, escaped)) + '}'
+
+
+def endpoint_name(method, path):
+    return f"{method} {_ID_PATTERN.sub(':id', path.split('?')[0]).strip('/')}"
+
+
+class Metrics:
+    # Spans, counters, gauges and histograms for one run. Thread-safe: publisher
+    # workers and the pipeline record into the same instance.
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.monotonic()
+        self.started_at = datetime.now().isoformat(timespec='seconds')
+        self.spans = []
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    @contextmanager
+    def span(self, name, **labels):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            duration = time.monotonic() - started
+            with self._lock:
+                self.spans.append({
+                    'name': name,
+                    'labels': labels,
+                    'start': started - self.started,
+                    'duration': duration
+                })
+
+    def count(self, name, amount=1, **labels):
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[_series(labels)] = series.get(_series(labels), 0) + amount
+
+    def gauge(self, name, value, **labels):
+        with self._lock:
+            self.gauges.setdefault(name, {})[_series(labels)] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            self.histograms.setdefault(name, {}).setdefault(_series(labels), []).append(value)
+
+    def instrument(self, module, names, metric='api'):
+        # Wrap module-level functions (e.g. gazu.client.get) to count calls and time
+        # them per endpoint. Callers that look the function up on the module at call
+        # time, as gazu's own modules do, are measured too.
+        for name in names:
+            func = getattr(module, name)
+            if getattr(func, '_metrics_wrapped', False):
+                continue
+
+            @functools.wraps(func)
+            def wrapper(path, *args, _func=func, _method=name.upper(), **kwargs):
+                endpoint = endpoint_name(_method, path)
+                started = time.monotonic()
+                try:
+                    return _func(path, *args, **kwargs)
+                except Exception:
+                    self.count(f'{metric}_errors', endpoint=endpoint)
+                    raise
+                finally:
+                    self.count(f'{metric}_calls', endpoint=endpoint)
+                    self.observe(f'{metric}_latency_seconds', time.monotonic() - started, endpoint=endpoint)
+
+            wrapper._metrics_wrapped = True
+            setattr(module, name, wrapper)
+
+    def report(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'duration': time.monotonic() - self.started,
+                'spans': list(self.spans),
+                'counters': {
+                    name: [{'labels': dict(series), 'value': value} for series, value in values.items()]
+                    for name, values in self.counters.items()
+                },
+                'gauges': {
+                    name: [{'labels': dict(series), 'value': value} for series, value in values.items()]
+                    for name, values in self.gauges.items()
+                },
+                'histograms': {
+                    name: [{
+                        'labels': dict(series),
+                        'count': len(samples),
+                        'sum': sum(samples),
+                        'min': min(samples),
+                        'max': max(samples),
+                        'p50': _percentile(samples, 0.5),
+                        'p95': _percentile(samples, 0.95)
+                    } for series, samples in values.items()]
+                    for name, values in self.histograms.items()
+                }
+            }
+
+    def write_json(self, path):
+        _write_atomic(path, json.dumps(self.report(), indent=2))
+
+    def write_prometheus(self, path, buckets=DEFAULT_BUCKETS):
+        # Textfile collector format: node_exporter picks the file up as is
+        lines = []
+        with self._lock:
+            lines.append(f'# TYPE {PROMETHEUS_PREFIX}_stage_seconds gauge')
+            stages = {}
+            for span in self.spans:
+                series = _series({'stage': span['name'], **span['labels']})
+                stages[series] = stages.get(series, 0.0) + span['duration']
+            for series, duration in stages.items():
+                lines.append(f'{PROMETHEUS_PREFIX}_stage_seconds{_prom_labels(series)} {duration:.6f}')
+
+            for name, values in self.counters.items():
+                lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name}_total counter')
+                for series, value in values.items():
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}_total{_prom_labels(series)} {value}')
+
+            for name, values in self.gauges.items():
+                lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} gauge')
+                for series, value in values.items():
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}{_prom_labels(series)} {value}')
+
+            for name, values in self.histograms.items():
+                if not name.endswith('_seconds'):
+                    # Not a latency: the buckets would be meaningless, export quantiles instead
+                    lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} summary')
+                    for series, samples in values.items():
+                        for quantile in (0.5, 0.95):
+                            lines.append(f'{PROMETHEUS_PREFIX}_{name}{_prom_labels(series, quantile=quantile)} '
+                                         f'{_percentile(samples, quantile):.6f}')
+                        lines.append(f'{PROMETHEUS_PREFIX}_{name}_sum{_prom_labels(series)} {sum(samples):.6f}')
+                        lines.append(f'{PROMETHEUS_PREFIX}_{name}_count{_prom_labels(series)} {len(samples)}')
+                    continue
+                lines.append(f'# TYPE {PROMETHEUS_PREFIX}_{name} histogram')
+                for series, samples in values.items():
+                    for bound in buckets:
+                        hits = sum(1 for sample in samples if sample <= bound)
+                        lines.append(f'{PROMETHEUS_PREFIX}_{name}_bucket{_prom_labels(series, le=bound)} {hits}')
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}_bucket{_prom_labels(series, le="+Inf")} {len(samples)}')
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}_sum{_prom_labels(series)} {sum(samples):.6f}')
+                    lines.append(f'{PROMETHEUS_PREFIX}_{name}_count{_prom_labels(series)} {len(samples)}')
+        _write_atomic(path, '\n'.join(lines) + '\n')
+
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+# One instance per process, shared by every stage of the run
+metrics = Metrics()
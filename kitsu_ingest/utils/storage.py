@@ -0,0 +1,42 @@
+import os
+import shutil
+import logging
+
+CACHE_DIR_ENV = 'KITSU_INGEST_CACHE_DIR'
+
+# FICLONE ioctl: copy-on-write clone on filesystems that support it (btrfs, xfs)
+_FICLONE = 0x40049409
+
+
+def cache_dir(*parts):
+    root = os.getenv(CACHE_DIR_ENV) or os.path.join(os.path.expanduser('~'), '.cache', 'kitsu_ingest')
+    path = os.path.join(root, *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def _reflink(src, dst):
+    import fcntl
+
+    with open(src, 'rb') as src_file, open(dst, 'wb') as dst_file:
+        fcntl.ioctl(dst_file.fileno(), _FICLONE, src_file.fileno())
+
+
+def link_or_copy(src, dst):
+    # Hard link, then reflink, then a plain copy. dst is replaced if it exists.
+    if os.path.lexists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+        return 'link'
+    except OSError:
+        pass
+    try:
+        _reflink(src, dst)
+        return 'reflink'
+    except (OSError, ImportError):
+        if os.path.exists(dst):
+            os.remove(dst)
+    shutil.copyfile(src, dst)
+    logging.debug(f"Copied {src} → {dst} (no link support)")
+    return 'copy'
@@ -1,48 +1,83 @@
 import os
-import gazu
+import sys
+import json
 import logging
-import pandas as pd
+import importlib.util
+from datetime import datetime
+
+# pandas is imported by the functions that need it: the CLI imports this module for
+# argument handling and --push_only folder lookups, which must not pay for pandas.
+
+# The pyarrow CSV reader (pandas 1.4+) is multithreaded and much faster on large breakdowns
+CSV_ENGINE = 'pyarrow' if importlib.util.find_spec('pyarrow') else 'c'
+
+METADATA_FIELDS = ("frame_in", "frame_out", "nb_frames", "fps", "description")
+FPS_TOLERANCE = 1e-3
+
+MISMATCH_ABORT = "abort"
+MISMATCH_CONTINUE = "continue"
+MISMATCH_SKIP_SHOT = "skip-shot"
+MISMATCH_PROMPT = "prompt"
+MISMATCH_POLICIES = (MISMATCH_ABORT, MISMATCH_CONTINUE, MISMATCH_SKIP_SHOT, MISMATCH_PROMPT)
+
+MISMATCH_REPORT_NAME = "metadata_mismatches.json"
+CUT_REPORT_NAME = "cut_mismatches.json"
+MAX_LOGGED_MISMATCHES = 20
+
+
+class MismatchError(RuntimeError):
+    pass
+
+
+def read_breakdown_csv(path):
+    import pandas as pd
+    return pd.read_csv(path, engine=CSV_ENGINE)
+
+
+def load_shot_table(shot_table):
+    # Accept the in-memory table from CsvProcessor or the path of a processed CSV
+    if isinstance(shot_table, (str, os.PathLike)):
+        return read_breakdown_csv(shot_table)
+    return shot_table
 
 
 def extract_shots(df):
+    import pandas as pd
     required_cols = ['final_shot_name', 'FRAME DURATION', 'FPS']
     missing = [col for col in required_cols if col not in df.columns]
     if missing:
         raise ValueError(f"Missing columns in CSV: {', '.join(missing)}")
 
-    df = df[['final_shot_name', 'FRAME DURATION', 'FPS']].copy()
-    df.columns = ['final_shot_name', 'frame_length', 'fps']
-
-    df['frame_length'] = pd.to_numeric(df['frame_length'], errors='coerce')
-    df['fps'] = pd.to_numeric(df['fps'], errors='coerce')
+    df = pd.DataFrame({
+        'final_shot_name': df['final_shot_name'],
+        'frame_length': pd.to_numeric(df['FRAME DURATION'], errors='coerce'),
+        'fps': pd.to_numeric(df['FPS'], errors='coerce')
+    }).dropna()
 
-    df.dropna(subset=['final_shot_name', 'frame_length', 'fps'], inplace=True)
-
-    shot_info = {
-        row['final_shot_name']: (row['frame_length'], row['fps'])
-        for _, row in df.iterrows()
-    }
+    shot_info = dict(zip(
+        df['final_shot_name'].tolist(),
+        zip(df['frame_length'].tolist(), df['fps'].tolist())
+    ))
 
     return shot_info
 
 
 def sort_dataframe(df):
+    import pandas as pd
     df['SHOT'] = df['SHOT'].astype(str)
 
-    # Split the shot into parts if needed
-    split_cols = df['SHOT'].str.split('_', expand=True)
-
-    # Add temporary columns for sorting
-    df['sort_prefix'] = split_cols[0]
-    df['sort_number'] = pd.to_numeric(split_cols[1], errors='coerce')
+    # Sort keys from the first two '_' parts, extracted directly instead of splitting every part
+    sort_keys = pd.DataFrame({
+        'sort_prefix': df['SHOT'].str.extract(r'^([^_]*)', expand=False).to_numpy(),
+        'sort_number': pd.to_numeric(
+            df['SHOT'].str.extract(r'^[^_]*_([^_]*)', expand=False), errors='coerce'
+        ).to_numpy()
+    })
 
     # Sort first by prefix alphabetically, then by number ascending
-    df = df.sort_values(by=['sort_prefix', 'sort_number'], ascending=[True, True])
+    order = sort_keys.sort_values(by=['sort_prefix', 'sort_number'], kind='stable').index.to_numpy()
 
-    # Drop the helper columns
-    df = df.drop(columns=['sort_prefix', 'sort_number'])
-
-    return df.copy()
+    return df.iloc[order]
 
 # fetch the latest CSV file from a folder
 def fetch_csv_from_folder(path):
@@ -63,19 +98,18 @@ def fetch_csv_from_folder(path):
         raise FileNotFoundError(f"[fetch_csv_from_folder] Path does not exist: {path}")
 
 
-def fetch_shot_name_from_tasks(all_tasks):
+def fetch_shot_name_from_tasks(all_tasks, shots):
+    # Join tasks to the already fetched shots in memory instead of one get_entity call per task
+    shots_by_id = {shot["id"]: shot for shot in shots}
     shot_task_map = {}
     for task in all_tasks:
-        entity_id = task.get("entity_id")
-        if not entity_id:
-            continue
-        entity = gazu.entity.get_entity(entity_id)
-        if entity:
-            shot_task_map[entity["name"]] = task
+        shot = shots_by_id.get(task.get("entity_id"))
+        if shot:
+            shot_task_map[shot["name"]] = task
     return shot_task_map
 
 
-def build_data_dicts(shots_from_sequence, processed_csv_path):
+def build_data_dicts(shots_from_sequence, shot_table):
     kitsu_data = {
         shot["name"]: {
             "frame_in": int(shot["data"].get("frame_in", 0)),
@@ -87,21 +121,57 @@ def build_data_dicts(shots_from_sequence, processed_csv_path):
         for shot in shots_from_sequence
     }
 
-    df = pd.read_csv(processed_csv_path)
+    df = load_shot_table(shot_table)
     local_data = {
-        row["Name"]: {
-            "frame_in": int(row["Frame In"]),
-            "frame_out": int(row["Frame Out"]),
-            "nb_frames": int(row["Nb Frames"]),
-            "fps": float(row["FPS"]),
-            "description": row["Description"]
+        name: {
+            "frame_in": frame_in,
+            "frame_out": frame_out,
+            "nb_frames": nb_frames,
+            "fps": fps,
+            "description": description
         }
-        for _, row in df.iterrows()
+        for name, frame_in, frame_out, nb_frames, fps, description in zip(
+            df["Name"].tolist(),
+            df["Frame In"].astype(int).tolist(),
+            df["Frame Out"].astype(int).tolist(),
+            df["Nb Frames"].astype(int).tolist(),
+            df["FPS"].astype(float).tolist(),
+            df["Description"].tolist()
+        )
     }
 
     return kitsu_data, local_data
 
 
+# Nullable integers keep frame numbers integral through the outer join in the metadata check
+INT_FIELDS = ("frame_in", "frame_out", "nb_frames")
+
+
+def kitsu_shot_table(shots_from_sequence):
+    import pandas as pd
+    return pd.DataFrame({
+        "name": [shot["name"] for shot in shots_from_sequence],
+        "frame_in": [int(shot["data"].get("frame_in", 0)) for shot in shots_from_sequence],
+        "frame_out": [int(shot["data"].get("frame_out", 0)) for shot in shots_from_sequence],
+        "nb_frames": [shot.get("nb_frames") or 0 for shot in shots_from_sequence],
+        "fps": [float(shot["data"].get("fps", 0.0)) for shot in shots_from_sequence],
+        "description": [shot.get("description") or "" for shot in shots_from_sequence]
+    }, columns=["name", *METADATA_FIELDS]).astype({field: "Int64" for field in INT_FIELDS})
+
+
+def local_shot_table(shot_table):
+    import pandas as pd
+    df = load_shot_table(shot_table)
+    return pd.DataFrame({
+        "name": df["Name"],
+        "frame_in": df["Frame In"],
+        "frame_out": df["Frame Out"],
+        "nb_frames": df["Nb Frames"],
+        "fps": df["FPS"].astype(float),
+        "description": df["Description"].fillna("").astype(str)
+    }).astype({field: "Int64" for field in INT_FIELDS})
+
+
 def safety_check_kitsu_vs_local_mp4(kitsu_data, mp4_files):
     shots_names_from_sequence = set(kitsu_data.keys())
     mp4_shot_names = {os.path.splitext(f)[0] for f in mp4_files}
@@ -119,51 +189,98 @@ def safety_check_kitsu_vs_local_mp4(kitsu_data, mp4_files):
     if extra_in_files:
         logging.warning(f"Extra MP4 files without matching shots: {sorted(extra_in_files)}")
 
-    if missing_in_files or extra_in_files:
-        ask_user_input()
+    return {"missing_mp4": sorted(missing_in_files), "extra_mp4": sorted(extra_in_files)}
+
 
+def safety_check_matching_metadata(kitsu_table, local_table, fps_tolerance=FPS_TOLERANCE):
+    import pandas as pd
+    # One outer join of both shot tables, then a column-wise diff: no per-shot Python loop
+    merged = local_table.merge(kitsu_table, on="name", how="outer", suffixes=("_csv", "_kitsu"), indicator=True)
+    both = merged[merged["_merge"] == "both"]
 
-def safety_check_matching_metadata(kitsu_data, local_data):
+    differs = pd.DataFrame({
+        field: _field_differs(field, both[f"{field}_csv"], both[f"{field}_kitsu"], fps_tolerance)
+        for field in METADATA_FIELDS
+    }, index=both.index)
+
+    # Only the (few) mismatching rows are turned into report entries
     mismatches = {}
+    for idx in differs.index[differs.any(axis=1)]:
+        row = both.loc[idx]
+        mismatches[row["name"]] = {
+            field: {"csv": _plain(row[f"{field}_csv"]), "kitsu": _plain(row[f"{field}_kitsu"])}
+            for field in METADATA_FIELDS if differs.at[idx, field]
+        }
 
-    for shot_name, csv_data in local_data.items():
-        kitsu_shot = kitsu_data.get(shot_name)
-        if not kitsu_shot:
-            mismatches[shot_name] = {"error": "Missing in Kitsu shots"}
-            continue
-
-        # Compare each metadata field between CSV and Kitsu
-        differences = {}
-        for field_name, csv_value in csv_data.items():
-            kitsu_value = kitsu_shot[field_name]
-
-            if isinstance(csv_value, float):
-                if abs(csv_value - kitsu_value) >= 1e-3:
-                    differences[field_name] = {"csv": csv_value, "kitsu": kitsu_value}
-
-            elif csv_value != kitsu_value:
-                differences[field_name] = {"csv": csv_value, "kitsu": kitsu_value}
-
-        if differences:
-            mismatches[shot_name] = differences
-
-    for name in kitsu_data:
-        if name not in local_data:
-            mismatches[name] = {"error": "Missing in CSV shots"}
-
-    if mismatches:
-        logging.warning("Metadata mismatches detected:")
-        for name, diff in mismatches.items():
-            print(f"\nShot: {name}")
-            for k, v in diff.items():
-                if isinstance(v, dict):
-                    print(f"  {k}: CSV={v['csv']} | Kitsu={v['kitsu']}")
-                else:
-                    print(f"  {k}: {v}")
-        ask_user_input()
+    report = {
+        "shots_checked": len(both),
+        "missing_in_kitsu": sorted(merged.loc[merged["_merge"] == "left_only", "name"].tolist()),
+        "missing_in_csv": sorted(merged.loc[merged["_merge"] == "right_only", "name"].tolist()),
+        "mismatches": mismatches
+    }
+
+    if report["missing_in_kitsu"] or report["missing_in_csv"] or mismatches:
+        logging.warning(f"Metadata mismatches detected: {len(mismatches)} shot(s) differ, "
+                        f"{len(report['missing_in_kitsu'])} missing in Kitsu, "
+                        f"{len(report['missing_in_csv'])} missing in CSV")
+        for name, diff in list(mismatches.items())[:MAX_LOGGED_MISMATCHES]:
+            summary = ", ".join(f"{k}: CSV={v['csv']} | Kitsu={v['kitsu']}" for k, v in diff.items())
+            logging.warning(f"  {name}: {summary}")
+        if len(mismatches) > MAX_LOGGED_MISMATCHES:
+            logging.warning(f"  ... and {len(mismatches) - MAX_LOGGED_MISMATCHES} more, see the mismatch report")
     else:
         logging.info("All metadata matches between CSV and Kitsu.")
 
+    return report
+
+
+def _field_differs(field, csv_values, kitsu_values, fps_tolerance):
+    if field == "fps":
+        return ~((csv_values - kitsu_values).abs() < fps_tolerance)
+    if field == "description":
+        return csv_values.fillna("").astype(str) != kitsu_values.fillna("").astype(str)
+    return csv_values != kitsu_values
+
+
+def _plain(value):
+    # numpy scalars to plain Python values for the JSON report
+    return value.item() if hasattr(value, "item") else value
+
+
+# Applies the --on-mismatch policy to a reconciliation report and returns the shots not to publish
+def resolve_mismatches(report, policy, report_dir=None, report_name=MISMATCH_REPORT_NAME,
+                       problem="CSV and Kitsu do not match"):
+    problems = report.get("missing_mp4") or report.get("extra_mp4") or report.get("missing_in_kitsu") \
+        or report.get("missing_in_csv") or report.get("mismatches") or report.get("cut_offsets")
+    if not problems:
+        return set()
+
+    if report_dir:
+        report_path = os.path.join(report_dir, report_name)
+        with open(report_path, "w") as f:
+            json.dump({"generated_at": datetime.now().isoformat(timespec="seconds"), "policy": policy, **report},
+                      f, indent=2)
+        logging.info(f"Mismatch report written to: {report_path}")
+
+    if policy == MISMATCH_PROMPT:
+        ask_user_input()
+    elif policy == MISMATCH_ABORT:
+        raise MismatchError(f"{problem} (--on-mismatch=abort). Ingest aborted.")
+    elif policy == MISMATCH_SKIP_SHOT:
+        excluded = set(report.get("mismatches", {})) | set(report.get("missing_in_kitsu", [])) \
+            | set(report.get("missing_in_csv", []))
+        # A shifted cut damages the shots on both sides of it
+        for entry in report.get("cut_offsets", {}).values():
+            excluded.update(entry["shots"])
+        logging.warning(f"Skipping {len(excluded)} mismatched shot(s) (--on-mismatch=skip-shot)")
+        return excluded
+    return set()
+
+
+def default_mismatch_policy():
+    # Nobody can answer a prompt on the farm
+    return MISMATCH_PROMPT if sys.stdin is not None and sys.stdin.isatty() else MISMATCH_ABORT
+
 
 def ask_user_input():
     response = input("continue? (y/N): ").strip().lower()
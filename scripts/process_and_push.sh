@@ -24,6 +24,10 @@ OUTPUT_DIR="$(pwd)/processed"
 mkdir -p "$OUTPUT_DIR"
 chmod -R 777 "$OUTPUT_DIR"
 
+# Persistent render cache shared across runs
+CACHE_DIR="${KITSU_INGEST_CACHE_DIR:-$HOME/.cache/kitsu_ingest}"
+mkdir -p "$CACHE_DIR"
+
 echo "Processing files with project: $PROJECT, sequence: $SEQUENCE"
 
 # Run the container with root user to avoid permission issues
@@ -31,6 +35,8 @@ docker run --rm \
   -v "$CSV_DIR":/app/data_csv \
   -v "$VIDEO_DIR":/app/data_video \
   -v "$OUTPUT_DIR":/app/kitsu_ingest/processed \
+  -v "$CACHE_DIR":/app/cache \
+  -e KITSU_INGEST_CACHE_DIR=/app/cache \
   --user root \
   kitsu-ingest kitsu-ingest --csv "/app/data_csv/$CSV_FILE" \
   --video "/app/data_video/$VIDEO_FILE" --push "$PROJECT" --sequence "$SEQUENCE"
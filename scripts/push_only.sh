@@ -20,12 +20,18 @@ OUTPUT_DIR="$(pwd)/processed"
 mkdir -p "$OUTPUT_DIR"
 chmod -R 777 "$OUTPUT_DIR"
 
+# Persistent cache (publish ledger) shared across runs
+CACHE_DIR="${KITSU_INGEST_CACHE_DIR:-$HOME/.cache/kitsu_ingest}"
+mkdir -p "$CACHE_DIR"
+
 echo "Pushing folder to Kitsu with project: $PROJECT, sequence: $SEQUENCE"
 
 # Run the container with root user to avoid permission issues
 docker run --rm \
   -v "$FOLDER":/app/data \
   -v "$OUTPUT_DIR":/app/kitsu_ingest/processed \
+  -v "$CACHE_DIR":/app/cache \
+  -e KITSU_INGEST_CACHE_DIR=/app/cache \
   --user root \
   kitsu-ingest kitsu-ingest --push_only /app/data --push "$PROJECT" --sequence "$SEQUENCE"
 
@@ -0,0 +1,43 @@
+#!/bin/bash
+# serve.sh - Watch a folder and ingest deliveries as they arrive
+
+# Check arguments
+if [ "$#" -lt 1 ]; then
+    echo "Usage: $0 WATCH_DIR [PROJECT] [SEQUENCE]"
+    exit 1
+fi
+
+# Get arguments
+WATCH_DIR=$(realpath "$1")
+PROJECT="$2"
+SEQUENCE="${3:-SQ01}"
+
+PUSH_ARGS=()
+if [ -n "$PROJECT" ]; then
+    PUSH_ARGS=(--push "$PROJECT")
+fi
+
+# Create output directory with proper permissions
+OUTPUT_DIR="$(pwd)/processed"
+mkdir -p "$OUTPUT_DIR"
+chmod -R 777 "$OUTPUT_DIR"
+
+# Persistent cache (renders, metadata, session, ledger, serve state) shared across runs
+CACHE_DIR="${KITSU_INGEST_CACHE_DIR:-$HOME/.cache/kitsu_ingest}"
+mkdir -p "$CACHE_DIR"
+
+echo "Watching $WATCH_DIR (project: ${PROJECT:-none}, sequence: $SEQUENCE)"
+
+# One long-lived container: login, imports and metadata caches are paid once.
+# docker stop sends SIGTERM, which lets the running job finish.
+docker run --rm \
+  --stop-timeout 600 \
+  -v "$WATCH_DIR":/app/watch \
+  -v "$OUTPUT_DIR":/app/kitsu_ingest/processed \
+  -v "$CACHE_DIR":/app/cache \
+  -e KITSU_INGEST_CACHE_DIR=/app/cache \
+  --user root \
+  kitsu-ingest kitsu-ingest serve --watch /app/watch "${PUSH_ARGS[@]}" --sequence "$SEQUENCE"
+
+# Fix permissions after container runs
+chmod -R 777 "$OUTPUT_DIR"
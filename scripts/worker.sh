@@ -0,0 +1,26 @@
+#!/bin/bash
+# worker.sh - Encode shots of distributed jobs written to a shared folder
+
+# Check arguments
+if [ "$#" -lt 1 ]; then
+    echo "Usage: $0 SHARED_DIR [JOBS]"
+    exit 1
+fi
+
+# Get arguments
+SHARED_DIR=$(realpath "$1")
+JOBS_ARGS=()
+if [ -n "$2" ]; then
+    JOBS_ARGS=(--jobs "$2")
+fi
+
+echo "Encoding shots of jobs in $SHARED_DIR"
+
+# Job specs hold absolute paths: mount the shared folder at the same path as on the
+# coordinator, and keep source videos inside it. docker stop sends SIGTERM, which
+# lets the shots being encoded finish.
+docker run --rm \
+  --stop-timeout 600 \
+  -v "$SHARED_DIR":"$SHARED_DIR" \
+  --user root \
+  kitsu-ingest kitsu-ingest worker --shared-dir "$SHARED_DIR" "${JOBS_ARGS[@]}"
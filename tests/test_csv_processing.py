@@ -0,0 +1,60 @@
+import pandas as pd
+from kitsu_ingest.processors.csv_processor import CsvProcessor, name_shots
+from kitsu_ingest.utils.validation import sort_dataframe
+
+SHOTS = [
+    'SHOT_0030_A006C012_241206VG', 'SHOT_0010_A001C003', 'SHOT_0010_A001C004', 'SHOT_0200',
+    'INSERT_0020_B002C001', 'SHOT_abc_X', 'SHOT', 'INSERT_0005', 'SHOT_0030', 1234, 'SHOT__0040', '_0010_X'
+]
+
+
+# The baseline implementations, kept as the reference output
+def baseline_sort_dataframe(df):
+    df['SHOT'] = df['SHOT'].astype(str)
+    split_cols = df['SHOT'].str.split('_', expand=True)
+    df['sort_prefix'] = split_cols[0]
+    df['sort_number'] = pd.to_numeric(split_cols[1], errors='coerce')
+    df = df.sort_values(by=['sort_prefix', 'sort_number'], ascending=[True, True])
+    df = df.drop(columns=['sort_prefix', 'sort_number'])
+    return df.copy()
+
+
+def baseline_name_shots(df):
+    df.loc[:, 'final_shot_name'] = df['SHOT'].apply(lambda shot: '_'.join(str(shot).split('_')[:2]))
+    return df
+
+
+def _breakdown():
+    return pd.DataFrame({
+        'SHOT': SHOTS,
+        'FRAME IN': range(1001, 1001 + len(SHOTS)),
+        'FRAME OUT': range(1100, 1100 + len(SHOTS)),
+        'FRAME DURATION': [100] * len(SHOTS),
+        'Clip Name': [f'clip {idx}' if idx % 3 else None for idx in range(len(SHOTS))],
+        'FPS': [24] * len(SHOTS)
+    })
+
+
+def test_sort_dataframe_matches_baseline():
+    pd.testing.assert_frame_equal(sort_dataframe(_breakdown()), baseline_sort_dataframe(_breakdown()))
+
+
+def test_name_shots_matches_baseline():
+    df = sort_dataframe(_breakdown())
+    expected = baseline_name_shots(baseline_sort_dataframe(_breakdown()))
+    pd.testing.assert_frame_equal(name_shots(df), expected)
+    assert name_shots(df).loc[0, 'final_shot_name'] == 'SHOT_0030'
+
+
+def test_process_writes_the_kitsu_table(tmp_path):
+    csv_path = tmp_path / 'breakdown.csv'
+    _breakdown().to_csv(csv_path, index=False)
+    processor = CsvProcessor(str(csv_path), 'SQ01', output_dir=str(tmp_path / 'out'))
+    output_path = processor.process()
+
+    table = pd.read_csv(output_path)
+    assert list(table.columns) == ['Sequence', 'Name', 'Frame In', 'Frame Out', 'Nb Frames', 'Description', 'FPS']
+    assert (table['Sequence'] == 'SQ01').all()
+    expected = baseline_name_shots(baseline_sort_dataframe(pd.read_csv(csv_path)))
+    assert table['Name'].tolist() == expected['final_shot_name'].tolist()
+    assert processor.shot_table['Name'].tolist() == expected['final_shot_name'].tolist()
@@ -0,0 +1,41 @@
+import numpy as np
+from kitsu_ingest.processors.cut_detect import compare_cuts, detect_cuts
+
+
+def test_detect_cuts_finds_hard_cuts():
+    scores = np.full(300, 1.0, dtype=np.float32)
+    scores[0] = 0
+    scores[[100, 220]] = 40.0
+    assert detect_cuts(scores).tolist() == [100, 220]
+
+
+def test_compare_cuts_all_aligned():
+    shots = [('A', 0, 100), ('B', 100, 220), ('C', 220, 300)]
+    assert compare_cuts(np.array([100, 220]), shots) == ({}, [])
+
+
+def test_compare_cuts_reports_slate_offset():
+    shots = [('A', 0, 100), ('B', 100, 220), ('C', 220, 300)]
+    shifted, undetected = compare_cuts(np.array([105, 225]), shots)
+    assert undetected == []
+    assert {name: entry['offset'] for name, entry in shifted.items()} == {'B': 5, 'C': 5}
+    assert shifted['C']['shots'] == ['B', 'C']
+
+
+def test_compare_cuts_does_not_reuse_a_cut():
+    # A → B is a dissolve: the B → C cut must not be reported as B's boundary, shifted
+    shots = [('A', 0, 100), ('B', 100, 120), ('C', 120, 200)]
+    assert compare_cuts(np.array([120]), shots) == ({}, ['B'])
+
+
+def test_compare_cuts_contested_cut_goes_to_nearest_boundary():
+    shots = [('A', 0, 100), ('B', 100, 130), ('C', 130, 200)]
+    shifted, undetected = compare_cuts(np.array([127]), shots)
+    assert list(shifted) == ['C'] and shifted['C']['offset'] == -3
+    assert undetected == ['B']
+
+
+def test_compare_cuts_far_cut_is_undetected():
+    shots = [('A', 0, 100), ('B', 100, 300)]
+    assert compare_cuts(np.array([250]), shots) == ({}, ['B'])
+    assert compare_cuts(np.array([], dtype=np.int64), shots) == ({}, ['B'])
@@ -0,0 +1,78 @@
+import pandas as pd
+import pytest
+from kitsu_ingest.kitsu import auth
+from kitsu_ingest.kitsu.publisher import KitsuPublisher, TASK_TYPE_NAME
+from kitsu_ingest.kitsu.standin import KitsuStandin, StandinServer
+from kitsu_ingest.options import SYNC_DIFF
+
+SEQUENCE = 'SQ01'
+
+SHOT_TABLE = pd.DataFrame({
+    'Sequence': [SEQUENCE] * 3,
+    'Name': ['SH010', 'SH020', 'SH030'],
+    'Frame In': [1001, 1001, 1001],
+    'Frame Out': [1100, 1060, 1024],
+    'Nb Frames': [100, 60, 24],
+    'Description': ['clip a', None, 'clip c'],
+    'FPS': [24.0, 24.0, 24.0]
+})
+
+
+@pytest.fixture
+def standin(tmp_path, monkeypatch):
+    monkeypatch.setenv('KITSU_INGEST_CACHE_DIR', str(tmp_path / 'cache'))
+    with StandinServer(KitsuStandin()) as server:
+        monkeypatch.setenv('KITSU_SERVER', server.url)
+        monkeypatch.setenv('KITSU_EMAIL', 'test@localhost')
+        monkeypatch.setenv('KITSU_PASSWORD', 'any')
+        # kitsu_login keeps one session per process; each test logs in to its own server
+        monkeypatch.setattr(auth, '_active_session', None)
+        yield server.standin
+
+
+def _sync(standin, project_name, shots):
+    standin.seed(project_name, SEQUENCE, shots)
+    publisher = KitsuPublisher(project_name, SEQUENCE, use_cache=False, sync_mode=SYNC_DIFF)
+    assert publisher.connect()
+    return publisher, publisher.push_shots('breakdown.csv', SHOT_TABLE)
+
+
+def _shots(standin):
+    return {shot['name']: shot for shot in standin.shots.values()}
+
+
+def test_diff_sync_creates_and_updates_only_what_changed(standin):
+    publisher, report = _sync(standin, 'Demo', [
+        ('SH010', 100, 1001, 1100, 24.0, 'clip a'),
+        ('SH020', 50, 1001, 1050, 24.0, ''),
+        ('SH040', 10, 1001, 1010, 24.0, 'not in the breakdown'),
+    ])
+
+    assert report['created'] == ['SH030']
+    assert report['updated'] == {
+        'SH020': {'frame_out': {'kitsu': 1050, 'csv': 1060}, 'nb_frames': {'kitsu': 50, 'csv': 60}}
+    }
+    assert report['unchanged'] == 1
+
+    shots = _shots(standin)
+    assert shots['SH020']['nb_frames'] == 60
+    assert int(shots['SH020']['data']['frame_out']) == 1060
+    assert (shots['SH030']['nb_frames'], shots['SH030']['description']) == (24, 'clip c')
+    # Shots missing from the breakdown are left alone
+    assert shots['SH040']['description'] == 'not in the breakdown'
+
+    # The new shot gets the publish task the CSV import would have created
+    task_type = next(t for t in standin.task_types.values() if t['name'] == TASK_TYPE_NAME)
+    assert [task for task in standin.tasks.values()
+            if task['entity_id'] == shots['SH030']['id'] and task['task_type_id'] == task_type['id']]
+
+
+def test_diff_sync_is_a_no_op_when_up_to_date(standin):
+    publisher, report = _sync(standin, 'Demo', [])
+    tasks = len(standin.tasks)
+    requests = standin.requests
+
+    assert publisher.push_shots('breakdown.csv', SHOT_TABLE) == {'created': [], 'updated': {}, 'unchanged': 3}
+    assert len(standin.tasks) == tasks
+    # Only the shot listing: nothing is written
+    assert standin.requests - requests == 1
@@ -0,0 +1,100 @@
+import os
+import threading
+import pytest
+from kitsu_ingest import distributed
+from kitsu_ingest.distributed import DistributedJob, EncodeWorker, LEASES_DIR, RECLAIMED_DIR, RESULT_OK
+
+SHOTS = [{'shot': f'SH{idx:03d}', 'seek_time': idx * 4.0, 'nb_frames': 96} for idx in range(10, 50, 10)]
+
+
+@pytest.fixture
+def job(tmp_path):
+    video = tmp_path / 'plate.mov'
+    video.write_bytes(b'plate')
+    shared = tmp_path / 'shared'
+    shared.mkdir()
+    return DistributedJob.create(str(shared), str(video), SHOTS)
+
+
+@pytest.fixture
+def encoded(monkeypatch):
+    # (shot output name, seek time) of every encode, instead of running ffmpeg
+    calls = []
+
+    def encode_shot(video_path, output_path, seek_time, nb_frames, threads, review_size=None):
+        calls.append((os.path.basename(output_path), seek_time))
+        with open(output_path, 'wb') as f:
+            f.write(b'encoded')
+        return None
+    monkeypatch.setattr('kitsu_ingest.processors.video_processor._encode_shot', encode_shot)
+    return calls
+
+
+def _worker(job, **kwargs):
+    return EncodeWorker(os.path.dirname(job.path), jobs=1, threads_per_job=1, poll_interval=0.01, **kwargs)
+
+
+def _age_lease(job, shot_name, seconds):
+    path = os.path.join(job.path, LEASES_DIR, shot_name)
+    then = os.stat(path).st_mtime - seconds
+    os.utime(path, (then, then))
+
+
+def test_workers_never_claim_the_same_shot(job):
+    first, second = _worker(job), _worker(job)
+    leases = [first._claim_next(), second._claim_next(), first._claim_next(), second._claim_next()]
+    assert [lease.shot['shot'] for lease in leases] == [shot['shot'] for shot in SHOTS]
+    assert first._claim_next() is None
+    assert sorted(os.listdir(os.path.join(job.path, LEASES_DIR))) == [shot['shot'] for shot in SHOTS]
+
+
+def test_stale_lease_is_reclaimed_once(job):
+    dead, alive = _worker(job, lease_timeout=60), _worker(job, lease_timeout=60)
+    lease = dead._claim_next()
+    assert alive._claim_in(job.path, {'shots': SHOTS[:1]}) is None
+
+    _age_lease(job, 'SH010', 61)
+    reclaimed = alive._claim_in(job.path, {'shots': SHOTS[:1]})
+    assert reclaimed.shot['shot'] == 'SH010'
+    assert len(os.listdir(os.path.join(job.path, RECLAIMED_DIR))) == 1
+    assert reclaimed.held() and not lease.held()
+
+    # The dead worker's heartbeat must not refresh the new owner's lease
+    lease.heartbeat()
+    assert lease.lost
+
+
+def test_reclaimed_shot_is_not_published_twice(job, encoded):
+    slow, other = _worker(job, lease_timeout=60), _worker(job, lease_timeout=60)
+    lease = slow._claim_next()
+    _age_lease(job, 'SH010', 61)
+    other._encode(other._claim_in(job.path, {'shots': SHOTS[:1]}))
+    slow._encode(lease)
+
+    assert (slow.encoded, other.encoded) == (0, 1)
+    outputs = os.path.join(job.path, distributed.OUTPUTS_DIR)
+    assert os.listdir(outputs) == ['SH010.mp4']
+
+
+def test_once_encodes_every_shot(job, encoded):
+    workers = [_worker(job, once=True) for _ in range(2)]
+    threads = [threading.Thread(target=worker.run) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(10)
+
+    assert sum(worker.encoded for worker in workers) == len(SHOTS)
+    assert sorted(seek_time for _, seek_time in encoded) == [shot['seek_time'] for shot in SHOTS]
+    results = dict(job.results([shot['shot'] for shot in SHOTS], poll_interval=0.01))
+    assert {result['status'] for result in results.values()} == {RESULT_OK}
+    assert os.listdir(os.path.join(job.path, LEASES_DIR)) == []
+
+    output = os.path.join(os.path.dirname(job.path), 'SH010.mp4')
+    job.collect('SH010', output)
+    assert os.path.exists(output)
+
+
+def test_complete_job_is_not_claimed(job):
+    job.close(remove=False)
+    assert _worker(job)._claim_next() is None
@@ -0,0 +1,118 @@
+import os
+from array import array
+import pytest
+from kitsu_ingest.processors import frame_index
+from kitsu_ingest.processors.frame_index import FrameIndex, SIDECAR_SUFFIX
+from kitsu_ingest.utils.hashing import hash_file
+
+STREAM = {'codec_name': 'h264', 'width': 1920, 'height': 1080, 'avg_frame_rate': '25/1'}
+
+
+@pytest.fixture(autouse=True)
+def cache(tmp_path, monkeypatch):
+    # for_video() looks for a fallback sidecar in the user cache
+    monkeypatch.setenv('KITSU_INGEST_CACHE_DIR', str(tmp_path / 'cache'))
+
+
+def _index(total_frames=10, start=10.0, gop=4, size=0, mtime_ns=0, content_hash=''):
+    pts = array('d', (start + frame / 25 for frame in range(total_frames)))
+    keyflags = bytearray(frame % gop == 0 for frame in range(total_frames))
+    return FrameIndex(pts, keyflags, dict(STREAM), size, mtime_ns, content_hash)
+
+
+def _video(tmp_path, data=b'not really a video'):
+    path = tmp_path / 'plate.mov'
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_seek_math():
+    index = _index()
+    assert index.fps == 25.0
+    assert index.keyframes.tolist() == [0, 4, 8]
+    # Accurate seeks aim between frames, keyframe seeks inside one, relative to the first pts
+    assert index.seek_before(0) == 0.0
+    assert index.seek_before(4) == pytest.approx(3.5 / 25)
+    assert index.seek_into(4) == pytest.approx(4.5 / 25)
+    assert index.seek_into(9) == pytest.approx(9 / 25)
+
+
+def test_save_load_round_trip(tmp_path):
+    index = _index(size=123, mtime_ns=456, content_hash='abc')
+    path = str(tmp_path / f'plate.mov{SIDECAR_SUFFIX}')
+    index.save(path)
+    loaded = FrameIndex.load(path)
+    assert loaded.pts == index.pts
+    assert loaded.keyflags == index.keyflags
+    assert loaded.keyframes == index.keyframes
+    assert loaded.stream == index.stream
+    assert (loaded.size, loaded.mtime_ns, loaded.fingerprint) == (123, 456, '123-abc')
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+
+def test_load_rejects_truncated_and_foreign_files(tmp_path):
+    path = str(tmp_path / 'plate.kidx')
+    _index().save(path)
+    with open(path, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data[:-3])
+    with pytest.raises(ValueError, match='Truncated'):
+        FrameIndex.load(path)
+
+    with open(path, 'wb') as f:
+        f.write(b'something else\n')
+    with pytest.raises(ValueError, match='Not a frame index'):
+        FrameIndex.load(path)
+
+
+def _build_forbidden(video_path):
+    raise AssertionError('the video was probed again')
+
+
+def test_for_video_reuses_the_sidecar(tmp_path, monkeypatch):
+    video = _video(tmp_path)
+    stat = os.stat(video)
+    _index(size=stat.st_size, mtime_ns=stat.st_mtime_ns, content_hash=hash_file(video)).save(video + SIDECAR_SUFFIX)
+    monkeypatch.setattr(FrameIndex, 'build', classmethod(lambda cls, path: _build_forbidden(path)))
+    assert FrameIndex.for_video(video).total_frames == 10
+
+
+def test_for_video_trusts_a_touched_file_with_the_same_content(tmp_path, monkeypatch):
+    video = _video(tmp_path)
+    stat = os.stat(video)
+    _index(size=stat.st_size, mtime_ns=stat.st_mtime_ns - 10 ** 9,
+           content_hash=hash_file(video)).save(video + SIDECAR_SUFFIX)
+    monkeypatch.setattr(FrameIndex, 'build', classmethod(lambda cls, path: _build_forbidden(path)))
+
+    assert FrameIndex.for_video(video).mtime_ns == stat.st_mtime_ns
+    # The refreshed mtime is written back, so the next run skips the hash
+    assert FrameIndex.load(video + SIDECAR_SUFFIX).mtime_ns == stat.st_mtime_ns
+
+
+def test_for_video_rebuilds_a_stale_sidecar(tmp_path, monkeypatch):
+    video = _video(tmp_path)
+    stat = os.stat(video)
+    _index(size=stat.st_size, mtime_ns=0, content_hash='stale').save(video + SIDECAR_SUFFIX)
+    fresh = _index(total_frames=5, size=stat.st_size, mtime_ns=stat.st_mtime_ns, content_hash=hash_file(video))
+    monkeypatch.setattr(FrameIndex, 'build', classmethod(lambda cls, path: fresh))
+
+    assert FrameIndex.for_video(video) is fresh
+    assert FrameIndex.load(video + SIDECAR_SUFFIX).total_frames == 5
+
+
+def test_for_video_falls_back_to_the_cache_on_read_only_folders(tmp_path, monkeypatch):
+    video = _video(tmp_path)
+    fresh = _index()
+    monkeypatch.setattr(FrameIndex, 'build', classmethod(lambda cls, path: fresh))
+    save = FrameIndex.save
+
+    def read_only_next_to_video(self, path):
+        if path == os.path.realpath(video) + SIDECAR_SUFFIX:
+            raise PermissionError(path)
+        save(self, path)
+    monkeypatch.setattr(FrameIndex, 'save', read_only_next_to_video)
+
+    FrameIndex.for_video(video)
+    assert not os.path.exists(video + SIDECAR_SUFFIX)
+    assert os.path.exists(frame_index._sidecar_paths(video)[1])
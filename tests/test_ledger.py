@@ -0,0 +1,102 @@
+import gazu
+import pytest
+from kitsu_ingest.kitsu.ledger import PublishLedger
+from kitsu_ingest.kitsu.publisher import KitsuPublisher
+
+TASK = {'id': 'task-1', 'entity_id': 'shot-1'}
+
+
+@pytest.fixture
+def kitsu_calls(monkeypatch):
+    calls = []
+
+    def call(name, result):
+        def record(*args, **kwargs):
+            calls.append(name)
+            return result
+        return record
+    monkeypatch.setattr(gazu.task, 'add_comment', call('comment', {'id': 'comment-1'}))
+    monkeypatch.setattr(gazu.task, 'create_preview', call('preview', {'id': 'preview-1'}))
+    monkeypatch.setattr(gazu.task, 'upload_preview_file', call('upload', {'id': 'preview-1'}))
+    monkeypatch.setattr(gazu.task, 'set_main_preview', call('main', {}))
+    return calls
+
+
+def _publish(ledger, video_path, force=False):
+    publisher = KitsuPublisher('Demo', 'SQ01', ledger=ledger, force=force)
+    publisher.shot_task_map = {'SH010': TASK}
+    publisher.task_status = {'id': 'status-done'}
+    stats = publisher.new_stats()
+    return publisher.publish_shot('SH010', video_path, stats), stats
+
+
+def test_record_survives_reopening(tmp_path):
+    path = str(tmp_path / 'ledger.sqlite3')
+    ledger = PublishLedger(path)
+    ledger.record('SH010', 'task-1', 'preview-1', 'hash-1', project='Demo', sequence='SQ01')
+    ledger.record('SH010', 'task-1', 'preview-2', 'hash-1')
+    ledger.close()
+
+    ledger = PublishLedger(path)
+    assert ledger.is_published('task-1', 'hash-1')
+    assert not ledger.is_published('task-1', 'hash-2')
+    assert not ledger.is_published('task-2', 'hash-1')
+    ledger.close()
+
+
+def test_default_path_is_in_the_cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setenv('KITSU_INGEST_CACHE_DIR', str(tmp_path))
+    ledger = PublishLedger()
+    assert ledger.path == str(tmp_path / 'publish_ledger.sqlite3')
+    ledger.close()
+
+
+def test_rerun_skips_published_shots(tmp_path, kitsu_calls):
+    video = tmp_path / 'SH010.mp4'
+    video.write_bytes(b'encoded')
+    path = str(tmp_path / 'ledger.sqlite3')
+
+    ledger = PublishLedger(path)
+    assert _publish(ledger, str(video))[0] == 'matched'
+    assert kitsu_calls == ['comment', 'preview', 'upload', 'main']
+    ledger.close()
+
+    # A re-run after a crash opens the ledger afresh
+    ledger = PublishLedger(path)
+    outcome, stats = _publish(ledger, str(video))
+    assert (outcome, stats['skipped']) == ('skipped', 1)
+    assert len(kitsu_calls) == 4
+
+    assert _publish(ledger, str(video), force=True)[0] == 'matched'
+    assert len(kitsu_calls) == 8
+
+    # A re-encoded shot is a new publish
+    video.write_bytes(b'encoded again')
+    assert _publish(ledger, str(video))[0] == 'matched'
+    assert len(kitsu_calls) == 12
+    ledger.close()
+
+
+def test_failed_publish_is_not_recorded(tmp_path, kitsu_calls, monkeypatch):
+    def rejected(*args, **kwargs):
+        raise gazu.exception.ParameterException('bad preview')
+    monkeypatch.setattr(gazu.task, 'upload_preview_file', rejected)
+    video = tmp_path / 'SH010.mp4'
+    video.write_bytes(b'encoded')
+    ledger = PublishLedger(str(tmp_path / 'ledger.sqlite3'))
+
+    outcome, stats = _publish(ledger, str(video))
+    assert (outcome, stats['failed']) == ('failed', 1)
+    assert ledger._conn.execute('SELECT COUNT(*) FROM publishes').fetchone() == (0,)
+    ledger.close()
+
+
+def test_unreadable_ledger_fails_only_the_shot(tmp_path):
+    video = tmp_path / 'SH010.mp4'
+    video.write_bytes(b'encoded')
+    ledger = PublishLedger(str(tmp_path / 'ledger.sqlite3'))
+    ledger.close()
+
+    outcome, stats = _publish(ledger, str(video))
+    assert (outcome, stats['failed']) == ('failed', 1)
+    assert 'SH010' in stats['errors']
@@ -0,0 +1,88 @@
+import threading
+import pytest
+from kitsu_ingest.kitsu.pipeline import PublishPipeline
+from kitsu_ingest.kitsu.publisher import KitsuPublisher
+
+
+def _publisher(publish, workers=2):
+    publisher = KitsuPublisher('Demo', 'SQ01', workers=workers)
+
+    def publish_shot(shot_name, video_path, stats):
+        outcome = publish(shot_name)
+        publisher._count(stats, outcome)
+        return outcome
+    publisher.publish_shot = publish_shot
+    return publisher
+
+
+def test_worker_failure_fails_only_that_shot():
+    def publish(shot_name):
+        if shot_name == 'SH020':
+            raise KeyError('preview')
+        return 'matched'
+    published = []
+    pipeline = PublishPipeline(_publisher(publish), on_published=lambda *item: published.append(item))
+
+    with pytest.raises(RuntimeError, match='failed unexpectedly for 1 shots, first SH020'):
+        with pipeline:
+            for idx in range(1, 7):
+                pipeline.submit(f'SH{idx * 10:03d}', f'/renders/SH{idx * 10:03d}.mp4')
+
+    assert (pipeline.stats['matched'], pipeline.stats['failed']) == (5, 1)
+    assert 'SH020' in pipeline.stats['errors']
+    assert ('SH020', '/renders/SH020.mp4', 'failed') in published
+    assert len(published) == 6
+
+
+def test_callback_failure_keeps_the_workers_draining():
+    def on_published(shot_name, video_path, outcome):
+        raise OSError('history file is read-only')
+    pipeline = PublishPipeline(_publisher(lambda shot_name: 'matched', workers=1), queue_size=1,
+                               on_published=on_published)
+    pipeline.start()
+    for idx in range(5):
+        pipeline.submit(f'SH{idx:03d}', f'/renders/SH{idx:03d}.mp4')
+    with pytest.raises(RuntimeError):
+        pipeline.close()
+    assert pipeline.stats['matched'] == 5
+    assert len(pipeline.errors) == 5
+
+
+def test_error_in_the_block_wins():
+    pipeline = PublishPipeline(_publisher(lambda shot_name: 1 / 0))
+    with pytest.raises(ValueError):
+        with pipeline:
+            pipeline.submit('SH010', '/renders/SH010.mp4')
+            raise ValueError('encode failed')
+    assert pipeline.stats['failed'] == 1
+
+
+def test_submit_blocks_when_uploads_fall_behind():
+    release = threading.Event()
+    started = threading.Semaphore(0)
+
+    def publish(shot_name):
+        started.release()
+        release.wait(5)
+        return 'matched'
+    pipeline = PublishPipeline(_publisher(publish, workers=2), queue_size=3)
+    pipeline.start()
+    submitted = []
+
+    def encoder():
+        for idx in range(10):
+            pipeline.submit(f'SH{idx:03d}', f'/renders/SH{idx:03d}.mp4')
+            submitted.append(idx)
+    thread = threading.Thread(target=encoder, daemon=True)
+    thread.start()
+
+    # Two shots uploading and three queued: the encoder waits on the sixth
+    for _ in range(2):
+        assert started.acquire(timeout=5)
+    thread.join(0.2)
+    assert thread.is_alive()
+    assert len(submitted) == 5
+
+    release.set()
+    thread.join(5)
+    assert pipeline.close()['matched'] == 10
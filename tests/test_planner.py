@@ -0,0 +1,63 @@
+import pytest
+from kitsu_ingest.options import MODE_PARALLEL, MODE_SMART_CUT
+from kitsu_ingest.planner import CapacityPlan, SMART_CUT_COST_RATIO, DEFAULT_CPU_SECONDS_PER_MEGAPIXEL_FRAME
+from kitsu_ingest.utils.history import ThroughputHistory, KIND_ENCODE
+
+SOURCE = {'codec': 'h264', 'width': 1920, 'height': 1080, 'size': 10 ** 9}
+SHOTS = {f'SH{idx:03d}': (100, 24.0) for idx in range(10, 110, 10)}
+
+
+def _history(tmp_path, mode, seconds, frames=100, threads=4, samples=5):
+    tmp_path.mkdir(exist_ok=True)
+    history = ThroughputHistory(str(tmp_path / 'history.jsonl'))
+    for _ in range(samples):
+        history.add(KIND_ENCODE, mode=mode, codec='h264', width=1920, height=1080, fps=24.0, frames=frames,
+                    seconds=seconds, threads=threads, bytes=frames * 50000)
+    history.flush()
+    return history
+
+
+def _estimate(history, mode):
+    plan = CapacityPlan(SHOTS, SOURCE, mode=mode, history=history)
+    plan.cpu_count = 16
+    return plan.estimate()
+
+
+def test_same_mode_history(tmp_path):
+    plan = _estimate(_history(tmp_path, MODE_PARALLEL, seconds=10.0), MODE_PARALLEL)
+    # 0.4 cpu seconds per frame, 1000 frames
+    assert plan['encode_cpu_seconds'] == pytest.approx(400.0)
+    assert plan['output_bytes'] == 1000 * 50000
+    assert plan['history_samples'] == {'parallel, h264 1080p, <=128 frames': 5}
+    assert (plan['suggested_jobs'], plan['suggested_threads_per_job']) == (4, 4)
+    assert plan['encode_seconds'] == pytest.approx(400.0 / (4 * 4 * 0.9), abs=0.1)
+
+
+def test_full_encode_history_scaled_down_for_smart_cut(tmp_path):
+    plan = _estimate(_history(tmp_path, MODE_PARALLEL, seconds=10.0), MODE_SMART_CUT)
+    assert plan['encode_cpu_seconds'] == pytest.approx(400.0 * SMART_CUT_COST_RATIO)
+    assert plan['history_samples'] == {'h264 1080p': 5}
+
+
+def test_smart_cut_history_scaled_up_for_full_encodes(tmp_path):
+    plan = _estimate(_history(tmp_path, MODE_SMART_CUT, seconds=2.5), MODE_PARALLEL)
+    assert plan['encode_cpu_seconds'] == pytest.approx(100.0 / SMART_CUT_COST_RATIO)
+
+
+def test_cross_mode_estimates_agree(tmp_path):
+    # The same machine measured in one mode plans the other consistently, both ways
+    parallel = _estimate(_history(tmp_path / 'a', MODE_PARALLEL, seconds=10.0), MODE_SMART_CUT)
+    smart_cut = _estimate(_history(tmp_path / 'b', MODE_SMART_CUT, seconds=2.5), MODE_PARALLEL)
+    assert parallel['history_samples'] == smart_cut['history_samples'] == {'h264 1080p': 5}
+    assert parallel['encode_cpu_seconds'] == pytest.approx(smart_cut['encode_cpu_seconds'] * SMART_CUT_COST_RATIO)
+
+
+def test_defaults_without_enough_history(tmp_path):
+    history = _history(tmp_path, MODE_PARALLEL, seconds=10.0, samples=2)
+    full = _estimate(history, MODE_PARALLEL)
+    assert full['encode_cpu_seconds'] == pytest.approx(DEFAULT_CPU_SECONDS_PER_MEGAPIXEL_FRAME * 1920 * 1080 / 1e6
+                                                       * 1000, abs=0.1)
+    assert full['history_samples'] == {'default': 0}
+    smart_cut = _estimate(history, MODE_SMART_CUT)
+    assert smart_cut['encode_cpu_seconds'] == pytest.approx(full['encode_cpu_seconds'] * SMART_CUT_COST_RATIO,
+                                                            abs=0.1)
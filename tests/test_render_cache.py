@@ -0,0 +1,97 @@
+import os
+import time
+from kitsu_ingest.processors.render_cache import RenderCache
+
+PARAMS = {'codec': 'libx264', 'crf': 18}
+
+
+def _write(path, data=b'shot'):
+    with open(path, 'wb') as f:
+        f.write(data)
+    return str(path)
+
+
+def _age(cache, key, days, suffixes=('mp4',)):
+    then = time.time() - days * 86400
+    for suffix in suffixes:
+        os.utime(cache._entry_path(key, suffix), (then, then))
+
+
+def test_key_depends_on_every_input(tmp_path):
+    cache = RenderCache(root=str(tmp_path))
+    key = cache.key('100-abc', 0, 24, 24, PARAMS)
+    assert key == cache.key('100-abc', 0.0, 24.0, 24.0, dict(reversed(list(PARAMS.items()))))
+    assert len({
+        key,
+        cache.key('100-abd', 0, 24, 24, PARAMS),
+        cache.key('100-abc', 1, 24, 24, PARAMS),
+        cache.key('100-abc', 0, 25, 24, PARAMS),
+        cache.key('100-abc', 0, 24, 25, PARAMS),
+        cache.key('100-abc', 0, 24, 24, {**PARAMS, 'crf': 20}),
+    }) == 6
+
+
+def test_fetch_after_store(tmp_path):
+    cache = RenderCache(root=str(tmp_path / 'cache'))
+    key = cache.key('100-abc', 0, 24, 24, PARAMS)
+    dest = str(tmp_path / 'SHOT_0010.mp4')
+    assert not cache.fetch(key, dest)
+
+    cache.store(key, _write(tmp_path / 'render.mp4', b'encoded'))
+    assert cache.fetch(key, dest)
+    with open(dest, 'rb') as f:
+        assert f.read() == b'encoded'
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert not [name for _, _, files in os.walk(cache.root) for name in files if name.endswith('.tmp')]
+
+
+def test_fetch_needs_every_artifact(tmp_path):
+    cache = RenderCache(root=str(tmp_path / 'cache'))
+    key = cache.key('100-abc', 0, 24, 24, PARAMS)
+    cache.store(key, _write(tmp_path / 'render.mp4'), {'jpg': _write(tmp_path / 'poster.jpg', b'poster')})
+
+    poster = str(tmp_path / 'out.jpg')
+    assert cache.fetch(key, str(tmp_path / 'out.mp4'), {'jpg': poster})
+    with open(poster, 'rb') as f:
+        assert f.read() == b'poster'
+    # An entry stored without the proxy cannot serve a run that wants one
+    assert not cache.fetch(key, str(tmp_path / 'out.mp4'), {'proxy.mp4': str(tmp_path / 'proxy.mp4')})
+
+
+def test_fetch_treats_a_concurrent_eviction_as_a_miss(tmp_path, monkeypatch):
+    cache = RenderCache(root=str(tmp_path / 'cache'))
+    key = cache.key('100-abc', 0, 24, 24, PARAMS)
+    cache.store(key, _write(tmp_path / 'render.mp4'))
+
+    def evicted(src, dst):
+        raise FileNotFoundError(src)
+    monkeypatch.setattr('kitsu_ingest.processors.render_cache.link_or_copy', evicted)
+    assert not cache.fetch(key, str(tmp_path / 'out.mp4'))
+    assert (cache.hits, cache.misses) == (0, 1)
+
+
+def test_evict_drops_expired_entries_with_their_artifacts(tmp_path):
+    cache = RenderCache(root=str(tmp_path / 'cache'), max_age_days=30)
+    old = cache.key('100-abc', 0, 24, 24, PARAMS)
+    new = cache.key('100-abc', 24, 48, 24, PARAMS)
+    cache.store(old, _write(tmp_path / 'old.mp4'), {'jpg': _write(tmp_path / 'old.jpg')})
+    cache.store(new, _write(tmp_path / 'new.mp4'))
+    _age(cache, old, 31)
+
+    cache.evict()
+    assert not os.path.exists(cache._entry_path(old))
+    assert not os.path.exists(cache._entry_path(old, 'jpg'))
+    assert os.path.exists(cache._entry_path(new))
+
+
+def test_evict_keeps_the_most_recently_used_within_budget(tmp_path):
+    cache = RenderCache(root=str(tmp_path / 'cache'), max_bytes=25)
+    keys = [cache.key('100-abc', start, start + 24, 24, PARAMS) for start in (0, 24, 48)]
+    for days, key in zip((3, 2, 1), keys):
+        cache.store(key, _write(tmp_path / f'{key}.mp4', b'x' * 10))
+        _age(cache, key, days)
+    # Fetching the oldest entry makes it the most recently used
+    assert cache.fetch(keys[0], str(tmp_path / 'out.mp4'))
+
+    cache.evict()
+    assert [os.path.exists(cache._entry_path(key)) for key in keys] == [True, False, True]
@@ -0,0 +1,86 @@
+import json
+import pandas as pd
+import pytest
+from kitsu_ingest.utils import validation
+from kitsu_ingest.utils.validation import (
+    safety_check_matching_metadata, resolve_mismatches, kitsu_shot_table, local_shot_table, MismatchError,
+    MISMATCH_ABORT, MISMATCH_CONTINUE, MISMATCH_SKIP_SHOT, MISMATCH_PROMPT, MISMATCH_REPORT_NAME
+)
+
+
+def _kitsu_shot(name, frame_in, frame_out, fps=24.0, description=''):
+    return {'name': name, 'nb_frames': frame_out - frame_in + 1, 'description': description,
+            'data': {'frame_in': str(frame_in), 'frame_out': str(frame_out), 'fps': str(fps)}}
+
+
+def _local_table(rows):
+    return pd.DataFrame(rows, columns=['Sequence', 'Name', 'Frame In', 'Frame Out', 'Nb Frames', 'Description', 'FPS'])
+
+
+KITSU = [
+    _kitsu_shot('SH010', 1001, 1100, description='clip a'),
+    _kitsu_shot('SH020', 1001, 1050),
+    _kitsu_shot('SH030', 1001, 1024, fps=23.976),
+    _kitsu_shot('SH040', 1001, 1010),
+]
+LOCAL = _local_table([
+    ('SQ01', 'SH010', 1001, 1100, 100, 'clip a', 24),
+    ('SQ01', 'SH020', 1001, 1060, 60, None, 24),
+    ('SQ01', 'SH030', 1001, 1024, 24, None, 23.9762),
+    ('SQ01', 'SH050', 1001, 1010, 10, 'new', 25),
+])
+
+
+def _report():
+    return safety_check_matching_metadata(kitsu_shot_table(KITSU), local_shot_table(LOCAL))
+
+
+def test_metadata_check_reports_differences():
+    report = _report()
+    assert report['shots_checked'] == 3
+    assert report['missing_in_kitsu'] == ['SH050']
+    assert report['missing_in_csv'] == ['SH040']
+    # fps within the tolerance and empty descriptions on both sides are not mismatches
+    assert report['mismatches'] == {
+        'SH020': {'frame_out': {'csv': 1060, 'kitsu': 1050}, 'nb_frames': {'csv': 60, 'kitsu': 50}}
+    }
+    json.dumps(report)
+
+
+def test_metadata_check_all_matching():
+    local = _local_table([('SQ01', 'SH010', 1001, 1100, 100, 'clip a', 24.0)])
+    report = safety_check_matching_metadata(kitsu_shot_table(KITSU[:1]), local_shot_table(local))
+    assert report == {'shots_checked': 1, 'missing_in_kitsu': [], 'missing_in_csv': [], 'mismatches': {}}
+    assert resolve_mismatches(report, MISMATCH_ABORT) == set()
+
+
+def test_metadata_check_description_change():
+    local = _local_table([('SQ01', 'SH010', 1001, 1100, 100, 'clip b', 24)])
+    report = safety_check_matching_metadata(kitsu_shot_table(KITSU[:1]), local_shot_table(local))
+    assert report['mismatches'] == {'SH010': {'description': {'csv': 'clip b', 'kitsu': 'clip a'}}}
+
+
+def test_resolve_abort_writes_the_report(tmp_path):
+    with pytest.raises(MismatchError):
+        resolve_mismatches(_report(), MISMATCH_ABORT, report_dir=str(tmp_path))
+    with open(tmp_path / MISMATCH_REPORT_NAME) as f:
+        written = json.load(f)
+    assert written['policy'] == MISMATCH_ABORT
+    assert written['missing_in_csv'] == ['SH040']
+
+
+def test_resolve_continue_and_skip_shot():
+    assert resolve_mismatches(_report(), MISMATCH_CONTINUE) == set()
+    assert resolve_mismatches(_report(), MISMATCH_SKIP_SHOT) == {'SH020', 'SH040', 'SH050'}
+
+
+def test_resolve_skip_shot_excludes_both_sides_of_a_shifted_cut():
+    report = {'cut_offsets': {'SH020': {'offset': 5, 'shots': ['SH010', 'SH020']}}}
+    assert resolve_mismatches(report, MISMATCH_SKIP_SHOT) == {'SH010', 'SH020'}
+
+
+def test_resolve_prompt_asks(monkeypatch):
+    asked = []
+    monkeypatch.setattr(validation, 'ask_user_input', lambda: asked.append(True))
+    assert resolve_mismatches({'missing_mp4': ['SH010']}, MISMATCH_PROMPT) == set()
+    assert asked == [True]